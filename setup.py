@@ -11,7 +11,8 @@ delhommeauSources = ["src/litebem/solver/green_functions/delhommeau_f90/constant
 
 delhommeauExtension = Extension(name="litebem.solver.green_functions.delhommeau_f90",
                                 sources=delhommeauSources,
-                                extra_f90_compile_args=['-fpp'])
+                                extra_f90_compile_args=['-fpp', '-fopenmp'],
+                                extra_link_args=['-fopenmp'])
 
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
@@ -35,5 +36,5 @@ setup(
     package_dir={"": "src"},
     packages=setuptools.find_packages(where="src"),
     ext_modules=[delhommeauExtension],
-    python_requires=">=3.0",
+    python_requires=">=3.8",
 )
\ No newline at end of file
@@ -23,6 +23,9 @@ class LinearPotentialFlowResult:
 
     def __getattr__(self, name):
         """Direct access to the attributes of the included problem."""
+        if 'problem' not in self.__dict__:
+            # E.g. while the object is being unpickled.
+            raise AttributeError(f"{self.__class__} does not have a attribute named {name}.")
         try:
             return getattr(self.problem, name)
         except AttributeError:
@@ -12,7 +12,7 @@ import numpy as np
 import xarray as xr
 
 #from capytaine.meshes.geometry import Abstract3DObject, Plane, inplace_transformation
-from litebem.preprocessing.mesh import Mesh, CollectionOfMeshes
+from litebem.preprocessing.mesh import Mesh, CollectionOfMeshes, load_mesh
 #from capytaine.meshes.symmetric import build_regular_array_of_meshes
 #from capytaine.meshes.collections import CollectionOfMeshes
 
@@ -84,14 +84,14 @@ class Body():
 
         LOG.info(f"New floating body: {self.name}.")
 
-    # @staticmethod
-    # def from_file(filename: str, file_format=None, name=None) -> 'Body':
-    #     """Create a Body from a mesh file using meshmagick."""
-    #     from capytaine.io.mesh_loaders import load_mesh
-    #     if name is None:
-    #         name = filename
-    #     mesh = load_mesh(filename, file_format, name=f"{name}_mesh")
-    #     return Body(mesh, name=name)
+    @staticmethod
+    def from_file(filename: str, file_format=None, name=None, **kwargs) -> 'Body':
+        """Create a Body from a mesh file, see :func:`~litebem.preprocessing.mesh.load_mesh`.
+        The other keyword arguments are passed to :func:`~litebem.preprocessing.mesh.load_mesh`."""
+        if name is None:
+            name = filename
+        mesh = load_mesh(filename, file_format, name=f"{name}_mesh", **kwargs)
+        return Body(mesh, name=name)
 
     # def __lt__(self, other: 'Body') -> bool:
     #     """Arbitrary order. The point is to sort together the problems involving the same body."""
@@ -1,7 +1,38 @@
+import io
+import os
+import re
+import hashlib
+import logging
 from os import path
 import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from itertools import accumulate,chain
 from typing import Iterable, Union
+from functools import cached_property
+
+from litebem.tools.io import atomic_save
+
+LOG = logging.getLogger(__name__)
+
+# quadrature rules accepted by Mesh.quadrature_points
+QUADRATURE_METHODS = ('center', 'gauss_legendre_2', 'gauss_legendre_3', 'gauss_legendre_4')
+
+def _fortran_array(array, dtype, nColumns=None):
+    '''read-only Fortran-contiguous copy of an array, with nColumns columns if given'''
+    array = np.array([] if array is None else array, dtype=dtype, order='F')
+    if nColumns is not None:
+        array = array.reshape((-1, nColumns), order='F')
+    array.flags.writeable = False
+    return array
+
+def _fortran_concatenate(arrays, dtype):
+    '''read-only Fortran-contiguous concatenation of arrays along their first axis'''
+    shape = (sum(len(array) for array in arrays),) + np.shape(arrays[0])[1:]
+    result = np.concatenate(arrays, out=np.empty(shape, dtype=dtype, order='F'), casting='same_kind')
+    result.flags.writeable = False
+    return result
 
 class Mesh():
     """Mesh class
@@ -17,13 +48,20 @@ class Mesh():
         description.
     name : str, optional
         The name of the mesh.
+
+    Notes
+    -----
+    The vertices, the panels and the panel properties are stored once as
+    read-only Fortran-contiguous arrays of float64 (int32 for the panels),
+    which is the layout of the arguments of the Fortran core: they are
+    passed to it without any conversion or copy.
     """
 
     def __init__(self, vertices=None, panels=None, name=None):
-        self.vertices = vertices
-        self.panels = panels
-        self.nPanels = len(panels)
-        self.nVertices = len(vertices)
+        self.vertices = _fortran_array(vertices, np.float64, 3)
+        self.panels = _fortran_array(panels, np.int32, 4)
+        self.nPanels = len(self.panels)
+        self.nVertices = len(self.vertices)
         self.name = name
         self.get_triangle_quad_ids()
         self.compute_panel_properties()
@@ -41,26 +79,31 @@ class Mesh():
           identifying which vertices are the same and modifying the vector
           expressions accordingly
         '''
-        trianglesIDs = []
-        quadranglesIDs = []
-        for iPanel, panel in enumerate(self.panels):
-            if len(np.unique(panel)) == 3:
-                trianglesIDs.append(iPanel+1)
-            elif len(np.unique(panel)) == 4:
-                quadranglesIDs.append(iPanel+1)
-            else:
-                raise ValueError(f'Panel {iPanel} has {len(np.unique(panel))} unique '
-                                 f'vertices. \n'
-                                 f'\tOnly triangular and quadrilateral panels '
-                                 f'are currently supported. \n')
-        self.trianglesIDs = trianglesIDs
-        self.quadranglesIDs = quadranglesIDs
+        nUniqueVertices = self._count_unique_vertices()
+        self._check_panel_shapes(nUniqueVertices)
+        self.trianglesIDs = (np.flatnonzero(nUniqueVertices == 3) + 1).tolist()
+        self.quadranglesIDs = (np.flatnonzero(nUniqueVertices == 4) + 1).tolist()
+
+    def _count_unique_vertices(self):
+        '''number of distinct vertices of each panel'''
+        sortedPanels = np.sort(np.asarray(self.panels).reshape(-1, 4), axis=1)
+        return 1 + np.count_nonzero(np.diff(sortedPanels, axis=1), axis=1)
+
+    @staticmethod
+    def _check_panel_shapes(nUniqueVertices):
+        invalid = np.flatnonzero((nUniqueVertices < 3) | (nUniqueVertices > 4))
+        if len(invalid) > 0:
+            iPanel = invalid[0]
+            raise ValueError(f'Panel {iPanel} has {nUniqueVertices[iPanel]} unique '
+                             f'vertices. \n'
+                             f'\tOnly triangular and quadrilateral panels '
+                             f'are currently supported. \n')
 
     def unit_normal_vector(self, vecA, vecB):
-        '''calculate unit normal from two vectors'''
+        '''calculate unit normal from two vectors (or two arrays of vectors along the last axis)'''
         normVec = np.cross(vecA, vecB)
-        normLen = np.linalg.norm(normVec)
-        unitNorm = normVec / normLen
+        normLen = np.linalg.norm(normVec, axis=-1)
+        unitNorm = normVec / normLen[..., None]
         return normVec, normLen, unitNorm
 
     def vector_area_triangle(self, normLen):
@@ -79,107 +122,65 @@ class Mesh():
         centerTriB = self.center_triangle(vertA, vertC, vertD)
         # triABD
         # triBCD
-        quadCenter = (areaTriA*centerTriA + areaTriB*centerTriB)/(quadArea)
+        quadCenter = (areaTriA[..., None]*centerTriA + areaTriB[..., None]*centerTriB)/(quadArea[..., None])
         return quadCenter
 
-    def tri_panel_properties(self, panel):
-        '''return triangle panel properties'''
-        # fix: subtract 1 to correct for nemoh mesh indexing convention
-        # TODO: move this fix higher up
-        vertA = self.vertices[panel[0]-1]
-        vertB = self.vertices[panel[1]-1]
-        vertC = self.vertices[panel[2]-1]
-        panelVertices = [vertA, vertB, vertC]
-
-        vecAB = vertB - vertA
-        vecAC = vertC - vertA
-        triNorm, triNormLen, triUnitNorm = self.unit_normal_vector(vecAB, vecAC)
-        triArea = self.vector_area_triangle(triNormLen)
-        triCenter = self.center_triangle(vertA, vertB, vertC)
+    def compute_panel_properties(self):
+        '''
+        calculate panel normal vectors, areas, centers and radii
 
-        radiiMag = []
-        for coord in panelVertices:
-            radiiVec = coord - triCenter
-            radiiMag.append(np.linalg.norm(radiiVec))
-        triRadius = max(radiiMag)
+        All the panels are processed at once as arrays of shape (nPanels, 3)
+        of their vertices; the formulas of triangles are then selected for the
+        panels with three distinct vertices.
 
-        return triUnitNorm, triArea, triCenter, triRadius
+        Notes
+        -----
+        - TODO: add warning/error for triangular panels that are not defined by
+          repeating vertices 1 and 4
+        '''
+        nUniqueVertices = self._count_unique_vertices()
+        self._check_panel_shapes(nUniqueVertices)
+        isTriangle = nUniqueVertices == 3
 
-    def quad_panel_properties(self, panel):
-        '''return quad panel properties'''
         # fix: subtract 1 to correct for nemoh mesh indexing convention
         # TODO: move this fix higher up
-        vertA = self.vertices[panel[0]-1]
-        vertB = self.vertices[panel[1]-1]
-        vertC = self.vertices[panel[2]-1]
-        vertD = self.vertices[panel[3]-1]
-
-        panelVertices = [vertA, vertB, vertC, vertD]
+        panels = np.asarray(self.panels).reshape(-1, 4) - 1
+        vertices = np.asarray(self.vertices, dtype=float).reshape(-1, 3)
+        vertA, vertB, vertC, vertD = (vertices[panels[:, i]] for i in range(4))
 
-        vecAC = vertC - vertA
-        vecBD = vertD - vertB
         vecAB = vertB - vertA
+        vecAC = vertC - vertA
         vecAD = vertD - vertA
+        vecBD = vertD - vertB
 
-        quadNorm, quadNormLen, quadUnitNorm = self.unit_normal_vector(vecAC, vecBD)
-        triANorm, triANormLen, triAUnitNorm = self.unit_normal_vector(vecAB, vecAC)
-        triBNorm, triBNormLen, triBUnitNorm = self.unit_normal_vector(vecAD, vecAC)
-        areaTriA = self.vector_area_triangle(triANormLen)
-        areaTriB = self.vector_area_triangle(triBNormLen)
-        quadArea = areaTriA + areaTriB
-
-        # center calculation
-        quadCenter = self.center_quad(vertA, vertB, vertC, vertD, areaTriA,
-                                      areaTriB, quadArea)
-
-        # radius calculation
-        radiiMag = []
-        for coord in panelVertices:
-            radiiVec = coord-quadCenter
-            radiiMag.append(np.linalg.norm(radiiVec))
-        quadRadius = max(radiiMag)
-
-        return quadCenter, quadUnitNorm, quadArea, quadRadius
-
-    def compute_panel_properties(self):
-        '''
-        calculate panel normal vectors, areas, centers and radii
+        # triangles: first three vertices
+        triNorm, triNormLen, triUnitNorm = self.unit_normal_vector(vecAB, vecAC)
+        triArea = self.vector_area_triangle(triNormLen)
+        triCenter = self.center_triangle(vertA, vertB, vertC)
 
-        Notes
-        -----
-        - TODO: add warning/error for triangular panels that are not defined by
-          repeating vertices 1 and 4
-        '''
-        panelUnitNormals = []
-        panelAreas = []
-        panelCenters = []
-        panelRadii = []
-        for iPanel, panel in enumerate(self.panels):
-            if iPanel+1 in self.trianglesIDs:
-                triUnitNorm, triArea, triCenter, triRadius = self.tri_panel_properties(panel)
-                panelUnitNormals.append(triUnitNorm)
-                panelAreas.append(triArea)
-                panelCenters.append(triCenter)
-                panelRadii.append(triRadius)
-            elif iPanel+1 in self.quadranglesIDs:
-                quadCenter, quadUnitNorm, quadArea, quadRadius = self.quad_panel_properties(panel)
-                panelCenters.append(quadCenter)
-                panelUnitNormals.append(quadUnitNorm)
-                panelAreas.append(quadArea)
-                panelRadii.append(quadRadius)
-            else:
-                print(f'iPanel : {iPanel}')
-                print(f'panel : {panel}')
-                print(f'self.trianglesIDs : {self.trianglesIDs}')
-                raise ValueError(f'Panel {iPanel} has {len(np.unique(panel))} unique '
-                                 f'vertices. \n'
-                                 f'\tOnly triangular and quadrilateral panels '
-                                 f'are currently supported. \n')
-
-        self.panelAreas = np.asarray(panelAreas)
-        self.panelCenters = np.asarray(panelCenters)
-        self.panelRadii = np.asarray(panelRadii)
-        self.panelUnitNormals = np.asarray(panelUnitNormals)
+        # quadrangles: split along the diagonal AC
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quadNorm, quadNormLen, quadUnitNorm = self.unit_normal_vector(vecAC, vecBD)
+            triBNorm, triBNormLen, triBUnitNorm = self.unit_normal_vector(vecAD, vecAC)
+            areaTriB = self.vector_area_triangle(triBNormLen)
+            quadArea = triArea + areaTriB
+            quadCenter = self.center_quad(vertA, vertB, vertC, vertD, triArea, areaTriB, quadArea)
+
+        panelAreas = np.where(isTriangle, triArea, quadArea)
+        panelCenters = np.where(isTriangle[:, None], triCenter, quadCenter)
+        panelUnitNormals = np.where(isTriangle[:, None], triUnitNorm, quadUnitNorm)
+
+        # radius: distance from the center to the farthest vertex (the fourth one is ignored for triangles)
+        panelVertices = np.stack([vertA, vertB, vertC, np.where(isTriangle[:, None], vertA, vertD)], axis=1)
+        radiiVec = panelVertices - panelCenters[:, None, :]
+        panelRadii = np.linalg.norm(radiiVec, axis=2).max(axis=1)
+
+        self.panelAreas = _fortran_array(panelAreas, np.float64)
+        self.panelCenters = _fortran_array(panelCenters, np.float64, 3)
+        self.panelUnitNormals = _fortran_array(panelUnitNormals, np.float64, 3)
+        self.panelRadii = _fortran_array(panelRadii, np.float64)
+        self._quadraturePoints = (_fortran_array(panelCenters[:, None, :], np.float64),  # Points
+                                  _fortran_array(panelAreas[:, None], np.float64))       # Weights
 
     def waterplane_area(self):
         '''calculates the waterplane area for the given mesh'''
@@ -371,8 +372,119 @@ class Mesh():
 
     @property
     def quadraturePoints(self):
-        return (self.panelCenters.reshape((self.nPanels, 1, 3)),  # Points
-                self.panelAreas.reshape((self.nPanels, 1)))       # Weights
+        return self._quadraturePoints
+
+    def quadrature_points(self, method='center'):
+        """
+        return the points and weights of a quadrature rule on each panel
+
+        Parameters
+        ----------
+        method : str, optional
+            'center' (default) for a single point at the center of the panel,
+            weighted by its area (same as :attr:`quadraturePoints`), or
+            'gauss_legendre_n' with n in 2, 3 or 4 for the product of two
+            Gauss-Legendre rules of n points on the bilinear mapping of the
+            panel. Triangles are mapped as quadrangles with two merged vertices.
+
+        Returns
+        -------
+        tuple of arrays of shape (nPanels, nQuadPoints, 3) and (nPanels, nQuadPoints)
+            the points and the weights, computed once per method and stored
+            in the same layout as :attr:`quadraturePoints`
+        """
+        if method == 'center':
+            return self.quadraturePoints
+        if method not in QUADRATURE_METHODS:
+            raise ValueError(f'Unknown quadrature method {method!r}. '
+                             f'Accepted values: {QUADRATURE_METHODS}.')
+        quadratureRules = self.__dict__.setdefault('_quadratureRules', {})
+        if method not in quadratureRules:
+            points, weights = self._gauss_legendre_points(method)
+            quadratureRules[method] = (_fortran_array(points, np.float64), _fortran_array(weights, np.float64))
+        return quadratureRules[method]
+
+    def _gauss_legendre_points(self, method):
+        '''points and weights of a gauss_legendre_n rule, see :meth:`quadrature_points`'''
+
+        # tensor product of Gauss-Legendre rules, mapped from [-1, 1] to [0, 1]
+        x, w = np.polynomial.legendre.leggauss(int(method.rsplit('_', 1)[1]))
+        u, v = np.meshgrid((x + 1)/2, (x + 1)/2, indexing='ij')
+        u, v = u.ravel()[:, None], v.ravel()[:, None]
+        w = np.outer(w, w).ravel()/4
+
+        # bilinear mapping (1-u)(1-v) a + u(1-v) b + uv c + (1-u)v d of each panel a b c d
+        a, b, c, d = (np.asarray(self.vertices, dtype=float)[np.asarray(self.panels)[:, i] - 1][:, None, :]
+                      for i in range(4))
+        points = (1-u)*(1-v)*a + u*(1-v)*b + u*v*c + (1-u)*v*d
+        dPointsdu = (1-v)*(b - a) + v*(c - d)
+        dPointsdv = (1-u)*(d - a) + u*(c - b)
+        weights = w*np.linalg.norm(np.cross(dPointsdu, dPointsdv), axis=2)
+        return points, weights
+
+    def extract_faces(self, panelIDs, name=None):
+        """
+        return a new mesh made of a subset of the panels of this mesh
+
+        Parameters
+        ----------
+        panelIDs : array_like of int
+            indices (starting at 0) of the panels to be extracted
+        name : str, optional
+            name of the new mesh
+
+        Returns
+        -------
+        Mesh
+            only the vertices used by the extracted panels are kept, and the
+            panels are renumbered accordingly (still starting at 1)
+        """
+        panels = np.asarray(self.panels)[np.asarray(panelIDs, dtype=int)]
+        usedVertices, newPanels = np.unique(panels, return_inverse=True)
+        vertices = np.asarray(self.vertices)[usedVertices-1]
+        return Mesh(vertices, newPanels.reshape(panels.shape)+1, name=name)
+
+    def mirrored(self, plane, name=None):
+        """
+        return the mirror image of the mesh with respect to a vertical plane of symmetry
+
+        Parameters
+        ----------
+        plane : str
+            'xOz' (reflection y -> -y) or 'yOz' (reflection x -> -x)
+        name : str, optional
+            name of the new mesh
+
+        Returns
+        -------
+        Mesh
+            the i-th panel of the new mesh is the reflection of the i-th panel
+            of this mesh; the order of its vertices is reversed to keep the
+            normal vectors pointing outwards
+        """
+        vertices = np.array(self.vertices, dtype=float)
+        vertices[:, _REFLECTION_AXES[plane]] *= -1
+        panels = np.asarray(self.panels)
+        # quadrangles: a b c d -> a d c b, triangles: a b c a -> a c b a
+        isTriangle = (panels[:, 0] == panels[:, 3])[:, None]
+        return Mesh(vertices, np.where(isTriangle, panels[:, ::-1], panels[:, [0, 3, 2, 1]]), name=name)
+
+    def rotated_around_z(self, angle, name=None):
+        """
+        return a copy of the mesh rotated around the vertical axis Oz
+
+        Parameters
+        ----------
+        angle : float
+            angle of the rotation (in radians)
+        name : str, optional
+            name of the new mesh
+        """
+        vertices = np.array(self.vertices, dtype=float)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)],
+                             [np.sin(angle), np.cos(angle)]])
+        vertices[:, :2] = vertices[:, :2] @ rotation.T
+        return Mesh(vertices, np.asarray(self.panels), name=name)
 
 class CollectionOfMeshes():
     """A tuple of meshes.
@@ -413,44 +525,311 @@ class CollectionOfMeshes():
     def nPanels(self):
         return sum(mesh.nPanels for mesh in self)
 
-    @property
+    # The arrays of the whole collection are concatenated at their first access
+    # and then kept, in the same layout as the arrays of a Mesh. The meshes of
+    # the collection are immutable, such that they never need to be updated.
+
+    @cached_property
     def vertices(self):
-        return np.concatenate([mesh.vertices for mesh in self])
+        return _fortran_concatenate([mesh.vertices for mesh in self], np.float64)
 
-    @property
+    @cached_property
     def panels(self):
         """Return the indices of the vertices forming each of the faces. For the
         later submeshes, the indices of the vertices has to be shifted to
         correspond to their index in the concatenated array self.vertices.
         """
         nPanels = accumulate(chain([0], (mesh.nVertices for mesh in self[:-1])))
-        return np.concatenate([np.asarray(mesh.panels) + nbv for mesh, nbv in zip(self, nPanels)])
+        return _fortran_concatenate([np.asarray(mesh.panels) + nbv for mesh, nbv in zip(self, nPanels)], np.int32)
 
-    @property
+    @cached_property
     def panelUnitNormals(self):
-        return np.concatenate([mesh.panelUnitNormals for mesh in self])
+        return _fortran_concatenate([mesh.panelUnitNormals for mesh in self], np.float64)
 
-    @property
+    @cached_property
     def panelAreas(self):
-        return np.concatenate([mesh.panelAreas for mesh in self])
+        return _fortran_concatenate([mesh.panelAreas for mesh in self], np.float64)
 
-    @property
+    @cached_property
     def panelCenters(self):
-        return np.concatenate([mesh.panelCenters for mesh in self])
+        return _fortran_concatenate([mesh.panelCenters for mesh in self], np.float64)
 
-    @property
+    @cached_property
     def panelRadii(self):
-        return np.concatenate([mesh.panelRadii for mesh in self])
+        return _fortran_concatenate([mesh.panelRadii for mesh in self], np.float64)
 
-    @property
+    def extract_faces(self, panelIDs, name=None):
+        """return a new Mesh made of a subset of the panels of the collection, see :meth:`Mesh.extract_faces`"""
+        return Mesh.extract_faces(self, panelIDs, name=name)
+
+    def mirrored(self, plane, name=None):
+        """return the mirror image of the collection, see :meth:`Mesh.mirrored`"""
+        return CollectionOfMeshes([mesh.mirrored(plane) for mesh in self], name=name)
+
+    @cached_property
     def quadraturePoints(self):
         quadSubmeshes = [mesh.quadraturePoints for mesh in self]
         return (
-            np.concatenate([quad[0] for quad in quadSubmeshes]),  # Points
-            np.concatenate([quad[1] for quad in quadSubmeshes])   # Weights
+            _fortran_concatenate([quad[0] for quad in quadSubmeshes], np.float64),  # Points
+            _fortran_concatenate([quad[1] for quad in quadSubmeshes], np.float64)   # Weights
                 )
 
-def read_nemoh_mesh(pathToMesh):#
+    def quadrature_points(self, method='center'):
+        """return the points and weights of a quadrature rule on each panel, see :meth:`Mesh.quadrature_points`"""
+        if method == 'center':
+            return self.quadraturePoints
+        quadratureRules = self.__dict__.setdefault('_quadratureRules', {})
+        if method not in quadratureRules:
+            quadSubmeshes = [mesh.quadrature_points(method) for mesh in self]
+            quadratureRules[method] = (
+                _fortran_concatenate([quad[0] for quad in quadSubmeshes], np.float64),  # Points
+                _fortran_concatenate([quad[1] for quad in quadSubmeshes], np.float64)   # Weights
+                    )
+        return quadratureRules[method]
+
+# index of the coordinate changed by the reflection with respect to each plane
+_REFLECTION_AXES = {'xOz': 1, 'yOz': 0}
+
+class ReflectionSymmetricMesh(CollectionOfMeshes):
+    """A mesh with a vertical plane of symmetry, stored as one half and its
+    mirror image.
+
+    The influence matrices of such a mesh are block symmetric Toeplitz
+    matrices, of which only half of the blocks need to be computed.
+    The half can itself be a ReflectionSymmetricMesh, for meshes with two
+    planes of symmetry.
+
+    Parameters
+    ----------
+    half : Mesh or CollectionOfMeshes
+        half of the mesh, on one side of the plane of symmetry
+    plane : str
+        the plane of symmetry, 'xOz' (y = 0) or 'yOz' (x = 0)
+    name : str, optional
+        a name for the mesh
+    """
+
+    def __init__(self, half, plane, name=None):
+        if plane not in _REFLECTION_AXES:
+            raise ValueError(f'Unknown plane of symmetry {plane}; '
+                             f'only {list(_REFLECTION_AXES)} are supported.')
+
+        self.plane = plane
+        if isinstance(half, ReflectionSymmetricMesh):
+            # keep the nested structure in the mirror image
+            mirror = ReflectionSymmetricMesh(half.half.mirrored(plane), half.plane)
+        else:
+            mirror = half.mirrored(plane)
+        super().__init__([half, mirror], name=name)
+
+    @property
+    def half(self):
+        return self[0]
+
+    def mirrored(self, plane, name=None):
+        return ReflectionSymmetricMesh(self.half.mirrored(plane), self.plane, name=name)
+
+    @classmethod
+    def from_mesh(cls, mesh, plane, tolerance=1e-5):
+        """
+        build a ReflectionSymmetricMesh equivalent to a mesh that is symmetric
+        with respect to the plane
+
+        Parameters
+        ----------
+        mesh : Mesh or CollectionOfMeshes
+        plane : str
+            'xOz' or 'yOz'
+        tolerance : float, optional
+            tolerance on the positions of the mirrored panels, relative to the
+            size of the mesh
+
+        Returns
+        -------
+        ReflectionSymmetricMesh
+            made of the panels of the mesh on the positive side of the plane
+            and their mirror image (the order of the panels is thus changed)
+
+        Raises
+        ------
+        ValueError
+            if the mesh is not symmetric with respect to the plane
+        """
+        axis = _REFLECTION_AXES[plane]
+        centers = np.asarray(mesh.panelCenters)
+        atol = tolerance*max(np.abs(np.asarray(mesh.vertices)).max(), 1.0)
+
+        positive = np.nonzero(centers[:, axis] > atol)[0]
+        negative = np.nonzero(centers[:, axis] < -atol)[0]
+        if len(positive) != len(negative) or len(positive) + len(negative) != mesh.nPanels:
+            raise ValueError(f'Mesh {mesh.name} is not symmetric with respect to {plane}.')
+
+        half = mesh.extract_faces(positive, name=f'{mesh.name}_half')
+        mirror = half.mirrored(plane)
+
+        # each panel of the mirror should match a distinct panel on the negative side
+        distances, matches = cKDTree(centers[negative]).query(mirror.panelCenters)
+        matches = negative[matches]
+        if (np.any(distances > atol)
+                or len(np.unique(matches)) != len(matches)
+                or not np.allclose(mirror.panelAreas, np.asarray(mesh.panelAreas)[matches], atol=tolerance*np.max(mesh.panelAreas))
+                or not np.allclose(mirror.panelUnitNormals, np.asarray(mesh.panelUnitNormals)[matches], atol=tolerance)):
+            raise ValueError(f'Mesh {mesh.name} is not symmetric with respect to {plane}.')
+
+        return cls(half, plane, name=mesh.name)
+
+class AxialSymmetricMesh(CollectionOfMeshes):
+    """A mesh invariant by the rotations of angle 2π/nSectors around the
+    vertical axis Oz, stored as one angular sector and its rotated copies.
+
+    The influence matrices of such a mesh are block circulant matrices, of
+    which only the first row of blocks needs to be computed.
+
+    Parameters
+    ----------
+    sector : Mesh
+        one angular sector of the mesh
+    nSectors : int
+        number of copies of the sector forming the full mesh
+    name : str, optional
+        a name for the mesh
+    """
+
+    def __init__(self, sector, nSectors, name=None):
+        self.nSectors = nSectors
+        copies = [sector.rotated_around_z(2*np.pi*k/nSectors) for k in range(1, nSectors)]
+        super().__init__([sector, *copies], name=name)
+
+    @property
+    def sector(self):
+        return self[0]
+
+    @classmethod
+    def from_mesh(cls, mesh, nSectors, tolerance=1e-5):
+        """
+        build an AxialSymmetricMesh equivalent to a mesh that is invariant by
+        the rotations of angle 2π/nSectors around Oz
+
+        Parameters
+        ----------
+        mesh : Mesh or CollectionOfMeshes
+        nSectors : int
+        tolerance : float, optional
+            tolerance on the positions of the rotated panels, relative to the
+            size of the mesh
+
+        Returns
+        -------
+        AxialSymmetricMesh
+            made of the panels of one sector of the mesh and their rotated
+            copies (the order of the panels is thus changed)
+
+        Raises
+        ------
+        ValueError
+            if the mesh is not invariant by the rotation
+        """
+        centers = np.asarray(mesh.panelCenters)
+        atol = tolerance*max(np.abs(np.asarray(mesh.vertices)).max(), 1.0)
+        sectorAngle = 2*np.pi/nSectors
+
+        if mesh.nPanels % nSectors != 0 or np.any(np.hypot(centers[:, 0], centers[:, 1]) < atol):
+            raise ValueError(f'Mesh {mesh.name} is not invariant by rotation of 2π/{nSectors}.')
+
+        # quick check on the panel centers only, before building the new mesh
+        tree = cKDTree(centers)
+        rotatedCenters = centers.copy()
+        rotatedCenters[:, :2] = centers[:, :2] @ np.array([[np.cos(sectorAngle), np.sin(sectorAngle)],
+                                                           [-np.sin(sectorAngle), np.cos(sectorAngle)]])
+        if np.any(tree.query(rotatedCenters)[0] > atol):
+            raise ValueError(f'Mesh {mesh.name} is not invariant by rotation of 2π/{nSectors}.')
+
+        # the sector starts in the middle of the largest angular gap between panel centers
+        angles = np.sort(np.arctan2(centers[:, 1], centers[:, 0]) % sectorAngle)
+        gaps = np.diff(np.concatenate([angles, [angles[0] + sectorAngle]]))
+        start = angles[np.argmax(gaps)] + gaps.max()/2
+        sectorIDs = np.nonzero((np.arctan2(centers[:, 1], centers[:, 0]) - start) % (2*np.pi) < sectorAngle)[0]
+
+        sector = mesh.extract_faces(sectorIDs, name=f'{mesh.name}_sector')
+        symmetricMesh = cls(sector, nSectors, name=mesh.name)
+
+        # each panel of the rebuilt mesh should match a distinct panel of the mesh
+        distances, matches = tree.query(symmetricMesh.panelCenters)
+        if (len(sectorIDs)*nSectors != mesh.nPanels
+                or np.any(distances > atol)
+                or len(np.unique(matches)) != len(matches)
+                or not np.allclose(symmetricMesh.panelAreas, np.asarray(mesh.panelAreas)[matches], atol=tolerance*np.max(mesh.panelAreas))
+                or not np.allclose(symmetricMesh.panelUnitNormals, np.asarray(mesh.panelUnitNormals)[matches], atol=tolerance)):
+            raise ValueError(f'Mesh {mesh.name} is not invariant by rotation of 2π/{nSectors}.')
+
+        return symmetricMesh
+
+def detect_axial_symmetry(mesh, tolerance=1e-5):
+    """
+    return an equivalent AxialSymmetricMesh with as many sectors as possible if
+    the mesh is invariant by some rotations around Oz, or the mesh itself
+    otherwise
+
+    Parameters
+    ----------
+    mesh : Mesh or CollectionOfMeshes
+    tolerance : float, optional
+        tolerance on the positions of the rotated panels, relative to the size
+        of the mesh
+
+    Returns
+    -------
+    Mesh or AxialSymmetricMesh
+    """
+    for nSectors in range(mesh.nPanels//2, 1, -1):
+        if mesh.nPanels % nSectors == 0:
+            try:
+                return AxialSymmetricMesh.from_mesh(mesh, nSectors, tolerance)
+            except ValueError:
+                continue
+    return mesh
+
+def detect_reflection_symmetries(mesh, tolerance=1e-5):
+    """
+    return an equivalent ReflectionSymmetricMesh if the mesh is symmetric with
+    respect to xOz and/or yOz, or the mesh itself otherwise
+
+    Parameters
+    ----------
+    mesh : Mesh or CollectionOfMeshes
+    tolerance : float, optional
+        tolerance on the positions of the mirrored panels, relative to the
+        size of the mesh
+
+    Returns
+    -------
+    Mesh or ReflectionSymmetricMesh
+        for a mesh with two planes of symmetry, a ReflectionSymmetricMesh whose
+        half is itself a ReflectionSymmetricMesh
+    """
+    for plane, otherPlane in (('xOz', 'yOz'), ('yOz', 'xOz')):
+        try:
+            symmetricMesh = ReflectionSymmetricMesh.from_mesh(mesh, plane, tolerance)
+        except ValueError:
+            continue
+        try:
+            quarter = ReflectionSymmetricMesh.from_mesh(symmetricMesh.half, otherPlane, tolerance)
+        except ValueError:
+            return symmetricMesh
+        return ReflectionSymmetricMesh(quarter, plane, name=mesh.name)
+    return mesh
+
+# line closing the block of vertices or of panels: '0 0 0 0' in .nemoh files,
+# '0 0.00 0.00 0.00' in .dat files (no vertex or panel line starts with 0)
+_NEMOH_DIVIDER = re.compile(r'^[ \t]*0(?:\.0*)?(?=\s|$).*$', re.MULTILINE)
+
+# to be incremented when the content of the cache files changes
+MESH_CACHE_VERSION = 1
+
+# extensions recognized by load_mesh
+MESH_FORMATS = ('nemoh', 'mar', 'dat', 'gdf', 'stl')
+
+def read_nemoh_mesh(pathToMesh, cache=False):
     '''
     reads nemoh mesh file; return headers, vertices and panels.
 
@@ -458,51 +837,307 @@ def read_nemoh_mesh(pathToMesh):#
     ----------
     pathToMesh: str
         path to the nemoh mesh file (i.e. .mar or .nemoh format mesh)
+    cache: bool, optional
+        if True, the arrays are also stored in a sidecar file
+        :code:`pathToMesh + '.npz'`, that is read instead of the mesh file
+        as long as the latter is unchanged (same modification time, or same
+        content hash). Default: False.
 
     Returns
     -------
     header : array
-    vertices : array
-    panels : array
+    vertices : array of float64 of shape (nVertices, 3)
+    panels : array of int32 of shape (nPanels, 4)
 
     Raises
     ------
-    None
+    ValueError: if the blocks of vertices and panels can not be parsed
 
     Notes
     -----
     - nemoh meshes have two parts: a list of vertices in 3D space, and a list of
       panel definitions that describes how the vertices are joined together
-    - this read function is expecting the use of lines containing 4 or more
-      zeros in the mesh file to seperate the list of vertices and panels (and at
-      the end of the file)
+    - this read function is expecting the use of lines starting with a zero
+      (e.g. '0 0 0 0') in the mesh file to seperate the list of vertices and
+      panels (and at the end of the file)
+    - each block is parsed at once into a contiguous array
     '''
-    vertices = []
-    panels = []
-    ftoggle = 0 # toggle - if reading mesh vertices or panel definitions
-    with open(pathToMesh) as f:
-        for iline, line in enumerate(f):
-            # read header line
-            if iline == 0:
-                header = np.asarray(line.split(), dtype=int)
-                continue
-            # catch '0 0 0 0' divider in nemoh mesh file
-            if np.count_nonzero(np.asarray(line.split()) == '0') >= 4:
-                ftoggle = 1
-                continue
-            # catch '0 0.00 0.00 0.00' divider in .dat mesh file
-            if np.count_nonzero(np.asarray(line.split()) == '0.00') >= 3:
-                ftoggle = 1
-                continue
-            # append each vertex to list
-            if ftoggle == 0:
-                vertices.append(np.asarray(line.split(), dtype=float)[1:])
-                continue
-            # append each panel to list
-            if ftoggle == 1:
-                panels.append(np.asarray(line.split(), dtype=int))
-                continue
-            if np.count_nonzero(np.asarray(line.split()) == '0') >= 4:
-                break
-    
-    return header, vertices, panels
+    arrays = _read_with_cache(pathToMesh, 'nemoh', cache,
+                              lambda content: _parse_nemoh_mesh(content.decode()))
+    return arrays['header'], arrays['vertices'], arrays['panels']
+
+def _parse_nemoh_mesh(text):
+    '''parse the content of a nemoh mesh file, see :func:`read_nemoh_mesh`'''
+    headerLine, _, text = text.partition('\n')
+    header = np.asarray(headerLine.split(), dtype=int)
+
+    # the vertices are before the first divider, the panels between the first
+    # and the second one (or the end of the file)
+    dividers = list(_NEMOH_DIVIDER.finditer(text))
+    vertexBlock = text[:dividers[0].start()] if dividers else text
+    panelBlock = text[dividers[0].end():dividers[1].start() if len(dividers) > 1 else len(text)] if dividers else ''
+
+    vertices = _parse_block(vertexBlock, np.float64, 4)[:, 1:]
+    panels = _parse_block(panelBlock, np.int32, 4)
+    return dict(header=header, vertices=np.ascontiguousarray(vertices), panels=panels)
+
+def _parse_block(block, dtype, nColumns):
+    if not block.strip():
+        return np.empty((0, nColumns), dtype=dtype)
+    return np.loadtxt(io.StringIO(block), dtype=dtype, ndmin=2)
+
+def read_gdf_mesh(pathToMesh, tolerance=0.0, cache=False):
+    '''
+    reads WAMIT low-order geometry file (.gdf); return symmetries, vertices and panels.
+
+    Parameters
+    ----------
+    pathToMesh: str
+        path to the .gdf file
+    tolerance: float, optional
+        the corners of the panels closer than this distance are merged into a
+        single vertex (default: 0, only identical corners are merged)
+    cache: bool, optional
+        see :func:`read_nemoh_mesh`
+
+    Returns
+    -------
+    header : array of int
+        the symmetry flags ISX and ISY of the file (1 if x = 0, resp. y = 0,
+        is a plane of symmetry and only one half of the body is described)
+    vertices : array of float64 of shape (nVertices, 3)
+    panels : array of int32 of shape (nPanels, 4)
+        indices of the vertices, starting at 1; triangles are stored as
+        (a, b, c, a)
+
+    Raises
+    ------
+    ValueError: if the file does not contain the announced number of panels
+
+    Notes
+    -----
+    - the file starts with a title line, a line with ULEN and GRAV, a line with
+      ISX and ISY and a line with the number of panels, followed by the
+      coordinates of the four corners of each panel in free format
+    - ULEN and GRAV are ignored
+    '''
+    arrays = _read_with_cache(pathToMesh, f'gdf:{tolerance!r}', cache,
+                              lambda content: _parse_gdf_mesh(content.decode(), tolerance))
+    return arrays['header'], arrays['vertices'], arrays['panels']
+
+def _parse_gdf_mesh(text, tolerance):
+    '''parse the content of a .gdf file, see :func:`read_gdf_mesh`'''
+    lines = text.split('\n', 4)
+    if len(lines) < 4:
+        raise ValueError('Incomplete GDF header.')
+    header = np.asarray(lines[2].split()[:2], dtype=int)
+    nPanels = int(lines[3].split()[0])
+
+    # Fortran double precision exponents, e.g. 1.0D+00
+    coordinates = np.array(lines[4].replace('D', 'E').replace('d', 'e').split() if len(lines) > 4 else [],
+                           dtype=np.float64)
+    if len(coordinates) < 12*nPanels:
+        raise ValueError(f'The GDF file announces {nPanels} panels but only contains '
+                         f'{len(coordinates)//12} of them.')
+    vertices, panels = _weld_corners(coordinates[:12*nPanels].reshape(nPanels, 4, 3), tolerance)
+    return dict(header=header, vertices=vertices, panels=panels)
+
+# record of a binary STL file: normal, three corners and attribute byte count
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('corners', '<f4', (3, 3)), ('attribute', '<u2')])
+
+_STL_VERTEX = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+def read_stl_mesh(pathToMesh, tolerance=0.0, cache=False):
+    '''
+    reads binary or ASCII stereolithography file (.stl); return vertices and panels.
+
+    Parameters
+    ----------
+    pathToMesh: str
+        path to the .stl file
+    tolerance: float, optional
+        the corners of the facets closer than this distance are merged into a
+        single vertex (default: 0, only identical corners are merged)
+    cache: bool, optional
+        see :func:`read_nemoh_mesh`
+
+    Returns
+    -------
+    vertices : array of float64 of shape (nVertices, 3)
+    panels : array of int32 of shape (nPanels, 4)
+        indices of the vertices, starting at 1; the triangular facets are
+        stored as (a, b, c, a)
+
+    Notes
+    -----
+    - the facets of STL files do not share their vertices: the coincident
+      corners are welded together to build the connectivity of the mesh
+    - the normals stored in the file are ignored, the orientation is given by
+      the order of the corners
+    '''
+    arrays = _read_with_cache(pathToMesh, f'stl:{tolerance!r}', cache,
+                              lambda content: _parse_stl_mesh(content, tolerance))
+    return arrays['vertices'], arrays['panels']
+
+def _parse_stl_mesh(content, tolerance):
+    '''parse the content of a .stl file, see :func:`read_stl_mesh`'''
+    nFacets = int(np.frombuffer(content, dtype='<u4', count=1, offset=80)[0]) if len(content) >= 84 else -1
+    if len(content) == 84 + _STL_RECORD.itemsize*nFacets:
+        corners = np.frombuffer(content, dtype=_STL_RECORD, count=nFacets, offset=84)['corners']
+    else:
+        corners = np.array(_STL_VERTEX.findall(content), dtype=np.float64).reshape(-1, 3, 3)
+    vertices, panels = _weld_corners(corners.astype(np.float64), tolerance)
+    return dict(vertices=vertices, panels=panels)
+
+def _weld_corners(corners, tolerance=0.0):
+    '''
+    merge the coincident corners of independent panels into shared vertices
+
+    Parameters
+    ----------
+    corners : array of shape (nPanels, 3 or 4, 3)
+        coordinates of the corners of each panel
+    tolerance : float
+        maximum distance between two merged corners (0 for identical corners)
+
+    Returns
+    -------
+    vertices : array of float64 of shape (nVertices, 3)
+    panels : array of int32 of shape (nPanels, 4)
+        see :func:`_canonical_panels`
+    '''
+    vertices, inverse = np.unique(corners.reshape(-1, 3), axis=0, return_inverse=True)
+    if tolerance > 0.0 and len(vertices) > 1:
+        pairs = cKDTree(vertices).query_pairs(tolerance, output_type='ndarray')
+        if len(pairs) > 0:
+            # each cluster of close vertices is replaced by its first vertex
+            graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                               shape=(len(vertices), len(vertices)))
+            nClusters, labels = connected_components(graph, directed=False)
+            first = np.full(nClusters, len(vertices))
+            np.minimum.at(first, labels, np.arange(len(vertices)))
+            vertices, inverse = vertices[first], labels[inverse]
+    panels = inverse.reshape(corners.shape[:2]).astype(np.int32) + 1
+    return np.ascontiguousarray(vertices), _canonical_panels(panels)
+
+def _canonical_panels(panels):
+    '''
+    panels of four vertices, in which the triangles are stored as (a, b, c, a)
+    as expected by :meth:`Mesh.compute_panel_properties`
+
+    The panels with less than three distinct vertices, or whose repeated
+    vertices are not consecutive, are degenerate: they are dropped.
+    '''
+    if panels.shape[1] == 3:
+        panels = np.column_stack([panels, panels[:, 0]])
+    nUniqueVertices = 1 + np.count_nonzero(np.diff(np.sort(panels, axis=1), axis=1), axis=1)
+
+    # i such that vertices i and i+1 are the same, e.g. 0 for (a, a, b, c)
+    repeated = panels == np.roll(panels, -1, axis=1)
+    isTriangle = (nUniqueVertices == 3) & repeated.any(axis=1)
+    order = (np.argmax(repeated, axis=1)[:, None] + np.array([2, 3, 4, 2])) % 4
+    reorder = isTriangle & (panels[:, 0] != panels[:, 3])
+    panels = np.where(reorder[:, None], np.take_along_axis(panels, order, axis=1), panels)
+
+    valid = (nUniqueVertices == 4) | isTriangle
+    if not valid.all():
+        LOG.warning(f'{np.count_nonzero(~valid)} degenerate panels have been removed from the mesh.')
+    return np.ascontiguousarray(panels[valid])
+
+def load_mesh(pathToMesh, file_format=None, name=None, tolerance=0.0, cache=False):
+    '''
+    reads a mesh file and return the corresponding mesh
+
+    Parameters
+    ----------
+    pathToMesh: str
+        path to the mesh file
+    file_format: str, optional
+        one of :data:`MESH_FORMATS` (default: deduced from the extension of the file)
+    name: str, optional
+        name of the mesh (default: the name of the file)
+    tolerance: float, optional
+        see :func:`read_gdf_mesh` and :func:`read_stl_mesh`
+    cache: bool, optional
+        see :func:`read_nemoh_mesh`
+
+    Returns
+    -------
+    Mesh or ReflectionSymmetricMesh
+        when the file only describes a part of a symmetric body (symmetry flag
+        of a .mar file, ISX or ISY of a .gdf file), the whole body is returned
+        as a ReflectionSymmetricMesh of this part
+
+    Raises
+    ------
+    ValueError: if the format is not supported
+    '''
+    if file_format is None:
+        file_format = path.splitext(str(pathToMesh))[1][1:]
+    file_format = file_format.lower()
+    if name is None:
+        name = path.basename(str(pathToMesh))
+
+    planes = []
+    if file_format in ('nemoh', 'mar', 'dat'):
+        header, vertices, panels = read_nemoh_mesh(pathToMesh, cache=cache)
+        if len(header) > 1 and header[1] == 1:
+            planes.append('xOz')
+    elif file_format == 'gdf':
+        header, vertices, panels = read_gdf_mesh(pathToMesh, tolerance=tolerance, cache=cache)
+        planes.extend(plane for plane, flag in zip(('yOz', 'xOz'), header) if flag == 1)
+    elif file_format == 'stl':
+        vertices, panels = read_stl_mesh(pathToMesh, tolerance=tolerance, cache=cache)
+    else:
+        raise ValueError(f'Unknown mesh format {file_format!r}. '
+                         f'Accepted values: {MESH_FORMATS}.')
+
+    if not planes:
+        return Mesh(vertices, panels, name=name)
+    mesh = Mesh(vertices, panels, name=f'{name}_half')
+    for plane in planes:
+        mesh = ReflectionSymmetricMesh(mesh, plane)
+    mesh.name = name
+    return mesh
+
+def _read_with_cache(pathToMesh, key, cache, parse):
+    '''
+    arrays parsed from the content of a mesh file, or read from its sidecar
+    file :code:`pathToMesh + '.npz'` if cache is True and the latter is up to date
+
+    The key identifies the parser and its parameters, such that the sidecar
+    file is not reused by another reader.
+    '''
+    cachePath = str(pathToMesh) + '.npz'
+    stat = os.stat(pathToMesh)
+    content = None
+
+    if cache and path.isfile(cachePath):
+        try:
+            with np.load(cachePath) as data:
+                if int(data['version']) == MESH_CACHE_VERSION and str(data['key']) == key:
+                    upToDate = (int(data['mtime']), int(data['size'])) == (stat.st_mtime_ns, stat.st_size)
+                    if not upToDate:
+                        # e.g. a copied or touched file: the content decides
+                        with open(pathToMesh, 'rb') as f:
+                            content = f.read()
+                        upToDate = hashlib.sha256(content).hexdigest() == str(data['sha256'])
+                    if upToDate:
+                        return {name: data[name] for name in data.files
+                                if name not in ('version', 'key', 'mtime', 'size', 'sha256')}
+        except (OSError, ValueError, KeyError):
+            LOG.warning(f'Unreadable mesh cache {cachePath}. The mesh file is parsed again.')
+
+    if content is None:
+        with open(pathToMesh, 'rb') as f:
+            content = f.read()
+    arrays = parse(content)
+
+    if cache:
+        try:
+            atomic_save(cachePath, version=MESH_CACHE_VERSION, key=key,
+                        mtime=stat.st_mtime_ns, size=stat.st_size,
+                        sha256=hashlib.sha256(content).hexdigest(), **arrays)
+        except OSError as error:
+            LOG.warning(f'The mesh cache {cachePath} could not be written: {error}')
+    return arrays
@@ -1,9 +1,17 @@
 import logging
+import tempfile
 import numpy as np
 
 from datetime import datetime
+from itertools import groupby
 from litebem.solver.green_functions.delhommeau import Delhommeau
-from litebem.solver import linear_solvers
+from litebem.solver import linear_solvers, parallel, field_points
+from litebem.solver.matrix_cache import DiskMatrixCache
+from litebem.solver.block_matrices import BlockSymmetricToeplitzMatrix, BlockCirculantMatrix
+from litebem.preprocessing.mesh import CollectionOfMeshes, ReflectionSymmetricMesh, AxialSymmetricMesh
+from litebem.solver.hierarchical_matrices import (ClusterTree, HierarchicalMatrix,
+                                                     adaptive_cross_approximation, truncated_svd)
+from litebem.solver.matrix_free import TiledInfluenceMatrices, MatrixFreeOperator
 
 #from capytaine.bem.engines import BasicMatrixEngine, HierarchicalToeplitzMatrixEngine
 #from capytaine.io.xarray import problems_from_dataset, assemble_dataset, kochin_data_array
@@ -57,25 +65,81 @@ def delete_first_lru_cache(maxsize=1):
 
 class BasicMatrixEngine():#MatrixEngine):
     """
-    Simple engine that assemble a full matrix (except for one reflection symmetry).
+    Simple engine that assemble a full matrix (except for reflection and rotation symmetries).
     Basically only calls :code:`green_function.evaluate`.
     Parameters
     ----------
     linear_solver: str or function, optional
         Setting of the numerical solver for linear problems Ax = b.
         It can be set with the name of a preexisting solver
-        (available: "direct" and "gmres", the latter is the default choice)
+        (available: "direct", "lu" and "gmres", the latter is the default choice)
         or by passing directly a solver function.
+        The "lu" solver stores the LU decomposition of the last matrices (as many as :code:`matrix_cache_size`),
+        so that it is reused for all the right-hand sides at a given frequency.
     matrix_cache_size: int, optional
         number of matrices to keep in cache
+    rankine_cache_size: int, optional
+        number of frequency-independent Rankine parts of the matrices to keep in cache (default: 0, no cache).
+        When it is positive, the Rankine and reflected Rankine terms are computed once for each pair of meshes
+        and each depth, and only the wave part is computed for each new frequency.
+        Requires a Green function with the methods :code:`evaluate_rankine_part` and :code:`add_wave_part`.
+    disk_cache: str or DiskMatrixCache, optional
+        persistent cache of the matrices on disk, or path of the directory of such a cache (default: None, no disk cache).
+        The matrices are stored under a hash of the content of the meshes, of the parameters of the problem
+        and of the settings of the Green function, so that they can be reused in another run.
+    preconditioner: str, optional
+        preconditioner of the "gmres" solver (default: None).
+        With "block_diagonal", the diagonal blocks of the matrix of a CollectionOfMeshes
+        (that is the self-interaction of each body of a farm built with :code:`Body.join_bodies`)
+        are factored once per matrix and used as a preconditioner.
+    out_of_core_dir: str, optional
+        directory of local scratch space in which the matrices are assembled (default: None, matrices in memory).
+        When it is given, the matrices are assembled by chunks of rows written directly into temporary
+        :code:`numpy.memmap` files, such that neither the full matrices nor a full Fortran-ordered copy of them
+        are ever held in memory. The files are deleted when the matrices are dropped.
+        Meant to be used with the "gmres" solver, which only reads the matrices through products with vectors.
+        Not compatible with :code:`rankine_cache_size`.
+    out_of_core_chunk_size: int, optional
+        number of rows of the matrices assembled at once when :code:`out_of_core_dir` is given
+        (default: such that a chunk of S and K uses about 256 MB)
+    multiple_wavenumbers_memory_budget: int, optional
+        if given, :meth:`BEMSolver.solve_all` assembles the matrices of the problems sharing the same mesh,
+        free surface and sea bottom for several wavenumbers at once, by blocks of wavenumbers whose matrices
+        fit in this memory (in bytes), see :meth:`Delhommeau.evaluate_multiple_wavenumbers`
+        (default: None, the matrices are assembled for one wavenumber at a time).
+        The saving is large in infinite depth, and limited to the Rankine part in finite depth.
+        The matrices of a sweep are not cached. Not compatible with :code:`rankine_cache_size`,
+        :code:`disk_cache` and :code:`out_of_core_dir`; the meshes with symmetries are still assembled
+        one wavenumber at a time.
     """
 
-    available_linear_solvers = {#'direct': linear_solvers.solve_directly,
+    available_linear_solvers = {'direct': linear_solvers.solve_directly,
                                 'gmres': linear_solvers.solve_gmres}
 
-    def __init__(self, *, linear_solver='gmres', matrix_cache_size=1):
-
-        if linear_solver in self.available_linear_solvers:
+    def __init__(self, *, linear_solver='gmres', matrix_cache_size=1, rankine_cache_size=0, disk_cache=None,
+                 preconditioner=None, out_of_core_dir=None, out_of_core_chunk_size=None,
+                 multiple_wavenumbers_memory_budget=None):
+
+        self._init_parameters = dict(linear_solver=linear_solver,
+                                     matrix_cache_size=matrix_cache_size,
+                                     rankine_cache_size=rankine_cache_size,
+                                     disk_cache=disk_cache,
+                                     preconditioner=preconditioner,
+                                     out_of_core_dir=out_of_core_dir,
+                                     out_of_core_chunk_size=out_of_core_chunk_size,
+                                     multiple_wavenumbers_memory_budget=multiple_wavenumbers_memory_budget)
+
+        self._preconditioned_solver = None
+        if preconditioner is not None:
+            if preconditioner != 'block_diagonal':
+                raise ValueError(f"Unrecognized preconditioner: {preconditioner}")
+            if linear_solver != 'gmres':
+                raise ValueError(f"The preconditioner is only used by the 'gmres' linear solver, not {linear_solver}.")
+            self._preconditioned_solver = linear_solvers.GMRESSolverWithBlockPreconditioner(cache_size=max(matrix_cache_size, 1))
+            self.linear_solver = self._preconditioned_solver.solve
+        elif linear_solver == 'lu':
+            self.linear_solver = linear_solvers.LUSolverWithCache(cache_size=max(matrix_cache_size, 1)).solve
+        elif linear_solver in self.available_linear_solvers:
             self.linear_solver = self.available_linear_solvers[linear_solver]
         else:
             self.linear_solver = linear_solver
@@ -83,12 +147,43 @@ class BasicMatrixEngine():#MatrixEngine):
         if matrix_cache_size > 0:
             self.build_matrices = delete_first_lru_cache(maxsize=matrix_cache_size)(self.build_matrices)
 
+        self.rankine_cache_size = rankine_cache_size
+        if rankine_cache_size > 0:
+            self.build_rankine_matrices = delete_first_lru_cache(maxsize=rankine_cache_size)(self.build_rankine_matrices)
+
+        if isinstance(disk_cache, str):
+            disk_cache = DiskMatrixCache(disk_cache)
+        self.disk_cache = disk_cache
+
+        if out_of_core_dir is not None and rankine_cache_size > 0:
+            raise ValueError("The out-of-core assembly can not be combined with the cache of the Rankine part.")
+        self.out_of_core_dir = out_of_core_dir
+        self.out_of_core_chunk_size = out_of_core_chunk_size
+
+        if multiple_wavenumbers_memory_budget is not None and (rankine_cache_size > 0 or disk_cache is not None
+                                                               or out_of_core_dir is not None):
+            raise ValueError("The assembly for multiple wavenumbers can not be combined with the cache of the Rankine part, "
+                             "the disk cache or the out-of-core assembly.")
+        self.multiple_wavenumbers_memory_budget = multiple_wavenumbers_memory_budget
+
         self.exportable_settings = {
             'engine': 'BasicMatrixEngine',
             'matrix_cache_size': matrix_cache_size,
+            'rankine_cache_size': rankine_cache_size,
+            'disk_cache': str(disk_cache),
             'linear_solver': str(linear_solver),
+            'preconditioner': str(preconditioner),
+            'out_of_core_dir': str(out_of_core_dir),
+            'multiple_wavenumbers_memory_budget': str(multiple_wavenumbers_memory_budget),
         }
 
+    def __getstate__(self):
+        # The caches are not copied (e.g. when the engine is sent to another process): a new empty engine is rebuilt instead.
+        return self._init_parameters
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
     def build_matrices(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
         r"""Build the influence matrices between mesh1 and mesh2.
         Parameters
@@ -111,43 +206,459 @@ class BasicMatrixEngine():#MatrixEngine):
             the matrices :math:`S` and :math:`K`
         """
 
-        #TODO check if this segment of code is relavent to our BEM solver
-        # if (isinstance(mesh1, ReflectionSymmetricMesh)
-        #         and isinstance(mesh2, ReflectionSymmetricMesh)
-        #         and mesh1.plane == mesh2.plane):
+        if (isinstance(mesh1, ReflectionSymmetricMesh)
+                and isinstance(mesh2, ReflectionSymmetricMesh)
+                and mesh1.plane == mesh2.plane):
+
+            S_a, V_a = self.build_matrices(
+                mesh1[0], mesh2[0], free_surface, sea_bottom, wavenumber,
+                green_function)
+            S_b, V_b = self.build_matrices(
+                mesh1[0], mesh2[1], free_surface, sea_bottom, wavenumber,
+                green_function)
+
+            return BlockSymmetricToeplitzMatrix([[S_a, S_b]]), BlockSymmetricToeplitzMatrix([[V_a, V_b]])
+
+        elif (isinstance(mesh1, AxialSymmetricMesh)
+                and isinstance(mesh2, AxialSymmetricMesh)
+                and mesh1.nSectors == mesh2.nSectors):
+
+            S_list, V_list = [], []
+            for submesh in mesh2:
+                S, V = self.build_matrices(
+                    mesh1[0], submesh, free_surface, sea_bottom, wavenumber,
+                    green_function)
+                S_list.append(S)
+                V_list.append(V)
+
+            return BlockCirculantMatrix([S_list]), BlockCirculantMatrix([V_list])
+
+        if self.disk_cache is not None:
+            key = self.disk_cache.key(mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function)
+            matrices = self.disk_cache.load(key)
+            if matrices is None:
+                matrices = self._assemble_matrices(mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function)
+                self.disk_cache.store(key, *matrices)
+        else:
+            matrices = self._assemble_matrices(mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function)
+
+        if self._preconditioned_solver is not None and mesh1 is mesh2 and isinstance(mesh1, CollectionOfMeshes):
+            self._preconditioned_solver.set_block_sizes(matrices[1], [submesh.nPanels for submesh in mesh1])
 
-        #     S_a, V_a = self.build_matrices(
-        #         mesh1[0], mesh2[0], free_surface, sea_bottom, wavenumber,
-        #         green_function)
-        #     S_b, V_b = self.build_matrices(
-        #         mesh1[0], mesh2[1], free_surface, sea_bottom, wavenumber,
-        #         green_function)
+        return matrices
 
-        #     return BlockSymmetricToeplitzMatrix([[S_a, S_b]]), BlockSymmetricToeplitzMatrix([[V_a, V_b]])
+    def builds_multiple_wavenumbers(self, mesh, green_function):
+        """Whether :meth:`build_matrices_multiple_wavenumbers` should be used for the matrices of this mesh."""
+        return (self.multiple_wavenumbers_memory_budget is not None
+                and hasattr(green_function, 'evaluate_wavenumber_blocks')
+                and not isinstance(mesh, (ReflectionSymmetricMesh, AxialSymmetricMesh)))
+
+    def build_matrices_multiple_wavenumbers(self, mesh1, mesh2, free_surface, sea_bottom, wavenumbers, green_function):
+        r"""Build the influence matrices between mesh1 and mesh2 for several wavenumbers,
+        by blocks of wavenumbers whose matrices fit in :code:`multiple_wavenumbers_memory_budget`.
+        Parameters
+        ----------
+        mesh1, mesh2, free_surface, sea_bottom, green_function:
+            see :meth:`build_matrices`
+        wavenumbers: list of float
+            wavenumbers
+        Yields
+        ------
+        int and tuple of matrix-like
+            the index of the wavenumber in :code:`wavenumbers` and the matrices :math:`S` and :math:`K`
+        """
+        for indices, S, K in green_function.evaluate_wavenumber_blocks(
+                mesh1, mesh2, free_surface, sea_bottom, wavenumbers, self.multiple_wavenumbers_memory_budget):
+            for i, S_i, K_i in zip(indices, S, K):
+                if self._preconditioned_solver is not None and mesh1 is mesh2 and isinstance(mesh1, CollectionOfMeshes):
+                    self._preconditioned_solver.set_block_sizes(K_i, [submesh.nPanels for submesh in mesh1])
+                yield i, S_i, K_i
+
+    def build_S_matrix(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        r"""Similar to :meth:`build_matrices`, but returning only :math:`S`.
+        The gradient of the Green function is not computed at all, such that the evaluation costs roughly half
+        of the one of both matrices. Used to evaluate the potential on other meshes than the one of the body
+        (e.g. a free surface or field points). The result is neither cached in memory nor on disk.
+        Parameters
+        ----------
+        mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function:
+            see :meth:`build_matrices`
+        Returns
+        -------
+        matrix-like
+            the matrix :math:`S`
+        """
+        if (isinstance(mesh1, ReflectionSymmetricMesh)
+                and isinstance(mesh2, ReflectionSymmetricMesh)
+                and mesh1.plane == mesh2.plane):
+
+            S_a = self.build_S_matrix(mesh1[0], mesh2[0], free_surface, sea_bottom, wavenumber, green_function)
+            S_b = self.build_S_matrix(mesh1[0], mesh2[1], free_surface, sea_bottom, wavenumber, green_function)
+            return BlockSymmetricToeplitzMatrix([[S_a, S_b]])
+
+        elif (isinstance(mesh1, AxialSymmetricMesh)
+                and isinstance(mesh2, AxialSymmetricMesh)
+                and mesh1.nSectors == mesh2.nSectors):
+
+            return BlockCirculantMatrix([[
+                self.build_S_matrix(mesh1[0], submesh, free_surface, sea_bottom, wavenumber, green_function)
+                for submesh in mesh2
+            ]])
+
+        S, _ = green_function.evaluate(mesh1, mesh2, free_surface, sea_bottom, wavenumber, gradient=False)
+        return S
+
+    def _assemble_matrices(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        """Compute the full matrices with the Green function, reusing the cached Rankine part if enabled."""
+        if self.out_of_core_dir is not None:
+            return self._assemble_matrices_out_of_core(mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function)
+
+        if self.rankine_cache_size > 0 and hasattr(green_function, 'evaluate_rankine_part'):
+            S_rankine, K_rankine = self.build_rankine_matrices(
+                mesh1, mesh2, free_surface, sea_bottom,
+                green_function.rankine_coefficients(free_surface, sea_bottom, wavenumber),
+                green_function
+            )
+            # The cached Rankine part is kept untouched, the wave part is added to a copy (in double precision).
+            S, K = S_rankine.astype(np.complex128, order='F'), K_rankine.astype(np.complex128, order='F')
+            green_function.add_wave_part(S, K, mesh1, mesh2, free_surface, sea_bottom, wavenumber)
+            return S.astype(S_rankine.dtype, copy=False), K.astype(K_rankine.dtype, copy=False)
 
-        # else:
         return green_function.evaluate(
             mesh1, mesh2, free_surface, sea_bottom, wavenumber,
         )
 
+    def _assemble_matrices_out_of_core(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        """Compute the full matrices by chunks of rows, written into memory-mapped temporary files."""
+        shape = (mesh1.nPanels, mesh2.nPanels)
+        dtype = np.dtype(getattr(green_function, 'dtype', np.complex128))
+        chunk_size = self.out_of_core_chunk_size or max(1, 2**28 // (2*shape[1]*dtype.itemsize))
+
+        # The rows of a chunk are contiguous in the files.
+        # The temporary files have no name, they are deleted as soon as the memmaps are closed.
+        S = np.memmap(tempfile.TemporaryFile(dir=self.out_of_core_dir), dtype=dtype, mode='w+', shape=shape)
+        K = np.memmap(tempfile.TemporaryFile(dir=self.out_of_core_dir), dtype=dtype, mode='w+', shape=shape)
+        LOG.debug(f"Assemble matrices of shape {shape} for {mesh1.name} and {mesh2.name} "
+                  f"in {self.out_of_core_dir} by chunks of {chunk_size} rows.")
+
+        for start in range(0, shape[0], chunk_size):
+            rows = np.arange(start, min(start + chunk_size, shape[0]))
+            S[rows], K[rows] = green_function.evaluate(
+                mesh1.extract_faces(rows), mesh2, free_surface, sea_bottom, wavenumber,
+            )
+            if mesh1 is mesh2:
+                # The chunk is not recognized by the Green function as a part of mesh2,
+                # so the diagonal term of K for the interaction of the mesh with itself is added here.
+                K[rows, rows] += 0.5
+        S.flush()
+        K.flush()
+        return S, K
+
+    def build_rankine_matrices(self, mesh1, mesh2, free_surface, sea_bottom, rankine_coefficients, green_function):
+        r"""Build the frequency-independent Rankine part of the influence matrices between mesh1 and mesh2.
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float
+            position of the sea bottom (default: :math:`z = -\infty`)
+        rankine_coefficients: tuple of two floats
+            coefficients of the Rankine and reflected Rankine terms
+        green_function: AbstractGreenFunction
+            object with an "evaluate_rankine_part" method.
+        Returns
+        -------
+        tuple of matrix-like
+            the Rankine part of the matrices :math:`S` and :math:`K`
+        """
+        LOG.debug(f"Build Rankine part of the matrices for {mesh1.name} and {mesh2.name}.")
+        return green_function.evaluate_rankine_part(
+            mesh1, mesh2, free_surface, sea_bottom, rankine_coefficients,
+        )
+
+class HierarchicalMatrixEngine():
+    r"""
+    Engine assembling hierarchical matrices, in which the interactions between distant clusters of panels
+    are compressed as low-rank blocks by adaptive cross approximation (ACA).
+    The memory usage and the assembly time then grow roughly as :math:`N \log N` instead of :math:`N^2`,
+    which makes possible the resolution of problems with large meshes.
+    The matrices are linear operators meant to be used with the iterative GMRES solver.
+    Parameters
+    ----------
+    tolerance: float, optional
+        relative tolerance of the approximation of each low-rank block (default: 1e-4)
+    admissibility: float, optional
+        the interactions between two clusters of panels are compressed if the distance between their centers
+        is larger than :code:`admissibility` times the sum of their radii (default: 2.0)
+    leaf_size: int, optional
+        maximum number of panels in the smallest clusters, whose interactions are stored as dense blocks (default: 32)
+    linear_solver: str or function, optional
+        Setting of the numerical solver for linear problems Ax = b (default: "gmres").
+        The "direct" and "lu" solvers are available but need to rebuild the full matrix.
+    matrix_cache_size: int, optional
+        number of matrices to keep in cache
+    """
+
+    available_linear_solvers = BasicMatrixEngine.available_linear_solvers
+
+    def __init__(self, *, tolerance=1e-4, admissibility=2.0, leaf_size=32, linear_solver='gmres', matrix_cache_size=1):
+
+        self._init_parameters = dict(tolerance=tolerance,
+                                     admissibility=admissibility,
+                                     leaf_size=leaf_size,
+                                     linear_solver=linear_solver,
+                                     matrix_cache_size=matrix_cache_size)
+
+        if linear_solver == 'lu':
+            self.linear_solver = linear_solvers.LUSolverWithCache(cache_size=max(matrix_cache_size, 1)).solve
+        elif linear_solver in self.available_linear_solvers:
+            self.linear_solver = self.available_linear_solvers[linear_solver]
+        else:
+            self.linear_solver = linear_solver
+
+        if matrix_cache_size > 0:
+            self.build_matrices = delete_first_lru_cache(maxsize=matrix_cache_size)(self.build_matrices)
+
+        self.tolerance = tolerance
+        self.admissibility = admissibility
+        self.leaf_size = leaf_size
+
+        self.exportable_settings = {
+            'engine': 'HierarchicalMatrixEngine',
+            'tolerance': tolerance,
+            'admissibility': admissibility,
+            'leaf_size': leaf_size,
+            'matrix_cache_size': matrix_cache_size,
+            'linear_solver': str(linear_solver),
+        }
+
+    def __getstate__(self):
+        return self._init_parameters
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    # The matrix S of the potential on other meshes is evaluated by chunks of rows, it is not compressed.
+    build_S_matrix = BasicMatrixEngine.build_S_matrix
+
+    def build_matrices(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        r"""Build the influence matrices between mesh1 and mesh2 as hierarchical matrices.
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float
+            position of the sea bottom (default: :math:`z = -\infty`)
+        wavenumber: float
+            wavenumber (default: 1.0)
+        green_function: AbstractGreenFunction
+            object with an "evaluate" method that computes the Green function.
+        Returns
+        -------
+        tuple of HierarchicalMatrix
+            the matrices :math:`S` and :math:`K`
+        """
+        tree1 = ClusterTree(mesh1.panelCenters, mesh1.panelRadii, self.leaf_size)
+        tree2 = tree1 if mesh2 is mesh1 else ClusterTree(mesh2.panelCenters, mesh2.panelRadii, self.leaf_size)
+
+        submeshes = {}
+
+        def submesh(mesh, ids):
+            # The same Mesh object is returned for the same panels, such that the diagonal blocks
+            # are recognized by the Green function as interactions of a mesh with itself.
+            key = (id(mesh), tuple(ids))
+            if key not in submeshes:
+                submeshes[key] = mesh.extract_faces(ids)
+            return submeshes[key]
+
+        def evaluate(ids1, ids2):
+            return green_function.evaluate(
+                submesh(mesh1, ids1), submesh(mesh2, ids2), free_surface, sea_bottom, wavenumber
+            )
+
+        S_blocks, K_blocks = [], []
+
+        def build_block(cluster1, cluster2):
+            if (cluster1.is_admissible_with(cluster2, self.admissibility)
+                    and len(cluster1)*len(cluster2) <= self.leaf_size**2):
+                # Small block: computing the full block at once is cheaper than computing several rows and columns.
+                S, K = evaluate(cluster1.ids, cluster2.ids)
+                S_blocks.append((cluster1.ids, cluster2.ids, truncated_svd(S, self.tolerance) or S))
+                K_blocks.append((cluster1.ids, cluster2.ids, truncated_svd(K, self.tolerance) or K))
+
+            elif cluster1.is_admissible_with(cluster2, self.admissibility):
+                rows, columns = {}, {}
+
+                def get_row(i):
+                    if i not in rows:
+                        rows[i] = [M[0, :] for M in evaluate(cluster1.ids[i:i+1], cluster2.ids)]
+                    return rows[i]
+
+                def get_column(j):
+                    if j not in columns:
+                        columns[j] = [M[:, 0] for M in evaluate(cluster1.ids, cluster2.ids[j:j+1])]
+                    return columns[j]
+
+                low_rank_blocks = [adaptive_cross_approximation(
+                    lambda i: get_row(i)[n], lambda j: get_column(j)[n],
+                    (len(cluster1), len(cluster2)), self.tolerance
+                ) for n in range(2)]
+
+                if None in low_rank_blocks:
+                    S, K = evaluate(cluster1.ids, cluster2.ids)
+                    low_rank_blocks = [dense if low_rank is None else low_rank
+                                       for low_rank, dense in zip(low_rank_blocks, (S, K))]
+
+                S_blocks.append((cluster1.ids, cluster2.ids, low_rank_blocks[0]))
+                K_blocks.append((cluster1.ids, cluster2.ids, low_rank_blocks[1]))
+
+            elif cluster1.is_leaf and cluster2.is_leaf:
+                S, K = evaluate(cluster1.ids, cluster2.ids)
+                S_blocks.append((cluster1.ids, cluster2.ids, S))
+                K_blocks.append((cluster1.ids, cluster2.ids, K))
+
+            else:
+                for child1 in (cluster1.children or (cluster1,)):
+                    for child2 in (cluster2.children or (cluster2,)):
+                        build_block(child1, child2)
+
+        LOG.debug(f"Build hierarchical matrices for {mesh1.name} and {mesh2.name}.")
+        build_block(tree1, tree2)
+
+        shape = (mesh1.nPanels, mesh2.nPanels)
+        dtype = getattr(green_function, 'dtype', np.complex128)
+        S, K = HierarchicalMatrix(shape, S_blocks, dtype=dtype), HierarchicalMatrix(shape, K_blocks, dtype=dtype)
+        LOG.info(f"Hierarchical matrices of shape {shape}: compression rate {S.compression_rate:.1%} for S "
+                 f"and {K.compression_rate:.1%} for K.")
+        return S, K
+
+class MatrixFreeEngine():
+    r"""
+    Engine that never stores the full influence matrices, for meshes whose matrices do not fit in memory.
+    The matrices are linear operators: each of their products with a vector recomputes the matrix tile by tile
+    with the Green function, so that the memory usage only grows as the number of panels :math:`N`,
+    while each product costs as much as the assembly of the full matrices.
+    The matrices are meant to be used with the iterative GMRES solver, see :mod:`litebem.solver.matrix_free`.
+    Parameters
+    ----------
+    block_size: int, optional
+        maximum number of panels in the blocks of neighbouring panels defining the tiles (default: 256)
+    admissibility: float, optional
+        two blocks of panels are in the near field of each other if the distance between their centers
+        is lower than :code:`admissibility` times the sum of their radii (default: 1.0)
+    cache_near_field: bool, optional
+        if True (default), the tiles of the near field, that are the most expensive to compute,
+        are kept in memory after the first product instead of being computed again at each product.
+        Their number only grows as :math:`N`.
+    linear_solver: str or function, optional
+        Setting of the numerical solver for linear problems Ax = b (default: "gmres").
+        The direct solvers are not available since they require the full matrix.
+    matrix_cache_size: int, optional
+        number of pairs of operators (and thus of caches of near field tiles) to keep in cache
+    """
+
+    def __init__(self, *, block_size=256, admissibility=1.0, cache_near_field=True, linear_solver='gmres',
+                 matrix_cache_size=1):
+
+        self._init_parameters = dict(block_size=block_size,
+                                     admissibility=admissibility,
+                                     cache_near_field=cache_near_field,
+                                     linear_solver=linear_solver,
+                                     matrix_cache_size=matrix_cache_size)
+
+        if linear_solver == 'gmres':
+            self.linear_solver = linear_solvers.solve_gmres
+        elif callable(linear_solver):
+            self.linear_solver = linear_solver
+        else:
+            raise ValueError(f"Unrecognized linear solver for the MatrixFreeEngine: {linear_solver}. "
+                             f"Only 'gmres' or a function are accepted.")
+
+        if matrix_cache_size > 0:
+            self.build_matrices = delete_first_lru_cache(maxsize=matrix_cache_size)(self.build_matrices)
+
+        self.block_size = block_size
+        self.admissibility = admissibility
+        self.cache_near_field = cache_near_field
+
+        self.exportable_settings = {
+            'engine': 'MatrixFreeEngine',
+            'block_size': block_size,
+            'admissibility': admissibility,
+            'cache_near_field': cache_near_field,
+            'matrix_cache_size': matrix_cache_size,
+            'linear_solver': str(linear_solver),
+        }
+
+    def __getstate__(self):
+        return self._init_parameters
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    # The matrix S of the potential on other meshes is evaluated by chunks of rows, it is not stored anyway.
+    build_S_matrix = BasicMatrixEngine.build_S_matrix
+
+    def build_matrices(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        r"""Build the influence matrices between mesh1 and mesh2 as linear operators.
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float
+            position of the sea bottom (default: :math:`z = -\infty`)
+        wavenumber: float
+            wavenumber (default: 1.0)
+        green_function: AbstractGreenFunction
+            object with an "evaluate" method that computes the Green function.
+        Returns
+        -------
+        tuple of MatrixFreeOperator
+            the matrices :math:`S` and :math:`K`, sharing the same tiles
+        """
+        def evaluate(submesh1, submesh2):
+            return green_function.evaluate(submesh1, submesh2, free_surface, sea_bottom, wavenumber)
+
+        tiled_matrices = TiledInfluenceMatrices(mesh1, mesh2, evaluate, self.block_size, self.admissibility,
+                                                self.cache_near_field)
+        LOG.debug(f"Build matrix-free operators for {mesh1.name} and {mesh2.name} with {tiled_matrices.nb_tiles} tiles, "
+                  f"including {len(tiled_matrices.near_field)} tiles of near field kept in memory.")
+        return MatrixFreeOperator(tiled_matrices, 0), MatrixFreeOperator(tiled_matrices, 1)
+
 class BEMSolver:
     """
     Solver for linear potential flow problems.
     Parameters
     ----------
-    green_function: AbstractGreenFunction
-        Object handling the computation of the Green function.
-    engine: MatrixEngine
-        Object handling the building of matrices and the resolution of linear systems with these matrices.
+    green_function: AbstractGreenFunction, optional
+        Object handling the computation of the Green function (default: :code:`Delhommeau()`).
+    engine: MatrixEngine, optional
+        Object handling the building of matrices and the resolution of linear systems with these matrices
+        (default: :code:`BasicMatrixEngine()`).
     Attributes
     ----------
     exportable_settings : dict
         Settings of the solver that can be saved to reinit the same solver later.
     """
 
-    def __init__(self, *, green_function=Delhommeau(), engine=BasicMatrixEngine()):
-        self.green_function = green_function
-        self.engine = engine
+    def __init__(self, *, green_function=None, engine=None):
+        # The default Green function is only built here, and not when this module is imported,
+        # since it requires the tabulation of some integrals.
+        self.green_function = Delhommeau() if green_function is None else green_function
+        # Likewise, each solver has its own default engine, such that its caches are not shared with other solvers.
+        self.engine = BasicMatrixEngine() if engine is None else engine
 
         try:
             self.exportable_settings = {
@@ -177,9 +688,7 @@ class BEMSolver:
         """
         LOG.info("Solve %s.", problem)
 
-        if problem.wavelength < 8*problem.body.mesh.panelRadii.max():
-            LOG.warning(f"Resolution of the mesh (8×max_radius={8*problem.body.mesh.panelRadii.max():.2e}) "
-                        f"might be insufficient for this wavelength (wavelength={problem.wavelength:.2e})!")
+        self._check_mesh_resolution(problem)
 
         S, K = self.engine.build_matrices(
             problem.body.mesh, problem.body.mesh,
@@ -187,8 +696,77 @@ class BEMSolver:
             self.green_function
         )
         sources = self.engine.linear_solver(K, problem.boundary_condition)
-        potential = S @ sources
+        potential = linear_solvers.double_precision_matvec(S, sources)
+
+        result = self._make_result(problem, sources, potential, keep_details)
 
+        LOG.debug("Done!")
+
+        return result
+
+    def solve_batch(self, problems, keep_details=True):
+        """Solve several problems sharing the same influence matrices,
+        that is problems with the same mesh, free surface, sea bottom and wavenumber
+        (typically all the radiation and diffraction problems of a body at a given frequency).
+        The matrices are built once and the boundary conditions are solved together
+        as a single linear system with several right-hand sides: the "direct" and "lu" solvers
+        factorize the matrix once, and the "gmres" solver builds a single Krylov space for all of them
+        (block GMRES).
+        Parameters
+        ----------
+        problems: list of LinearPotentialFlowProblem
+            the problems to be solved
+        keep_details: bool, optional
+            if True, store the sources and the potential on the floating body in the output objects
+            (default: True)
+        Returns
+        -------
+        list of LinearPotentialFlowResult
+            the solved problems, in the same order as the input
+        """
+        problems = list(problems)
+        if len({self._matrices_key(problem) for problem in problems}) > 1:
+            raise ValueError("The problems solved in a single batch should share the same mesh, "
+                             "free surface, sea bottom and wavenumber.")
+
+        LOG.info("Solve %d problems at once: %s.", len(problems), ", ".join(str(problem) for problem in problems))
+
+        reference_problem = problems[0]
+        self._check_mesh_resolution(reference_problem)
+
+        S, K = self.engine.build_matrices(
+            reference_problem.body.mesh, reference_problem.body.mesh,
+            reference_problem.free_surface, reference_problem.sea_bottom, reference_problem.wavenumber,
+            self.green_function
+        )
+        return self._solve_batch_with_matrices(problems, S, K, keep_details)
+
+    def _solve_batch_with_matrices(self, problems, S, K, keep_details):
+        """Solve the problems of a batch (see :meth:`solve_batch`) with their influence matrices."""
+        boundary_conditions = np.stack([problem.boundary_condition for problem in problems], axis=1)
+        sources = self.engine.linear_solver(K, boundary_conditions)
+        potentials = linear_solvers.double_precision_matvec(S, sources)
+
+        results = [self._make_result(problem, sources[:, i], potentials[:, i], keep_details)
+                   for i, problem in enumerate(problems)]
+
+        LOG.debug("Done!")
+
+        return results
+
+    @staticmethod
+    def _matrices_key(problem):
+        """Parameters of a problem that define its influence matrices."""
+        return (id(problem.body.mesh), problem.free_surface, problem.sea_bottom, problem.wavenumber)
+
+    @staticmethod
+    def _check_mesh_resolution(problem):
+        if problem.wavelength < 8*problem.body.mesh.panelRadii.max():
+            LOG.warning(f"Resolution of the mesh (8×max_radius={8*problem.body.mesh.panelRadii.max():.2e}) "
+                        f"might be insufficient for this wavelength (wavelength={problem.wavelength:.2e})!")
+
+    @staticmethod
+    def _make_result(problem, sources, potential, keep_details):
         result = problem.make_results_container()
         if keep_details:
             result.sources = sources
@@ -204,23 +782,72 @@ class BEMSolver:
             # Depending of the type of problem, the force will be kept as a complex-valued Froude-Krylov force
             # or stored as a couple of added mass and radiation damping coefficients.
 
-        LOG.debug("Done!")
-
         return result
 
-    def solve_all(self, problems, **kwargs):
+    def solve_all(self, problems, *, batch_rhs=True, n_workers=1, n_threads_per_worker=None, **kwargs):
         """Solve several problems.
-        Optional keyword arguments are passed to `Nemoh.solve`.
+        Optional keyword arguments are passed to `BEMSolver.solve` or `BEMSolver.solve_batch`.
         Parameters
         ----------
         problems: list of LinearPotentialFlowProblem
             several problems to be solved
+        batch_rhs: bool, optional
+            if True (default), the problems sharing the same influence matrices are solved together
+            with :meth:`solve_batch`, in a single factorization or a single block GMRES.
+            The linear solver of the engine should then accept a 2D array of right-hand sides.
+            If the engine has a :code:`multiple_wavenumbers_memory_budget`, the matrices of the batches that only
+            differ by their wavenumber are also assembled together, see :class:`BasicMatrixEngine`.
+        n_workers: int, optional
+            number of processes solving the problems in parallel (default: 1, no parallelism).
+            The problems are split by body and frequency between the processes, which receive the
+            meshes through shared memory. As with any use of :code:`multiprocessing`, a script
+            using this option should be protected by :code:`if __name__ == "__main__":`.
+        n_threads_per_worker: int, optional
+            number of OpenMP and BLAS threads in each process when :code:`n_workers > 1`
+            (default: number of cpu divided by n_workers)
         Returns
         -------
         list of LinearPotentialFlowResult
-            the solved problems
+            the solved problems, sorted as the problems themselves
         """
-        return [self.solve(problem, **kwargs) for problem in sorted(problems)]
+        problems = sorted(problems)
+        batches = [list(batch) for _, batch in groupby(problems, key=self._matrices_key)]
+
+        if n_workers > 1:
+            return parallel.solve_batches_in_pool(self, batches, n_workers, n_threads_per_worker,
+                                                  batch_rhs=batch_rhs, **kwargs)
+
+        if not batch_rhs:
+            return [self.solve(problem, **kwargs) for problem in problems]
+
+        results = {}
+        for _, sweep in groupby(range(len(batches)), key=lambda i: self._matrices_key(batches[i][0])[:3]):
+            sweep = list(sweep)
+            mesh = batches[sweep[0]][0].body.mesh
+            if len(sweep) > 1 and self._engine_builds_multiple_wavenumbers(mesh):
+                results.update(self._solve_sweep(mesh, [batches[i] for i in sweep], sweep, **kwargs))
+            else:
+                results.update((i, self.solve_batch(batches[i], **kwargs)) for i in sweep)
+        return [result for i in range(len(batches)) for result in results[i]]
+
+    def _engine_builds_multiple_wavenumbers(self, mesh):
+        """Whether the engine assembles the matrices of this mesh for several wavenumbers at once."""
+        builds_multiple_wavenumbers = getattr(self.engine, 'builds_multiple_wavenumbers', None)
+        return builds_multiple_wavenumbers is not None and builds_multiple_wavenumbers(mesh, self.green_function)
+
+    def _solve_sweep(self, mesh, batches, batch_ids, keep_details=True):
+        """Solve batches of problems that only differ by their wavenumber,
+        with the matrices assembled for several wavenumbers at once by the engine."""
+        reference_problem = batches[0][0]
+        LOG.info("Solve %d problems for %d wavenumbers at once.", sum(len(batch) for batch in batches), len(batches))
+        for batch in batches:
+            self._check_mesh_resolution(batch[0])
+        matrices = self.engine.build_matrices_multiple_wavenumbers(
+            mesh, mesh, reference_problem.free_surface, reference_problem.sea_bottom,
+            [batch[0].wavenumber for batch in batches], self.green_function
+        )
+        for i, S, K in matrices:
+            yield batch_ids[i], self._solve_batch_with_matrices(batches[i], S, K, keep_details)
 
     def fill_dataset(self, dataset, bodies, **kwargs):
         """Solve a set of problems defined by the coordinates of an xarray dataset.
@@ -259,10 +886,10 @@ class BEMSolver:
             a mesh
         chunk_size: int, optional
             Number of lines to compute in the matrix.
-            (legacy, should be passed as an engine setting instead).
+            (legacy, see :meth:`get_field_at_points` for a chunk size deduced from a memory budget).
         Returns
         -------
-        array of shape (mesh.nb_faces,)
+        array of shape (mesh.nPanels,)
             potential on the faces of the mesh
         Raises
         ------
@@ -270,34 +897,92 @@ class BEMSolver:
         """
         LOG.info(f"Compute potential on {mesh.name} for {result}.")
 
-        if result.sources is None:
-            raise Exception(f"""The values of the sources of {result} cannot been found.
-            They probably have not been stored by the solver because the option keep_details=True have not been set.
-            Please re-run the resolution with this option.""")
+        if not hasattr(self.green_function, 'evaluate_at_points'):
+            return self._get_potential_on_mesh_by_blocks(result, mesh, chunk_size)
+
+        phi, _ = self.get_field_at_points(result, mesh.panelCenters, chunk_size=chunk_size)
+
+        LOG.debug(f"Done computing potential on {mesh.name} for {result}.")
+
+        return phi
+
+    def _get_potential_on_mesh_by_blocks(self, result, mesh, chunk_size):
+        """Same as :meth:`get_potential_on_mesh` for the Green functions that can only be evaluated on meshes."""
+        self._check_sources(result)
 
-        if chunk_size > mesh.nb_faces:
+        if chunk_size >= mesh.nPanels:
             S = self.engine.build_S_matrix(
                 mesh,
                 result.body.mesh,
                 result.free_surface, result.sea_bottom, result.wavenumber,
                 self.green_function
             )
-            phi = S @ result.sources
+            return linear_solvers.double_precision_matvec(S, result.sources)
 
-        else:
-            phi = np.empty((mesh.nb_faces,), dtype=np.complex128)
-            for i in range(0, mesh.nb_faces, chunk_size):
-                S = self.engine.build_S_matrix(
-                    mesh.extract_faces(list(range(i, i+chunk_size))),
-                    result.body.mesh,
-                    result.free_surface, result.sea_bottom, result.wavenumber,
-                    self.green_function
-                )
-                phi[i:i+chunk_size] = S @ result.sources
+        phi = np.empty((mesh.nPanels,), dtype=np.complex128)
+        for i in range(0, mesh.nPanels, chunk_size):
+            rows = np.arange(i, min(i + chunk_size, mesh.nPanels))
+            S = self.engine.build_S_matrix(
+                mesh.extract_faces(rows),
+                result.body.mesh,
+                result.free_surface, result.sea_bottom, result.wavenumber,
+                self.green_function
+            )
+            phi[rows] = linear_solvers.double_precision_matvec(S, result.sources)
+        return phi
 
-        LOG.debug(f"Done computing potential on {mesh.name} for {result}.")
+    def get_field_at_points(self, result, points, velocity=False, memory_budget=field_points.DEFAULT_MEMORY_BUDGET,
+                            chunk_size=None, n_workers=1, use_processes=False, n_threads_per_worker=None):
+        """Compute the potential, and optionally the velocity, at arbitrary points for a previously solved problem,
+        e.g. on a grid of points around the body.
+        The influence matrices are computed for a chunk of points at a time, such that grids of millions of points
+        can be processed within a bounded memory.
+        Parameters
+        ----------
+        result : LinearPotentialFlowResult
+            the return of the solver, with its source distribution
+        points : array of shape (m, 3)
+            coordinates of the points
+        velocity : bool, optional
+            if True, the velocity is also computed (default: False)
+        memory_budget : int, optional
+            memory in bytes of the matrices of all the chunks evaluated at the same time (default: 256 MB)
+        chunk_size : int, optional
+            number of points per chunk (default: deduced from the memory budget)
+        n_workers : int, optional
+            number of chunks evaluated in parallel (default: 1)
+        use_processes : bool, optional
+            if True, the chunks are evaluated in a pool of processes instead of a pool of threads
+        n_threads_per_worker : int, optional
+            number of OpenMP threads of each worker (default: number of cpu divided by n_workers)
+        Returns
+        -------
+        tuple of an array of shape (m,) and an array of shape (m, 3) or None
+            the potential and the velocity at the points
+        Raises
+        ------
+        Exception: if the :code:`Result` object given as input does not contain the source distribution.
+        """
+        self._check_sources(result)
+        return field_points.evaluate_field_in_chunks(
+            self.green_function, result.body.mesh, result.sources, points,
+            result.free_surface, result.sea_bottom, result.wavenumber,
+            velocity=velocity, memory_budget=memory_budget, chunk_size=chunk_size,
+            n_workers=n_workers, use_processes=use_processes, n_threads_per_worker=n_threads_per_worker,
+        )
 
-        return phi
+    def get_pressure_at_points(self, result, points, **kwargs):
+        """Compute the dynamic pressure :math:`i \\omega \\rho \\phi` at arbitrary points for a previously
+        solved problem. The keyword arguments are passed to :meth:`get_field_at_points`."""
+        phi, _ = self.get_field_at_points(result, points, **kwargs)
+        return 1j*result.omega*result.rho*phi
+
+    @staticmethod
+    def _check_sources(result):
+        if result.sources is None:
+            raise Exception(f"""The values of the sources of {result} cannot been found.
+            They probably have not been stored by the solver because the option keep_details=True have not been set.
+            Please re-run the resolution with this option.""")
 
     def get_free_surface_elevation(self, result, free_surface, keep_details=False):
         """Compute the elevation of the free surface on a mesh for a previously solved problem.
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Block matrices with a Toeplitz structure, such as the influence matrices of meshes with symmetries.
+
+Only the first row of blocks is stored. The blocks can be numpy arrays or themselves block matrices,
+for instance for a mesh with two planes of symmetry.
+"""
+
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+
+class BlockSymmetricToeplitzMatrix:
+    r"""Block matrix whose block (i, j) only depends on :math:`|i - j|`.
+
+    For a mesh with a plane of symmetry, stored as a half and its mirror image, the influence matrices read
+
+    .. math::
+        \begin{pmatrix} A_1 & A_2 \\ A_2 & A_1 \end{pmatrix}
+
+    Parameters
+    ----------
+    blocks: list containing a single list of matrices
+        the first row of blocks of the matrix, all with the same shape
+    """
+
+    ndim = 2
+
+    def __init__(self, blocks):
+        assert len(blocks) == 1, "Only the first row of blocks should be given."
+        self._stored_blocks = np.empty((1, len(blocks[0])), dtype=object)
+        for j, block in enumerate(blocks[0]):
+            self._stored_blocks[0, j] = block
+        assert all(block.shape == self.block_shape for block in self._stored_blocks[0, :])
+
+    @property
+    def nb_blocks(self):
+        n = self._stored_blocks.shape[1]
+        return n, n
+
+    @property
+    def block_shape(self):
+        return self._stored_blocks[0, 0].shape
+
+    @property
+    def shape(self):
+        return self.nb_blocks[0]*self.block_shape[0], self.nb_blocks[1]*self.block_shape[1]
+
+    @property
+    def dtype(self):
+        return np.result_type(*(block.dtype for block in self._stored_blocks[0, :]))
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self._stored_blocks[0, :])
+
+    def _block(self, i, j):
+        return self._stored_blocks[0, abs(i - j)]
+
+    def __add__(self, other):
+        if isinstance(other, BlockSymmetricToeplitzMatrix) and other.nb_blocks == self.nb_blocks:
+            return BlockSymmetricToeplitzMatrix([[a + b for a, b in zip(self._stored_blocks[0, :], other._stored_blocks[0, :])]])
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, BlockSymmetricToeplitzMatrix) and other.nb_blocks == self.nb_blocks:
+            return BlockSymmetricToeplitzMatrix([[a - b for a, b in zip(self._stored_blocks[0, :], other._stored_blocks[0, :])]])
+        return NotImplemented
+
+    def __matmul__(self, other):
+        other = np.asarray(other)
+        n = self.nb_blocks[0]
+        block_size = self.block_shape[1]
+        parts = [other[j*block_size:(j+1)*block_size] for j in range(n)]
+        products = {}  # The product of a stored block with a part of the vector is computed only once.
+        for i in range(n):
+            for j in range(n):
+                if (abs(i - j), j) not in products:
+                    products[abs(i - j), j] = self._block(i, j) @ parts[j]
+        return np.concatenate([sum(products[abs(i - j), j] for j in range(n)) for i in range(n)])
+
+    def matvec(self, x):
+        return self @ x
+
+    def full_matrix(self):
+        n = self.nb_blocks[0]
+        return np.block([[_full_matrix(self._block(i, j)) for j in range(n)] for i in range(n)])
+
+    def __str__(self):
+        return f"BlockSymmetricToeplitzMatrix(nb_blocks={self.nb_blocks}, block_shape={self.block_shape})"
+
+
+class BlockCirculantMatrix:
+    r"""Block matrix whose block (i, j) only depends on :math:`(j - i)` modulo the number of blocks.
+
+    For a mesh made of :math:`n` rotated copies of an angular sector, the influence matrices read
+
+    .. math::
+        \begin{pmatrix}
+            C_0 & C_1 & \cdots & C_{n-1} \\
+            C_{n-1} & C_0 & \cdots & C_{n-2} \\
+            \vdots & & \ddots & \vdots \\
+            C_1 & C_2 & \cdots & C_0
+        \end{pmatrix}
+
+    They are block-diagonalized by the discrete Fourier transform, see :meth:`block_diagonalize`.
+
+    Parameters
+    ----------
+    blocks: list containing a single list of matrices
+        the first row of blocks of the matrix, all with the same shape
+    """
+
+    ndim = 2
+
+    def __init__(self, blocks):
+        assert len(blocks) == 1, "Only the first row of blocks should be given."
+        self._stored_blocks = np.empty((1, len(blocks[0])), dtype=object)
+        for j, block in enumerate(blocks[0]):
+            self._stored_blocks[0, j] = block
+        assert all(block.shape == self.block_shape for block in self._stored_blocks[0, :])
+        self._diagonalization = None
+
+    @property
+    def nb_blocks(self):
+        n = self._stored_blocks.shape[1]
+        return n, n
+
+    @property
+    def block_shape(self):
+        return self._stored_blocks[0, 0].shape
+
+    @property
+    def shape(self):
+        return self.nb_blocks[0]*self.block_shape[0], self.nb_blocks[1]*self.block_shape[1]
+
+    @property
+    def dtype(self):
+        return np.result_type(*(block.dtype for block in self._stored_blocks[0, :]))
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self._stored_blocks[0, :])
+
+    def _block(self, i, j):
+        return self._stored_blocks[0, (j - i) % self.nb_blocks[0]]
+
+    def block_diagonalize(self):
+        r"""The blocks :math:`\Lambda_k = \sum_m C_m e^{2 i \pi m k/n}` such that, with :math:`\hat{x}` the
+        discrete Fourier transform (:code:`np.fft.fft`) of the vector of blocks :math:`x`,
+        :math:`\widehat{(A x)}_k = \Lambda_k \hat{x}_k`.
+
+        Returns
+        -------
+        array of shape (n, block_shape[0], block_shape[1])
+        """
+        if self._diagonalization is None:
+            stored_blocks = np.stack([_full_matrix(block) for block in self._stored_blocks[0, :]])
+            self._diagonalization = self.nb_blocks[0]*np.fft.ifft(stored_blocks, axis=0)
+        return self._diagonalization
+
+    def __matmul__(self, other):
+        other = np.asarray(other)
+        n = self.nb_blocks[0]
+        fft_of_other = np.fft.fft(other.reshape((n, self.block_shape[1], -1)), axis=0)
+        result = np.fft.ifft(self.block_diagonalize() @ fft_of_other, axis=0)
+        return result.reshape((self.shape[0],) + other.shape[1:])
+
+    def matvec(self, x):
+        return self @ x
+
+    def full_matrix(self):
+        n = self.nb_blocks[0]
+        return np.block([[_full_matrix(self._block(i, j)) for j in range(n)] for i in range(n)])
+
+    def __str__(self):
+        return f"BlockCirculantMatrix(nb_blocks={self.nb_blocks}, block_shape={self.block_shape})"
+
+
+def _full_matrix(block):
+    return block if isinstance(block, np.ndarray) else block.full_matrix()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Evaluation of the potential and of the velocity of a solved problem at arbitrary points.
+
+The field at the points is the product of the influence matrix of the source panels on the points
+(and of its gradient for the velocity) with the source distribution of the problem. For large grids of points,
+the matrices would not fit in memory: the points are split in chunks whose matrices fit in a given memory budget,
+and the chunks are evaluated one after the other, in a pool of threads or in a pool of processes.
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from litebem.solver import linear_solvers
+from litebem.solver.parallel import share_objects, load_shared_objects, _environment
+
+LOG = logging.getLogger(__name__)
+
+# Memory used by a pool of workers, unless another budget is given.
+DEFAULT_MEMORY_BUDGET = 2**28  # 256 MB
+
+_worker = {}
+
+
+def chunk_size_for_memory_budget(nb_panels, velocity=False, memory_budget=DEFAULT_MEMORY_BUDGET, n_workers=1):
+    """Number of points per chunk such that the matrices of the chunks evaluated at the same time
+    by n_workers fit in the memory budget (in bytes)."""
+    bytes_per_point = nb_panels*np.dtype(np.complex128).itemsize*(4 if velocity else 1)
+    return max(1, int(memory_budget // (n_workers*bytes_per_point)))
+
+
+def evaluate_field(green_function, mesh, sources, points, free_surface, sea_bottom, wavenumber,
+                   velocity=False, n_threads=None):
+    """Potential (and velocity) at some points of the field of a source distribution on a mesh.
+
+    Parameters
+    ----------
+    green_function: Delhommeau
+    mesh: Mesh or CollectionOfMeshes
+        mesh of the body
+    sources: array of shape (mesh.nPanels,)
+        strength of the sources on the panels of the mesh
+    points: array of shape (m, 3)
+    free_surface, sea_bottom, wavenumber: float
+        see :meth:`~litebem.solver.green_functions.delhommeau.Delhommeau.evaluate`
+    velocity: bool, optional
+        if True, the velocity is also computed (default: False)
+    n_threads: int, optional
+        number of threads of the Green function
+
+    Returns
+    -------
+    array of shape (m,) and array of shape (m, 3) or None
+        the potential and the velocity at the points
+    """
+    S, V = green_function.evaluate_at_points(points, mesh, free_surface, sea_bottom, wavenumber,
+                                             gradient=velocity, n_threads=n_threads)
+    phi = linear_solvers.double_precision_matvec(S, sources)
+    if not velocity:
+        return phi, None
+    return phi, np.tensordot(V.astype(np.complex128, copy=False), sources, axes=(1, 0))
+
+
+def _initialize_worker(green_function, shared_data, parameters):
+    _worker['green_function'] = green_function
+    _worker['shared_memory'], (_worker['mesh'], _worker['sources']) = load_shared_objects(shared_data)
+    _worker['parameters'] = parameters
+
+
+def _evaluate_field_in_worker(points):
+    return evaluate_field(_worker['green_function'], _worker['mesh'], _worker['sources'], points,
+                          **_worker['parameters'])
+
+
+def evaluate_field_in_chunks(green_function, mesh, sources, points, free_surface, sea_bottom, wavenumber,
+                             velocity=False, memory_budget=DEFAULT_MEMORY_BUDGET, chunk_size=None,
+                             n_workers=1, use_processes=False, n_threads_per_worker=None):
+    """Same as :func:`evaluate_field`, chunk by chunk and possibly in parallel.
+
+    Parameters
+    ----------
+    green_function, mesh, sources, points, free_surface, sea_bottom, wavenumber, velocity:
+        see :func:`evaluate_field`
+    memory_budget: int, optional
+        memory (in bytes) of the matrices of all the chunks evaluated at the same time (default: 256 MB)
+    chunk_size: int, optional
+        number of points per chunk (default: deduced from the memory budget)
+    n_workers: int, optional
+        number of chunks evaluated at the same time (default: 1, the chunks are evaluated one after the other)
+    use_processes: bool, optional
+        if True, the chunks are evaluated in a pool of processes, otherwise in a pool of threads (default).
+        The Fortran core releases the GIL, hence threads are usually enough.
+    n_threads_per_worker: int, optional
+        number of OpenMP threads of each worker (default: number of cpu divided by n_workers)
+
+    Returns
+    -------
+    array of shape (m,) and array of shape (m, 3) or None
+        the potential and the velocity at the points
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if chunk_size is None:
+        chunk_size = chunk_size_for_memory_budget(mesh.nPanels, velocity, memory_budget, n_workers)
+    chunks = [points[i:i+chunk_size] for i in range(0, len(points), chunk_size)]
+
+    if n_workers > 1 and n_threads_per_worker is None:
+        n_threads_per_worker = max(1, (os.cpu_count() or 1) // n_workers)
+    parameters = dict(free_surface=free_surface, sea_bottom=sea_bottom, wavenumber=wavenumber,
+                      velocity=velocity, n_threads=n_threads_per_worker)
+
+    LOG.debug(f"Evaluate the field at {len(points)} points in {len(chunks)} chunks of {chunk_size} points "
+              f"with {n_workers} {'processes' if use_processes else 'threads'}.")
+
+    if n_workers <= 1 or len(chunks) <= 1:
+        fields = [evaluate_field(green_function, mesh, sources, chunk, **parameters) for chunk in chunks]
+
+    elif use_processes:
+        block, shared_data = share_objects((mesh, np.asarray(sources)))
+        try:
+            threads = {variable: n_threads_per_worker for variable in
+                       ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')}
+            with _environment(**threads), ProcessPoolExecutor(
+                    max_workers=n_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_initialize_worker,
+                    initargs=(green_function, shared_data, parameters),
+            ) as executor:
+                fields = list(executor.map(_evaluate_field_in_worker, chunks))
+        finally:
+            block.close()
+            block.unlink()
+
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            fields = list(executor.map(
+                lambda chunk: evaluate_field(green_function, mesh, sources, chunk, **parameters), chunks))
+
+    phi = np.concatenate([phi for phi, _ in fields]) if fields else np.empty((0,), dtype=np.complex128)
+    if not velocity:
+        return phi, None
+    u = np.concatenate([u for _, u in fields]) if fields else np.empty((0, 3), dtype=np.complex128)
+    return phi, u
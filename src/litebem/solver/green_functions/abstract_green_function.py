@@ -10,6 +10,6 @@ class AbstractGreenFunction(ABC):
     """Abstract method to evaluate the Green function."""
 
     @abstractmethod
-    def evaluate(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber):
+    def evaluate(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, gradient=True):
         pass
 
@@ -8,14 +8,28 @@ import logging
 from functools import lru_cache
 
 import numpy as np
-
-# from capytaine.tools.prony_decomposition import exponential_decomposition, error_exponential_decomposition
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
 
 from litebem.solver.green_functions.abstract_green_function import AbstractGreenFunction
 import litebem.solver.green_functions.delhommeau_f90 as delhommeau_f90
+from litebem.solver.green_functions.tabulation import load_tabulated_integrals, MIN_GRID_SHAPE, MAX_NB_POINTS_Z
+from litebem.solver.green_functions.prony_decomposition import (PRONY_DECOMPOSITION_METHODS,
+                                                                load_exponential_decomposition)
+from litebem.preprocessing.mesh import QUADRATURE_METHODS
 
 LOG = logging.getLogger(__name__)
 
+# Memory used by the matrices computed at once by Delhommeau.evaluate_multiple_wavenumbers, unless another budget is given.
+MULTIPLE_WAVENUMBERS_MEMORY_BUDGET = 2**28  # 256 MB
+
+
+def wavenumber_block_size(nb_panels1, nb_panels2, memory_budget=MULTIPLE_WAVENUMBERS_MEMORY_BUDGET):
+    """Number of wavenumbers whose matrices S and K, in double precision as returned by the Fortran core,
+    fit in the memory budget (in bytes)."""
+    bytes_per_wavenumber = 2*nb_panels1*nb_panels2*np.dtype(np.complex128).itemsize
+    return max(1, int(memory_budget // bytes_per_wavenumber))
+
 
 class Delhommeau(AbstractGreenFunction):
     """The Green function as implemented in Nemoh.
@@ -25,10 +39,45 @@ class Delhommeau(AbstractGreenFunction):
     tabulation_nb_integration_points: int, optional
         Number of points for the evaluation of the tabulated elementary integrals w.r.t. :math:`theta`
         used for the computation of the Green function (default: 251)
+    tabulation_grid_shape: tuple of two ints, optional
+        Number of points of the tabulation along the dimensionless horizontal distance and along the
+        dimensionless vertical coordinate (default: (328, 46)).
+        The points of the axes do not depend on the size of the grid, and the default grid is the smallest one
+        that reaches the domain of validity of the asymptotic approximations used beyond the tabulation.
+        A longer horizontal axis extends the range of distances covered by the tabulation, while the vertical
+        axis is bounded and does not gain anything beyond 46 points.
+    tabulation_cache_dir: str, optional
+        Directory in which the tabulation and the Prony decompositions of the finite depth Green function
+        are stored to be shared between processes and runs, see :mod:`litebem.solver.green_functions.tabulation`
+        and :mod:`litebem.solver.green_functions.prony_decomposition` (default: :code:`~/.cache/litebem`).
     finite_depth_prony_decomposition_method: string, optional
         The implementation of the Prony decomposition used to compute the finite depth Green function.
         Accepted values: :code:`'fortran'` for Nemoh's implementation (by default), :code:`'python'` for an experimental Python implementation.
         See :func:`find_best_exponential_decomposition`.
+    floating_point_precision: string, optional
+        Precision of the returned matrices: :code:`'float64'` (by default) for complex128 matrices
+        or :code:`'float32'` for complex64 matrices, that use half as much memory and can be solved faster
+        (see the iterative refinement in :mod:`litebem.solver.linear_solvers`).
+        The Green function itself is always evaluated in double precision by the Fortran core.
+    rankine_asymptotic_ratio: float, optional
+        The integral of the Rankine part over a source panel is replaced by its asymptotic approximation
+        (a point source at the center of the panel) when the distance between the centers of the two panels
+        is larger than :code:`rankine_asymptotic_ratio` times the radius of the source panel (default: 7.0).
+        Use :code:`np.inf` to always compute the exact integral, and see :meth:`rankine_asymptotic_accuracy`.
+    near_field_quadrature: string, optional
+        Quadrature rule used to integrate the wave part of the Green function over the source panels close to
+        the image of the receiving point through the free surface, where the wave part is nearly singular,
+        see :meth:`litebem.preprocessing.mesh.Mesh.quadrature_points` (e.g. :code:`'gauss_legendre_2'`).
+        The other pairs of panels use a single point at the center of the panel.
+        By default, the single point is used for all pairs of panels.
+    near_field_ratio: float, optional
+        A pair of panels uses the near field quadrature when the distance between the center of the receiving
+        panel and the image of the center of the source panel is smaller than :code:`near_field_ratio` times
+        the radius of the source panel (default: 3.0).
+    n_threads: int, optional
+        Number of OpenMP threads used by the Fortran core to assemble the matrices of this Green function.
+        By default, the OpenMP default is used, that is usually the value of the environment variable
+        :code:`OMP_NUM_THREADS` or the number of cpu.
 
     Attributes
     ----------
@@ -38,38 +87,98 @@ class Delhommeau(AbstractGreenFunction):
 
     fortran_core = delhommeau_f90
 
-    build_tabulated_integrals = lru_cache(maxsize=1)(delhommeau_f90.initialize_green_wave.initialize_tabulated_integrals)
+    build_tabulated_integrals = lru_cache(maxsize=1)(load_tabulated_integrals)
+
+    floating_point_dtypes = {'float64': np.complex128, 'float32': np.complex64}
 
     def __init__(self, *,
                  tabulation_nb_integration_points=251,
+                 tabulation_grid_shape=(328, 46),
+                 tabulation_cache_dir=None,
                  finite_depth_prony_decomposition_method='fortran',
+                 floating_point_precision='float64',
+                 rankine_asymptotic_ratio=7.0,
+                 near_field_quadrature=None,
+                 near_field_ratio=3.0,
+                 n_threads=None,
                  ):
 
-        self.tabulated_integrals = self.__class__.build_tabulated_integrals(328, 46, tabulation_nb_integration_points)
-
+        self._init_parameters = dict(tabulation_nb_integration_points=tabulation_nb_integration_points,
+                                     tabulation_grid_shape=tabulation_grid_shape,
+                                     tabulation_cache_dir=tabulation_cache_dir,
+                                     finite_depth_prony_decomposition_method=finite_depth_prony_decomposition_method,
+                                     floating_point_precision=floating_point_precision,
+                                     rankine_asymptotic_ratio=rankine_asymptotic_ratio,
+                                     near_field_quadrature=near_field_quadrature,
+                                     near_field_ratio=near_field_ratio,
+                                     n_threads=n_threads)
+
+        if floating_point_precision not in self.floating_point_dtypes:
+            raise ValueError(f"Unrecognized floating point precision: {floating_point_precision}. "
+                             f"Accepted values: {list(self.floating_point_dtypes)}.")
+        self.floating_point_precision = floating_point_precision
+        self.dtype = self.floating_point_dtypes[floating_point_precision]
+
+        if not rankine_asymptotic_ratio > 0.0:
+            raise ValueError(f"The Rankine asymptotic ratio should be positive, not {rankine_asymptotic_ratio}.")
+        self.rankine_asymptotic_ratio = rankine_asymptotic_ratio
+
+        if near_field_quadrature is not None and near_field_quadrature not in QUADRATURE_METHODS:
+            raise ValueError(f"Unrecognized quadrature method: {near_field_quadrature}. "
+                             f"Accepted values: {list(QUADRATURE_METHODS)}.")
+        self.near_field_quadrature = near_field_quadrature
+        self.near_field_ratio = near_field_ratio
+
+        if n_threads is not None and n_threads < 1:
+            raise ValueError(f"The number of threads should be a positive integer, not {n_threads}.")
+        self.n_threads = n_threads
+
+        nb_points_r, nb_points_z = tabulation_grid_shape
+        if nb_points_r < MIN_GRID_SHAPE[0] or nb_points_z < MIN_GRID_SHAPE[1]:
+            raise ValueError(f"The tabulation grid should have at least {MIN_GRID_SHAPE} points, "
+                             f"not {tabulation_grid_shape}: the Green function would be inaccurate beyond a smaller grid.")
+        if nb_points_z > MAX_NB_POINTS_Z:
+            LOG.warning(f"The tabulation grid has {nb_points_z} points along Z, "
+                        f"but the points beyond the first {MAX_NB_POINTS_Z} are not used.")
+        self.tabulated_integrals = self.__class__.build_tabulated_integrals(
+            nb_points_r, nb_points_z, tabulation_nb_integration_points, tabulation_cache_dir)
+
+        if finite_depth_prony_decomposition_method.lower() not in PRONY_DECOMPOSITION_METHODS:
+            raise ValueError("Unrecognized method name for the Prony decomposition.")
         self.finite_depth_prony_decomposition_method = finite_depth_prony_decomposition_method
+        self.tabulation_cache_dir = tabulation_cache_dir
 
         self.exportable_settings = {
             'green_function': self.__class__.__name__,
             'tabulation_nb_integration_points': tabulation_nb_integration_points,
+            'tabulation_grid_shape': tuple(tabulation_grid_shape),
             'finite_depth_prony_decomposition_method': finite_depth_prony_decomposition_method,
+            'floating_point_precision': floating_point_precision,
+            'rankine_asymptotic_ratio': rankine_asymptotic_ratio,
         }
+        if near_field_quadrature is not None:
+            self.exportable_settings['near_field_quadrature'] = near_field_quadrature
+            self.exportable_settings['near_field_ratio'] = near_field_ratio
 
         self._hash = hash(self.exportable_settings.values())
 
     def __hash__(self):
         return self._hash
 
-    @lru_cache(maxsize=128)
-    def find_best_exponential_decomposition(self, dimensionless_omega, dimensionless_wavenumber):
-        """Compute the decomposition of a part of the finite depth Green function as a sum of exponential functions.
+    def __getstate__(self):
+        # The tabulation is not copied (e.g. when the Green function is sent to another process):
+        # it is loaded again from its file, that is shared between all the processes.
+        return self._init_parameters
+
+    def __setstate__(self, state):
+        self.__init__(**state)
 
-        Two implementations are available: the legacy Fortran implementation from Nemoh and a newer one written in Python.
-        For some still unexplained reasons, the two implementations do not always give the exact same result.
-        Until the problem is better understood, the Fortran implementation is the default one, to ensure consistency with Nemoh.
-        The Fortran version is also significantly faster...
+    def find_best_exponential_decomposition(self, dimensionless_omega, dimensionless_wavenumber):
+        """Compute the decomposition of a part of the finite depth Green function as a sum of exponential functions,
+        with the implementation given by :code:`finite_depth_prony_decomposition_method`.
 
-        Results are cached.
+        Results are cached in memory and on disk, such that they are reused by the following runs,
+        see :func:`litebem.solver.green_functions.prony_decomposition.load_exponential_decomposition`.
 
         Parameters
         ----------
@@ -77,59 +186,73 @@ class Delhommeau(AbstractGreenFunction):
             dimensionless angular frequency: :math:`kh \\tanh (kh) = \\omega^2 h/g`
         dimensionless_wavenumber: float
             dimensionless wavenumber: :math:`kh`
-        method: string, optional
-            the implementation that should be used to compute the Prony decomposition
 
         Returns
         -------
         Tuple[np.ndarray, np.ndarray]
             the amplitude and growth rates of the exponentials
         """
+        return load_exponential_decomposition(float(dimensionless_omega), float(dimensionless_wavenumber),
+                                              self.finite_depth_prony_decomposition_method.lower(),
+                                              self.tabulation_cache_dir)
 
-        LOG.debug(f"\tCompute Prony decomposition in finite depth Green function "
-                  f"for dimless_omega=%.2e and dimless_wavenumber=%.2e",
-                  dimensionless_omega, dimensionless_wavenumber)
+    def _green_function_parameters(self, free_surface, sea_bottom, wavenumber):
+        """Coefficients of the three parts of the Green function (Rankine, reflected Rankine and wave part)
+        and Prony decomposition for the finite depth case.
 
-        if self.finite_depth_prony_decomposition_method.lower() == 'python':
-            # The function that will be approximated.
-            @np.vectorize
-            def f(x):
-                return delhommeau_f90.initialize_green_wave.ff(x, dimensionless_omega, dimensionless_wavenumber)
+        Returns
+        -------
+        tuple
+            the depth, the array of the three coefficients, and the amplitudes and growth rates of the exponentials
+        """
+        depth = free_surface - sea_bottom
+        if free_surface == np.infty: # No free surface, only a single Rankine source term
 
-            # Try different increasing number of exponentials
-            for n_exp in range(4, 31, 2):
+            a_exp, lamda_exp = np.empty(1), np.empty(1)  # Dummy arrays that won't actually be used by the fortran code.
 
-                # The coefficients are computed on a resolution of 4*n_exp+1 ...
-                X = np.linspace(-0.1, 20.0, 4*n_exp+1)
-                a, lamda = exponential_decomposition(X, f(X), n_exp)
+            coeffs = np.array((1.0, 0.0, 0.0))
 
-                # ... and they are evaluated on a finer discretization.
-                X = np.linspace(-0.1, 20.0, 8*n_exp+1)
-                if error_exponential_decomposition(X, f(X), a, lamda) < 1e-4:
-                    break
+        elif depth == np.infty:
 
+            a_exp, lamda_exp = np.empty(1), np.empty(1)  # Idem
+
+            if wavenumber == 0.0:
+                coeffs = np.array((1.0, 1.0, 0.0))
+            elif wavenumber == np.infty:
+                coeffs = np.array((1.0, -1.0, 0.0))
+            else:
+                coeffs = np.array((1.0, -1.0, 1.0))
+
+        else:  # Finite depth
+            a_exp, lamda_exp = self.find_best_exponential_decomposition(
+                wavenumber*depth*np.tanh(wavenumber*depth),
+                wavenumber*depth,
+            )
+            if wavenumber == 0.0:
+                raise NotImplementedError
+            elif wavenumber == np.infty:
+                raise NotImplementedError
             else:
-                LOG.warning("No suitable exponential decomposition has been found"
-                            "for dimless_omega=%.2e and dimless_wavenumber=%.2e",
-                            dimensionless_omega, dimensionless_wavenumber)
+                coeffs = np.array((1.0, 1.0, 1.0))
 
-        elif self.finite_depth_prony_decomposition_method.lower() == 'fortran':
-            lamda, a, nexp = delhommeau_f90.old_prony_decomposition.lisc(dimensionless_omega, dimensionless_wavenumber)
-            lamda = lamda[:nexp]
-            a = a[:nexp]
+        return depth, coeffs, a_exp, lamda_exp
 
-        else:
-            raise ValueError("Unrecognized method name for the Prony decomposition.")
+    def rankine_coefficients(self, free_surface=0.0, sea_bottom=-np.infty, wavenumber=1.0):
+        """Coefficients of the Rankine and reflected Rankine parts of the Green function.
 
-        # Add one more exponential function (actually a constant).
-        # It is not clear where it comes from exactly in the theory...
-        a = np.concatenate([a, np.array([2])])
-        lamda = np.concatenate([lamda, np.array([0.0])])
+        These two parts do not depend on the wavenumber, except through these coefficients.
+        They can thus be used with the mesh and the depth to identify a Rankine part that can be reused.
 
-        return a, lamda
+        Returns
+        -------
+        tuple of two floats
+        """
+        _, coeffs, _, _ = self._green_function_parameters(free_surface, sea_bottom, wavenumber)
+        return tuple(coeffs[:2])
 
-    def evaluate(self, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, wavenumber=1.0):
-        r"""The main method of the class, called by the engine to assemble the influence matrices.
+    def evaluate_rankine_part(self, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, rankine_coefficients=(1.0, -1.0)):
+        r"""Assemble only the frequency-independent part of the influence matrices,
+        that is the Rankine and reflected Rankine terms.
 
         Parameters
         ----------
@@ -141,48 +264,161 @@ class Delhommeau(AbstractGreenFunction):
             position of the free surface (default: :math:`z = 0`)
         sea_bottom: float, optional
             position of the sea bottom (default: :math:`z = -\infty`)
-        wavenumber: float, optional
-            wavenumber (default: 1.0)
+        rankine_coefficients: tuple of two floats, optional
+            coefficients of the Rankine and reflected Rankine terms, as returned by :meth:`rankine_coefficients`
 
         Returns
         -------
-        tuple of numpy arrays
-            the matrices :math:`S` and :math:`K`
+        tuple of Fortran-ordered numpy arrays
+            the Rankine part of the matrices :math:`S` and :math:`K`
+            (including the diagonal term of :math:`K` when mesh1 is mesh2),
+            with the floating point precision of the Green function
         """
-
         depth = free_surface - sea_bottom
-        if free_surface == np.infty: # No free surface, only a single Rankine source term
+        a_exp, lamda_exp = np.empty(1), np.empty(1)  # Dummy arrays that won't actually be used by the fortran code.
+        coeffs = np.array((*rankine_coefficients, 0.0))
 
-            a_exp, lamda_exp = np.empty(1), np.empty(1)  # Dummy arrays that won't actually be used by the fortran code.
+        S, K = self.fortran_core.matrices.build_matrices(
+            mesh1.panelCenters, mesh1.panelUnitNormals,
+            mesh2.vertices,      mesh2.panels,
+            mesh2.panelCenters, mesh2.panelUnitNormals,
+            mesh2.panelAreas,   mesh2.panelRadii,
+            *mesh2.quadraturePoints,
+            0.0, 0.0 if depth == np.infty else depth,
+            coeffs,
+            *self.tabulated_integrals,
+            lamda_exp, a_exp,
+            mesh1 is mesh2,
+            rankine_asymptotic_ratio=self.rankine_asymptotic_ratio,
+            nb_threads=self._nb_threads,
+        )
+        return self._with_precision(S), self._with_precision(K)
 
-            coeffs = np.array((1.0, 0.0, 0.0))
+    def rankine_asymptotic_accuracy(self, mesh1, mesh2, ratios=(3.0, 5.0, 7.0, 10.0)):
+        """Accuracy of the asymptotic approximation of the Rankine part for distant pairs of panels,
+        to choose :code:`rankine_asymptotic_ratio` for a given mesh.
 
-        elif depth == np.infty:
+        The Rankine term (without its reflection) is assembled with the exact integral for all pairs of panels,
+        and compared with its assembly using the asymptotic approximation beyond each of the ratios.
 
-            a_exp, lamda_exp = np.empty(1), np.empty(1)  # Idem
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        ratios: list of floats, optional
+            values of :code:`rankine_asymptotic_ratio` to be tested
 
-            if wavenumber == 0.0:
-                coeffs = np.array((1.0, 1.0, 0.0))
-            elif wavenumber == np.infty:
-                coeffs = np.array((1.0, -1.0, 0.0))
-            else:
-                coeffs = np.array((1.0, -1.0, 1.0))
+        Returns
+        -------
+        list of dict
+            for each ratio, the fraction of the pairs of panels using the asymptotic approximation
+            (:code:`'far_field_fraction'`), the relative errors on the matrices S and K in Frobenius norm
+            (:code:`'S_error'` and :code:`'K_error'`) and the largest error on a coefficient relative to the largest
+            coefficient (:code:`'S_max_error'` and :code:`'K_max_error'`)
+        """
+        def rankine_part(ratio):
+            return self.fortran_core.matrices.build_matrices(
+                mesh1.panelCenters, mesh1.panelUnitNormals,
+                mesh2.vertices,      mesh2.panels,
+                mesh2.panelCenters, mesh2.panelUnitNormals,
+                mesh2.panelAreas,   mesh2.panelRadii,
+                *mesh2.quadraturePoints,
+                0.0, 0.0,
+                np.array((1.0, 0.0, 0.0)),
+                *self.tabulated_integrals,
+                np.empty(1), np.empty(1),
+                mesh1 is mesh2,
+                rankine_asymptotic_ratio=ratio,
+                nb_threads=self._nb_threads,
+            )
 
-        else:  # Finite depth
-            a_exp, lamda_exp = self.find_best_exponential_decomposition(
-                wavenumber*depth*np.tanh(wavenumber*depth),
-                wavenumber*depth,
+        SExact, KExact = rankine_part(np.inf)
+        distance_ratios = cdist(mesh1.panelCenters, mesh2.panelCenters)/mesh2.panelRadii[None, :]
+
+        report = []
+        for ratio in ratios:
+            S, K = rankine_part(ratio)
+            report.append({
+                'ratio': ratio,
+                'far_field_fraction': np.count_nonzero(distance_ratios > ratio)/distance_ratios.size,
+                'S_error': np.linalg.norm(S - SExact)/np.linalg.norm(SExact),
+                'K_error': np.linalg.norm(K - KExact)/np.linalg.norm(KExact),
+                'S_max_error': np.abs(S - SExact).max()/np.abs(SExact).max(),
+                'K_max_error': np.abs(K - KExact).max()/np.abs(KExact).max(),
+            })
+            LOG.info("Rankine asymptotic ratio %.1f: %.1f%% of the pairs of panels in the far field, "
+                     "relative errors %.1e on S and %.1e on K.",
+                     ratio, 100*report[-1]['far_field_fraction'], report[-1]['S_error'], report[-1]['K_error'])
+        return report
+
+    def add_wave_part(self, S, K, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, wavenumber=1.0):
+        r"""Add in place the frequency-dependent wave part of the Green function to the matrices S and K.
+
+        Parameters
+        ----------
+        S, K: Fortran-ordered numpy arrays of complex128
+            the matrices to be completed, typically a copy of the output of :meth:`evaluate_rankine_part`
+            (converted to complex128 if the Green function is in single precision)
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float, optional
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float, optional
+            position of the sea bottom (default: :math:`z = -\infty`)
+        wavenumber: float, optional
+            wavenumber (default: 1.0)
+        """
+        depth, coeffs, a_exp, lamda_exp = self._green_function_parameters(free_surface, sea_bottom, wavenumber)
+
+        if coeffs[2] != 0.0:
+            self.fortran_core.matrices.add_wave_part_to_the_matrices(
+                mesh1.panelCenters, mesh1.panelUnitNormals,
+                *mesh2.quadraturePoints,
+                wavenumber, 0.0 if depth == np.infty else depth,
+                *self.tabulated_integrals,
+                lamda_exp, a_exp,
+                coeffs[2],
+                mesh1 is mesh2,
+                S, K,
+                nb_threads=self._nb_threads,
             )
-            if wavenumber == 0.0:
-                raise NotImplementedError
-            elif wavenumber == np.infty:
-                raise NotImplementedError
-            else:
-                coeffs = np.array((1.0, 1.0, 1.0))
+            self._add_near_field_correction(S, K, mesh1.panelCenters, mesh1.panelUnitNormals, mesh2,
+                                            depth, wavenumber, coeffs[2], a_exp, lamda_exp)
+
+    def evaluate(self, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, wavenumber=1.0, gradient=True):
+        r"""The main method of the class, called by the engine to assemble the influence matrices.
+
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float, optional
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float, optional
+            position of the sea bottom (default: :math:`z = -\infty`)
+        wavenumber: float, optional
+            wavenumber (default: 1.0)
+        gradient: bool, optional
+            if False, only the matrix :math:`S` is computed, for roughly half the cost, and None is returned
+            instead of the matrix :math:`K` (default: True)
+
+        Returns
+        -------
+        tuple of numpy arrays
+            the matrices :math:`S` and :math:`K`, with the floating point precision of the Green function
+        """
+
+        depth, coeffs, a_exp, lamda_exp = self._green_function_parameters(free_surface, sea_bottom, wavenumber)
 
         # Main call to Fortran code
         # TODO confirm that we dont need to add 1 to mesh panels because our definitions start at 1 already
-        return self.fortran_core.matrices.build_matrices(
+        S, K = self.fortran_core.matrices.build_matrices(
             mesh1.panelCenters, mesh1.panelUnitNormals,
             mesh2.vertices,      mesh2.panels,
             mesh2.panelCenters, mesh2.panelUnitNormals,
@@ -192,5 +428,231 @@ class Delhommeau(AbstractGreenFunction):
             coeffs,
             *self.tabulated_integrals,
             lamda_exp, a_exp,
-            mesh1 is mesh2
+            mesh1 is mesh2,
+            rankine_asymptotic_ratio=self.rankine_asymptotic_ratio,
+            nb_threads=self._nb_threads,
+            gradient=gradient,
         )
+        # Without gradient, K is an empty array, that is also understood as such by the near field correction.
+        self._add_near_field_correction(S, K, mesh1.panelCenters, mesh1.panelUnitNormals, mesh2,
+                                        depth, wavenumber, coeffs[2], a_exp, lamda_exp)
+        if not gradient:
+            return self._with_precision(S), None
+        return self._with_precision(S), self._with_precision(K)
+
+    def evaluate_at_points(self, points, mesh, free_surface=0.0, sea_bottom=-np.infty, wavenumber=1.0,
+                           gradient=False, n_threads=None):
+        r"""Evaluate the influence of the panels of a mesh on arbitrary points, e.g. to reconstruct a wave field.
+
+        Parameters
+        ----------
+        points: array of shape (m, 3)
+            coordinates of the points
+        mesh: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface, sea_bottom, wavenumber: float, optional
+            see :meth:`evaluate`
+        gradient: bool, optional
+            if True, the gradient of :math:`S` with respect to the coordinates of the points is also computed
+            (default: False)
+        n_threads: int, optional
+            number of threads of this evaluation (default: the :code:`n_threads` of the Green function)
+
+        Returns
+        -------
+        tuple of numpy arrays
+            the matrix :math:`S` of shape (m, n) and its gradient of shape (m, n, 3), or None if gradient is False,
+            with the floating point precision of the Green function
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        depth, coeffs, a_exp, lamda_exp = self._green_function_parameters(free_surface, sea_bottom, wavenumber)
+
+        S, V = self.fortran_core.matrices.build_field_points_matrices(
+            points,
+            mesh.vertices,      mesh.panels,
+            mesh.panelCenters, mesh.panelUnitNormals,
+            mesh.panelAreas,   mesh.panelRadii,
+            *mesh.quadraturePoints,
+            wavenumber, 0.0 if depth == np.infty else depth,
+            coeffs,
+            *self.tabulated_integrals,
+            lamda_exp, a_exp,
+            rankine_asymptotic_ratio=self.rankine_asymptotic_ratio,
+            nb_threads=self._nb_threads if n_threads is None else n_threads,
+            gradient=gradient,
+        )
+
+        # The near field correction of S and of each component of V, the latter as a derivative along an axis.
+        nb_threads = self._nb_threads if n_threads is None else n_threads
+        nothing = np.empty((0, mesh.nPanels), dtype=np.complex128, order='F')
+        self._add_near_field_correction(S, nothing, points, np.zeros_like(points), mesh,
+                                        depth, wavenumber, coeffs[2], a_exp, lamda_exp, nb_threads)
+        if not gradient:
+            return self._with_precision(S), None
+        for axis in range(3):
+            axes = np.zeros_like(points)
+            axes[:, axis] = 1.0
+            self._add_near_field_correction(nothing, V[:, :, axis], points, axes, mesh,
+                                            depth, wavenumber, coeffs[2], a_exp, lamda_exp, nb_threads)
+        return self._with_precision(S), V.astype(self.dtype, order='F', copy=False)
+
+    def evaluate_multiple_wavenumbers(self, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, wavenumbers=(1.0,),
+                                      memory_budget=MULTIPLE_WAVENUMBERS_MEMORY_BUDGET):
+        r"""Assemble the influence matrices for several wavenumbers at once, for instance for a frequency sweep.
+
+        The Rankine part of the Green function, that does not depend on the wavenumber, is computed only once
+        for each block of wavenumbers, see :meth:`evaluate_wavenumber_blocks`.
+        In infinite depth, the wave part is also computed for all the wavenumbers of a block in a single pass
+        over the pairs of panels, such that the distances between the panels are computed only once.
+        In finite depth, only the Rankine part is shared: the wave part still goes through the geometry
+        of the pairs of panels for each wavenumber.
+
+        Parameters
+        ----------
+        mesh1: Mesh or CollectionOfMeshes
+            mesh of the receiving body (where the potential is measured)
+        mesh2: Mesh or CollectionOfMeshes
+            mesh of the source body (over which the source distribution is integrated)
+        free_surface: float, optional
+            position of the free surface (default: :math:`z = 0`)
+        sea_bottom: float, optional
+            position of the sea bottom (default: :math:`z = -\infty`)
+        wavenumbers: array of floats, optional
+            wavenumbers (default: [1.0])
+        memory_budget: int, optional
+            memory (in bytes) of the double precision matrices computed at once by the Fortran core (default: 256 MB).
+            The returned matrices are filled block by block of wavenumbers.
+
+        Returns
+        -------
+        tuple of two arrays of shape (len(wavenumbers), mesh1.nPanels, mesh2.nPanels)
+            the matrices :math:`S` and :math:`K` for each wavenumber, with the floating point precision of the Green function.
+            Each matrix :code:`S[i]` and :code:`K[i]` is Fortran-ordered.
+        """
+        wavenumbers = np.asarray(wavenumbers, dtype=np.float64).ravel()
+        S = np.empty((mesh1.nPanels, mesh2.nPanels, len(wavenumbers)), dtype=self.dtype, order='F')
+        K = np.empty((mesh1.nPanels, mesh2.nPanels, len(wavenumbers)), dtype=self.dtype, order='F')
+        for indices, S_block, K_block in self.evaluate_wavenumber_blocks(mesh1, mesh2, free_surface, sea_bottom,
+                                                                          wavenumbers, memory_budget):
+            S[:, :, indices], K[:, :, indices] = np.moveaxis(S_block, 0, 2), np.moveaxis(K_block, 0, 2)
+        return np.moveaxis(S, 2, 0), np.moveaxis(K, 2, 0)
+
+    def evaluate_wavenumber_blocks(self, mesh1, mesh2, free_surface=0.0, sea_bottom=-np.infty, wavenumbers=(1.0,),
+                                   memory_budget=MULTIPLE_WAVENUMBERS_MEMORY_BUDGET):
+        r"""Same as :meth:`evaluate_multiple_wavenumbers`, but yielding the matrices block by block of wavenumbers,
+        such that only the matrices of a single block are in memory at once.
+
+        Parameters
+        ----------
+        mesh1, mesh2, free_surface, sea_bottom, wavenumbers, memory_budget:
+            see :meth:`evaluate_multiple_wavenumbers`
+
+        Yields
+        ------
+        list of int, and two arrays of shape (len(indices), mesh1.nPanels, mesh2.nPanels)
+            the indices of the wavenumbers of the block in :code:`wavenumbers` and their matrices :math:`S` and :math:`K`
+        """
+        wavenumbers = np.asarray(wavenumbers, dtype=np.float64).ravel()
+        block_size = wavenumber_block_size(mesh1.nPanels, mesh2.nPanels, memory_budget)
+
+        # The wavenumbers are grouped by coefficients of the three parts of the Green function,
+        # which only differ for the limit cases of zero or infinite wavenumbers.
+        groups = {}
+        for i, wavenumber in enumerate(wavenumbers):
+            depth, coeffs, a_exp, lamda_exp = self._green_function_parameters(free_surface, sea_bottom, wavenumber)
+            groups.setdefault(tuple(coeffs), []).append((i, a_exp, lamda_exp))
+
+        for coeffs, group in groups.items():
+            for start in range(0, len(group), block_size):
+                block = group[start:start+block_size]
+                indices = [i for i, _, _ in block]
+                LOG.debug(f"Build matrices for {mesh1.name} and {mesh2.name} for {len(indices)} wavenumbers at once.")
+                S, K = self._build_matrices_multiple_wavenumbers(mesh1, mesh2, depth, coeffs, wavenumbers[indices], block)
+                yield indices, np.moveaxis(S, 2, 0), np.moveaxis(K, 2, 0)
+
+    def _build_matrices_multiple_wavenumbers(self, mesh1, mesh2, depth, coeffs, wavenumbers, prony_decompositions):
+        """Call the Fortran core for several wavenumbers sharing the same coefficients.
+        The Prony decompositions are padded to the same number of exponentials."""
+        nb_exponentials = np.array([len(a_exp) for _, a_exp, _ in prony_decompositions], dtype=np.int32)
+        a_exp = np.zeros((nb_exponentials.max(), len(wavenumbers)), order='F')
+        lamda_exp = np.zeros((nb_exponentials.max(), len(wavenumbers)), order='F')
+        for j, (_, a, lamda) in enumerate(prony_decompositions):
+            a_exp[:len(a), j], lamda_exp[:len(lamda), j] = a, lamda
+
+        S, K = self.fortran_core.matrices.build_matrices_multiple_wavenumbers(
+            mesh1.panelCenters, mesh1.panelUnitNormals,
+            mesh2.vertices,      mesh2.panels,
+            mesh2.panelCenters, mesh2.panelUnitNormals,
+            mesh2.panelAreas,   mesh2.panelRadii,
+            *mesh2.quadraturePoints,
+            wavenumbers, 0.0 if depth == np.infty else depth,
+            np.array(coeffs),
+            *self.tabulated_integrals,
+            nb_exponentials, lamda_exp, a_exp,
+            mesh1 is mesh2,
+            rankine_asymptotic_ratio=self.rankine_asymptotic_ratio,
+            nb_threads=self._nb_threads,
+        )
+        for j, wavenumber in enumerate(wavenumbers):
+            self._add_near_field_correction(S[:, :, j], K[:, :, j], mesh1.panelCenters, mesh1.panelUnitNormals, mesh2,
+                                            depth, wavenumber, coeffs[2],
+                                            a_exp[:nb_exponentials[j], j], lamda_exp[:nb_exponentials[j], j])
+        # order='K' keeps the Fortran layout, such that each matrix of the stack stays contiguous.
+        return S.astype(self.dtype, order='K', copy=False), K.astype(self.dtype, order='K', copy=False)
+
+    def _near_field_pairs(self, points, mesh2):
+        """Pairs of receiving points and source panels for which the near field quadrature is used,
+        see :code:`near_field_ratio`.
+
+        Parameters
+        ----------
+        points: array of shape (n, 3)
+            the receiving points, e.g. the centers of the panels of the receiving mesh
+        mesh2: Mesh or CollectionOfMeshes
+            the source mesh
+
+        Returns
+        -------
+        tuple of two arrays of int32
+            the indices (starting at 1) of the receiving points and of the source panels in mesh2
+        """
+        # The wave part is nearly singular when the receiving point is close to
+        # the image of the source point through the free surface.
+        images = mesh2.panelCenters*np.array([1.0, 1.0, -1.0])
+        radii = mesh2.panelRadii
+        distances = cKDTree(points).sparse_distance_matrix(
+            cKDTree(images), self.near_field_ratio*radii.max(), output_type='ndarray')
+        close = distances['v'] < self.near_field_ratio*radii[distances['j']]
+        return (distances['i'][close] + 1).astype(np.int32), (distances['j'][close] + 1).astype(np.int32)
+
+    def _add_near_field_correction(self, S, K, points, normals, mesh2, depth, wavenumber, coeff, a_exp, lamda_exp,
+                                   nb_threads=None):
+        """Replace in place the wave part computed with a single point per panel by the near field quadrature
+        for the pairs returned by :meth:`_near_field_pairs`.
+        The derivative in K is taken along the given normals. Either S or K may be an empty array."""
+        if self.near_field_quadrature in (None, 'center') or coeff == 0.0:
+            return
+        pairs_1, pairs_2 = self._near_field_pairs(points, mesh2)
+        if len(pairs_1) == 0:
+            return
+        self.fortran_core.matrices.add_near_field_wave_part_correction(
+            points, normals,
+            mesh2.panelCenters, mesh2.panelAreas,
+            *mesh2.quadrature_points(self.near_field_quadrature),
+            pairs_1, pairs_2,
+            wavenumber, 0.0 if depth == np.infty else depth,
+            *self.tabulated_integrals,
+            lamda_exp, a_exp,
+            coeff,
+            S, K,
+            nb_threads=self._nb_threads if nb_threads is None else nb_threads,
+        )
+
+    @property
+    def _nb_threads(self):
+        """Number of threads passed to the Fortran core, where 0 stands for the OpenMP default."""
+        return 0 if self.n_threads is None else self.n_threads
+
+    def _with_precision(self, matrix):
+        """Convert a matrix computed by the Fortran core to the floating point precision of the Green function."""
+        return matrix.astype(self.dtype, order='F', copy=False)
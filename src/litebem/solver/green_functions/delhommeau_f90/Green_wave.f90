@@ -11,15 +11,17 @@ MODULE GREEN_WAVE
   ! Dependancies between the functions of this module:
   ! (from top to bottom: "is called by")
   !
-  !            LAGRANGE_POLYNOMIAL_INTERPOLATION
-  !                          |
-  !              COMPUTE_INTEGRALS_WRT_THETA       (COMPUTE_ASYMPTOTIC_RANKINE_SOURCE)
-  !                        /   \                    /
-  ! WAVE_PART_INFINITE_DEPTH   WAVE_PART_FINITE_DEPTH
-  !                        \   /
-  !                  (build_matrices.f90)
-  !                          |
-  !                    (python code)
+  !                              LAGRANGE_POLYNOMIAL_INTERPOLATION
+  !                                            |
+  !                          COMPUTE_INTEGRALS_WRT_THETA_FROM_DISTANCES
+  !                         /                  |
+  !                        /    COMPUTE_INTEGRALS_WRT_THETA       (COMPUTE_ASYMPTOTIC_RANKINE_SOURCE)
+  !                       /                  /   \                    /
+  ! WAVE_PART_INFINITE_DEPTH_   WAVE_PART_INFINITE_DEPTH   WAVE_PART_FINITE_DEPTH
+  !    MULTI_WAVENUMBERS                     \   /
+  !                       \________  (build_matrices.f90)
+  !                                          |
+  !                                    (python code)
 
 CONTAINS
 
@@ -28,8 +30,9 @@ CONTAINS
   SUBROUTINE LAGRANGE_POLYNOMIAL_INTERPOLATION &
     (dimless_r, dimless_Z,                                 &
      X_AXIS, Z_AXIS, TABULATION,               &
-     D1, D2, Z1, Z2)
+     Z1, Z2, D1, D2)
    ! Helper function used in the following subroutine to interpolate between the tabulated integrals.
+   ! D1 and D2, that are only needed for the gradient, are only interpolated if they are present.
 
     ! Inputs
     REAL(KIND=PRE),                        INTENT(IN) :: dimless_r, dimless_Z
@@ -38,7 +41,8 @@ CONTAINS
     REAL(KIND=PRE), DIMENSION(3, 3, 2, 2), INTENT(IN) :: TABULATION
 
     ! Output
-    REAL(KIND=PRE), INTENT(OUT) :: D1, D2, Z1, Z2
+    REAL(KIND=PRE),           INTENT(OUT) :: Z1, Z2
+    REAL(KIND=PRE), OPTIONAL, INTENT(OUT) :: D1, D2
 
     ! Local variable
     REAL(KIND=PRE), DIMENSION(3) :: XL, ZL
@@ -50,8 +54,8 @@ CONTAINS
     ZL(2) = PL2(Z_AXIS(3), Z_AXIS(1), Z_AXIS(2), dimless_Z)
     ZL(3) = PL2(Z_AXIS(1), Z_AXIS(2), Z_AXIS(3), dimless_Z)
 
-    D1 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 1, 1), ZL))
-    D2 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 2, 1), ZL))
+    IF (PRESENT(D1)) D1 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 1, 1), ZL))
+    IF (PRESENT(D2)) D2 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 2, 1), ZL))
     Z1 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 1, 2), ZL))
     Z2 = DOT_PRODUCT(XL, MATMUL(TABULATION(:, :, 2, 2), ZL))
 
@@ -82,30 +86,61 @@ CONTAINS
 #endif
     ! Z2 = Re[ ∫(e^ζ)dθ ]
     ! (See theory manual for the definition of the symbols above.)
+    ! The gradient VS is only computed if it is present.
 
     ! Inputs
     REAL(KIND=PRE), DIMENSION(3),             INTENT(IN) :: XI, XJ
     REAL(KIND=PRE),                           INTENT(IN) :: wavenumber
 
     ! Tabulated data
-    REAL(KIND=PRE), DIMENSION(328),           INTENT(IN) :: tabulated_r_range
-    REAL(KIND=PRE), DIMENSION(46),            INTENT(IN) :: tabulated_Z_range
-    REAL(KIND=PRE), DIMENSION(328, 46, 2, 2), INTENT(IN) :: tabulated_integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: tabulated_r_range
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: tabulated_Z_range
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: tabulated_integrals
 
     ! Outputs
     COMPLEX(KIND=PRE),                        INTENT(OUT) :: FS  ! the integral
-    COMPLEX(KIND=PRE), DIMENSION(3),          INTENT(OUT) :: VS  ! its gradient
+    COMPLEX(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VS  ! its gradient
+
+    CALL COMPUTE_INTEGRALS_WRT_THETA_FROM_DISTANCES                   &
+      (NORM2(XI(1:2) - XJ(1:2)), XI(3) + XJ(3), XJ(1:2) - XI(1:2), wavenumber, &
+      tabulated_r_range, tabulated_Z_range, tabulated_integrals,    &
+      FS, VS)
+
+    RETURN
+  END SUBROUTINE COMPUTE_INTEGRALS_WRT_THETA
+
+  ! =====================================================================
+
+  SUBROUTINE COMPUTE_INTEGRALS_WRT_THETA_FROM_DISTANCES              &
+      (r, Z, horizontal_vector, wavenumber,                      &
+      tabulated_r_range, tabulated_Z_range, tabulated_integrals, &
+      FS, VS)
+    ! Same as above, from the horizontal distance r = |XI - XJ| (in the xOy plane), the sum of the vertical
+    ! coordinates Z = XI(3) + XJ(3) and the horizontal vector XJ(1:2) - XI(1:2).
+    ! These do not depend on the wavenumber, so that they can be computed once for several wavenumbers.
+
+    ! Inputs
+    REAL(KIND=PRE),                           INTENT(IN) :: r, Z
+    REAL(KIND=PRE), DIMENSION(2),             INTENT(IN) :: horizontal_vector
+    REAL(KIND=PRE),                           INTENT(IN) :: wavenumber
+
+    ! Tabulated data
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: tabulated_r_range
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: tabulated_Z_range
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: tabulated_integrals
+
+    ! Outputs
+    COMPLEX(KIND=PRE),                        INTENT(OUT) :: FS  ! the integral
+    COMPLEX(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VS  ! its gradient
 
     ! Local variables
-    INTEGER        :: KI, KJ
-    REAL(KIND=PRE) :: r, dimless_r, Z, dimless_Z, R1, dimless_R1
+    INTEGER        :: nb_r, nb_Z, KI, KJ
+    REAL(KIND=PRE) :: dimless_r, dimless_Z, R1, dimless_R1
     REAL(KIND=PRE) :: sin_kr, cos_kr, expz_sqr
     REAL(KIND=PRE) :: D1, D2, Z1, Z2
 
-    r = NORM2(XI(1:2) - XJ(1:2))
     dimless_r = wavenumber*r
 
-    Z = XI(3) + XJ(3)
     dimless_Z = wavenumber*Z
 
     R1 = SQRT(r**2 + Z**2)
@@ -116,13 +151,19 @@ CONTAINS
       ERROR STOP
     ENDIF
 
+    ! Size of the tabulation
+    nb_r = SIZE(tabulated_r_range)
+    nb_Z = SIZE(tabulated_Z_range)
+
     !=====================================================================================
     ! Evaluate the elementary integrals PDnX and PDnZ depending on dimless_Z and dimless_r
     !=====================================================================================
-    IF ((MINVAL(tabulated_Z_range) < dimless_Z) .AND. (dimless_Z < MAXVAL(tabulated_Z_range))) THEN
-      IF ((MINVAL(tabulated_r_range) <= dimless_r) .AND. (dimless_r < MAXVAL(tabulated_r_range))) THEN
+    ! The tabulated r range is increasing and the tabulated Z range is decreasing (see INITIALIZE_TABULATED_INTEGRALS),
+    ! so that their extreme values are their first and last elements.
+    IF ((tabulated_Z_range(nb_Z) < dimless_Z) .AND. (dimless_Z < tabulated_Z_range(1))) THEN
+      IF ((tabulated_r_range(1) <= dimless_r) .AND. (dimless_r < tabulated_r_range(nb_r))) THEN
         ! Within the range of tabulated data
-        ! Note that MINVAL(tabulated_r_range) == 0, so one of the conditions is not actually useful.
+        ! Note that tabulated_r_range(1) == 0, so one of the conditions is not actually useful.
 
         ! Get the nearest point in the tabulation
         IF (dimless_r < 1) THEN
@@ -130,31 +171,41 @@ CONTAINS
         ELSE
           KI = INT(3*dimless_r+28)
         ENDIF
-        KI = MAX(MIN(KI, 327), 2)
+        KI = MAX(MIN(KI, nb_r-1), 2)
 
         IF (dimless_Z < -1e-2) THEN
           KJ = INT(8*(LOG10(-dimless_Z)+4.5))
         ELSE
           KJ = INT(5*(LOG10(-dimless_Z)+6))
         ENDIF
-        KJ = MAX(MIN(KJ, 45), 2)
+        KJ = MAX(MIN(KJ, nb_Z-1), 2)
 
         ! Interpolate near this point to get the actual value
-        CALL LAGRANGE_POLYNOMIAL_INTERPOLATION                           &
-             (dimless_r, dimless_Z,                                      &
-             tabulated_r_range(KI-1:KI+1), tabulated_Z_range(KJ-1:KJ+1), &
-             tabulated_integrals(KI-1:KI+1, KJ-1:KJ+1, :, :),            &
-             D1, D2, Z1, Z2)
-
-      ELSE  ! MAXVAL(tabulated_r_range) < dimless_r
+        IF (PRESENT(VS)) THEN
+          CALL LAGRANGE_POLYNOMIAL_INTERPOLATION                           &
+               (dimless_r, dimless_Z,                                      &
+               tabulated_r_range(KI-1:KI+1), tabulated_Z_range(KJ-1:KJ+1), &
+               tabulated_integrals(KI-1:KI+1, KJ-1:KJ+1, :, :),            &
+               Z1, Z2, D1, D2)
+        ELSE
+          CALL LAGRANGE_POLYNOMIAL_INTERPOLATION                           &
+               (dimless_r, dimless_Z,                                      &
+               tabulated_r_range(KI-1:KI+1), tabulated_Z_range(KJ-1:KJ+1), &
+               tabulated_integrals(KI-1:KI+1, KJ-1:KJ+1, :, :),            &
+               Z1, Z2)
+        END IF
+
+      ELSE  ! tabulated_r_range(nb_r) < dimless_r
         ! Asymptotic expression for (horizontally) distant panels
 
         expz_sqr = EXP(dimless_Z) * SQRT(2*PI/dimless_r)
         cos_kr  = COS(dimless_r - PI/4)
         sin_kr  = SIN(dimless_r - PI/4)
 
-        D1 = PI*(expz_sqr*(cos_kr - sin_kr/(2*dimless_r)) - dimless_r/dimless_R1**3)
-        D2 =     expz_sqr*(sin_kr + cos_kr/(2*dimless_r))
+        IF (PRESENT(VS)) THEN
+          D1 = PI*(expz_sqr*(cos_kr - sin_kr/(2*dimless_r)) - dimless_r/dimless_R1**3)
+          D2 =     expz_sqr*(sin_kr + cos_kr/(2*dimless_r))
+        END IF
 #ifdef XIE_CORRECTION
         Z1 = PI*(-expz_sqr*sin_kr + dimless_Z/dimless_R1**3 - ONE/dimless_R1)
 #else
@@ -168,27 +219,29 @@ CONTAINS
       !================================================
 
 #ifdef XIE_CORRECTION
-      FS    = CMPLX(Z1/PI + ONE/dimless_R1, Z2, KIND=PRE)
-      VS(3) = CMPLX(Z1/PI + ONE/dimless_R1, Z2, KIND=PRE)
+      FS = CMPLX(Z1/PI + ONE/dimless_R1, Z2, KIND=PRE)
 #else
-      FS    = CMPLX(Z1/PI, Z2, KIND=PRE)
-      VS(3) = CMPLX(Z1/PI, Z2, KIND=PRE)
+      FS = CMPLX(Z1/PI, Z2, KIND=PRE)
 #endif
-      VS(1) = (XJ(1) - XI(1))/r * CMPLX(D1/PI, D2, KIND=PRE)
-      VS(2) = (XJ(2) - XI(2))/r * CMPLX(D1/PI, D2, KIND=PRE)
 
-      IF (r < REAL(1e-5, KIND=PRE)) THEN
-        ! Limit case r ~ 0 ?
-        VS(1:2) = CMPLX(0.0, 0.0, KIND=PRE)
+      IF (PRESENT(VS)) THEN
+        VS(3) = FS
+        VS(1) = horizontal_vector(1)/r * CMPLX(D1/PI, D2, KIND=PRE)
+        VS(2) = horizontal_vector(2)/r * CMPLX(D1/PI, D2, KIND=PRE)
+
+        IF (r < REAL(1e-5, KIND=PRE)) THEN
+          ! Limit case r ~ 0 ?
+          VS(1:2) = CMPLX(0.0, 0.0, KIND=PRE)
+        END IF
       END IF
 
-    ELSE  ! dimless_Z < MINVAL(tabulated_Z_range) or MAXVAL(tabulated_Z_range) < dimless_Z
-      FS      = CMPLX(dimless_Z/(PI*dimless_R1**3), 0.0, KIND=PRE)
-      VS(1:3) = CMPLX(0.0, 0.0, KIND=PRE)
+    ELSE  ! dimless_Z < tabulated_Z_range(nb_Z) or tabulated_Z_range(1) < dimless_Z
+      FS = CMPLX(dimless_Z/(PI*dimless_R1**3), 0.0, KIND=PRE)
+      IF (PRESENT(VS)) VS(1:3) = CMPLX(0.0, 0.0, KIND=PRE)
     ENDIF
 
     RETURN
-  END SUBROUTINE COMPUTE_INTEGRALS_WRT_THETA
+  END SUBROUTINE COMPUTE_INTEGRALS_WRT_THETA_FROM_DISTANCES
 
   ! =========================
 
@@ -198,6 +251,7 @@ CONTAINS
       SP, VSP)
     ! Compute the wave part of the Green function in the infinite depth case.
     ! This is mostly the integral computed by the subroutine above.
+    ! The gradient VSP is only computed if it is present.
 
     ! Inputs
     REAL(KIND=PRE),                           INTENT(IN)  :: wavenumber
@@ -205,29 +259,82 @@ CONTAINS
     REAL(KIND=PRE), DIMENSION(3),             INTENT(IN)  :: X0J   ! Coordinates of the center of the integration panel
 
     ! Tabulated data
-    REAL(KIND=PRE), DIMENSION(328),           INTENT(IN) :: X_AXIS
-    REAL(KIND=PRE), DIMENSION(46),            INTENT(IN) :: Z_AXIS
-    REAL(KIND=PRE), DIMENSION(328, 46, 2, 2), INTENT(IN) :: TABULATION
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: X_AXIS
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: Z_AXIS
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: TABULATION
 
     ! Outputs
-    COMPLEX(KIND=PRE),               INTENT(OUT) :: SP  ! Integral of the Green function over the panel.
-    COMPLEX(KIND=PRE), DIMENSION(3), INTENT(OUT) :: VSP ! Gradient of the integral of the Green function with respect to X0I.
+    COMPLEX(KIND=PRE),                         INTENT(OUT) :: SP  ! Integral of the Green function over the panel.
+    COMPLEX(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VSP ! Gradient of the integral of the Green function with respect to X0I.
 
     ! Local variables
     REAL(KIND=PRE), DIMENSION(3) :: XJ_REFLECTION
 
     ! The integrals
-    CALL COMPUTE_INTEGRALS_WRT_THETA(X0I, X0J, wavenumber, X_AXIS, Z_AXIS, TABULATION, SP, VSP(:))
+    CALL COMPUTE_INTEGRALS_WRT_THETA(X0I, X0J, wavenumber, X_AXIS, Z_AXIS, TABULATION, SP, VSP)
     SP  = 2*wavenumber*SP
-    VSP = 2*wavenumber**2*VSP
 
-    ! Only one singularity is missing in the derivative
+    IF (PRESENT(VSP)) THEN
+      VSP = 2*wavenumber**2*VSP
+
+      ! Only one singularity is missing in the derivative
+      XJ_REFLECTION(1:2) = X0J(1:2)
+      XJ_REFLECTION(3) = - X0J(3)
+      VSP = VSP - 2*(X0I - XJ_REFLECTION)/(NORM2(X0I-XJ_REFLECTION)**3)
+    END IF
+
+    RETURN
+  END SUBROUTINE WAVE_PART_INFINITE_DEPTH
+
+  ! ======================
+
+  SUBROUTINE WAVE_PART_INFINITE_DEPTH_MULTI_WAVENUMBERS &
+      (nb_wavenumbers, wavenumbers, X0I, X0J,           &
+      X_AXIS, Z_AXIS, TABULATION,                       &
+      SP, VSP)
+    ! Same as WAVE_PART_INFINITE_DEPTH for several wavenumbers at once.
+    ! The distances between the two points and the singular part of the derivative are computed only once.
+
+    ! Inputs
+    INTEGER,                                  INTENT(IN)  :: nb_wavenumbers
+    REAL(KIND=PRE), DIMENSION(nb_wavenumbers), INTENT(IN) :: wavenumbers
+    REAL(KIND=PRE), DIMENSION(3),             INTENT(IN)  :: X0I   ! Coordinates of the source point
+    REAL(KIND=PRE), DIMENSION(3),             INTENT(IN)  :: X0J   ! Coordinates of the center of the integration panel
+
+    ! Tabulated data
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: X_AXIS
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: Z_AXIS
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: TABULATION
+
+    ! Outputs
+    COMPLEX(KIND=PRE), DIMENSION(nb_wavenumbers),    INTENT(OUT) :: SP
+    COMPLEX(KIND=PRE), DIMENSION(3, nb_wavenumbers), INTENT(OUT) :: VSP
+
+    ! Local variables
+    INTEGER                      :: W
+    REAL(KIND=PRE)               :: r, Z
+    REAL(KIND=PRE), DIMENSION(2) :: horizontal_vector
+    REAL(KIND=PRE), DIMENSION(3) :: XJ_REFLECTION, reflection_term
+
+    r = NORM2(X0I(1:2) - X0J(1:2))
+    Z = X0I(3) + X0J(3)
+    horizontal_vector(:) = X0J(1:2) - X0I(1:2)
+
     XJ_REFLECTION(1:2) = X0J(1:2)
     XJ_REFLECTION(3) = - X0J(3)
-    VSP = VSP - 2*(X0I - XJ_REFLECTION)/(NORM2(X0I-XJ_REFLECTION)**3)
+    reflection_term(:) = 2*(X0I - XJ_REFLECTION)/(NORM2(X0I-XJ_REFLECTION)**3)
+
+    DO W = 1, nb_wavenumbers
+      CALL COMPUTE_INTEGRALS_WRT_THETA_FROM_DISTANCES &
+        (r, Z, horizontal_vector, wavenumbers(W),     &
+        X_AXIS, Z_AXIS, TABULATION,                   &
+        SP(W), VSP(:, W))
+      SP(W)     = 2*wavenumbers(W)*SP(W)
+      VSP(:, W) = 2*wavenumbers(W)**2*VSP(:, W) - reflection_term
+    END DO
 
     RETURN
-  END SUBROUTINE WAVE_PART_INFINITE_DEPTH
+  END SUBROUTINE WAVE_PART_INFINITE_DEPTH_MULTI_WAVENUMBERS
 
   ! ======================
 
@@ -237,22 +344,23 @@ CONTAINS
       NEXP, AMBDA, AR,              &
       SP, VSP_SYM, VSP_ANTISYM)
     ! Compute the frequency-dependent part of the Green function in the finite depth case.
+    ! The gradient is only computed if VSP_SYM and VSP_ANTISYM are present.
 
     ! Inputs
     REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
     REAL(KIND=PRE), DIMENSION(3),             INTENT(IN) :: X0I  ! Coordinates of the source point
     REAL(KIND=PRE), DIMENSION(3),             INTENT(IN) :: X0J  ! Coordinates of the center of the integration panel
 
-    REAL(KIND=PRE), DIMENSION(328),           INTENT(IN) :: X_AXIS
-    REAL(KIND=PRE), DIMENSION(46),            INTENT(IN) :: Z_AXIS
-    REAL(KIND=PRE), DIMENSION(328, 46, 2, 2), INTENT(IN) :: TABULATION
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: X_AXIS
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: Z_AXIS
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: TABULATION
 
     INTEGER,                                  INTENT(IN) :: NEXP
     REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
 
     ! Outputs
-    COMPLEX(KIND=PRE),               INTENT(OUT) :: SP  ! Integral of the Green function over the panel.
-    COMPLEX(KIND=PRE), DIMENSION(3), INTENT(OUT) :: VSP_SYM, VSP_ANTISYM ! Gradient of the integral of the Green function with respect to X0I.
+    COMPLEX(KIND=PRE),                         INTENT(OUT) :: SP  ! Integral of the Green function over the panel.
+    COMPLEX(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VSP_SYM, VSP_ANTISYM ! Gradient of the integral of the Green function with respect to X0I.
 
     ! Local variables
     INTEGER                              :: KE
@@ -263,6 +371,9 @@ CONTAINS
     REAL(KIND=PRE),    DIMENSION(3, 4)   :: VTS
     COMPLEX(KIND=PRE), DIMENSION(4)      :: FS
     COMPLEX(KIND=PRE), DIMENSION(3, 4)   :: VS
+    LOGICAL                              :: gradient
+
+    gradient = PRESENT(VSP_SYM) .AND. PRESENT(VSP_ANTISYM)
 
     !========================================
     ! Part 1: Solve 4 infinite depth problems
@@ -275,46 +386,63 @@ CONTAINS
     R = NORM2(XI(1:2) - XJ(1:2))
 
     ! 1.a First infinite depth problem
-    CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(1), VS(:, 1))
+    IF (gradient) THEN
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(1), VS(:, 1))
+    ELSE
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(1))
+    END IF
 
     PSR(1) = ONE/(wavenumber*SQRT(R**2+(XI(3)+XJ(3))**2))
 
     ! 1.b Shift and reflect XI and compute another value of the Green function
     XI(3) = -X0I(3) - 2*depth
     XJ(3) =  X0J(3)
-    CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(2), VS(:, 2))
-    VS(3, 2) = -VS(3, 2) ! Reflection of the output vector
+    IF (gradient) THEN
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(2), VS(:, 2))
+      VS(3, 2) = -VS(3, 2) ! Reflection of the output vector
+    ELSE
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(2))
+    END IF
 
     PSR(2) = ONE/(wavenumber*SQRT(R**2+(XI(3)+XJ(3))**2))
 
     ! 1.c Shift and reflect XJ and compute another value of the Green function
     XI(3) =  X0I(3)
     XJ(3) = -X0J(3) - 2*depth
-    CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(3), VS(:, 3))
+    IF (gradient) THEN
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(3), VS(:, 3))
+    ELSE
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(3))
+    END IF
 
     PSR(3) = ONE/(wavenumber*SQRT(R**2+(XI(3)+XJ(3))**2))
 
     ! 1.d Shift and reflect both XI and XJ and compute another value of the Green function
     XI(3) = -X0I(3) - 2*depth
     XJ(3) = -X0J(3) - 2*depth
-    CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(4), VS(:, 4))
-    VS(3, 4) = -VS(3, 4) ! Reflection of the output vector
+    IF (gradient) THEN
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(4), VS(:, 4))
+      VS(3, 4) = -VS(3, 4) ! Reflection of the output vector
+    ELSE
+      CALL COMPUTE_INTEGRALS_WRT_THETA(XI(:), XJ(:), wavenumber, X_AXIS, Z_AXIS, TABULATION, FS(4))
+    END IF
 
     PSR(4) = ONE/(wavenumber*SQRT(R**2+(XI(3)+XJ(3))**2))
 
     ! Add up the results of the four problems
-    SP               = SUM(FS(1:4)) - SUM(PSR(1:4))
-    VSP_SYM(1:3)     = VS(1:3, 1) + VS(1:3, 4)
-    VSP_ANTISYM(1:3) = VS(1:3, 2) + VS(1:3, 3)
+    SP = SUM(FS(1:4)) - SUM(PSR(1:4))
 
     ! Multiply by some coefficients
     AMH  = wavenumber*depth
     AKH  = AMH*TANH(AMH)
     A    = (AMH+AKH)**2/(2*depth*(AMH**2-AKH**2+AKH))
 
-    SP          = A*SP
-    VSP_ANTISYM = A*wavenumber*VSP_ANTISYM
-    VSP_SYM     = A*wavenumber*VSP_SYM
+    SP = A*SP
+
+    IF (gradient) THEN
+      VSP_SYM(1:3)     = A*wavenumber*(VS(1:3, 1) + VS(1:3, 4))
+      VSP_ANTISYM(1:3) = A*wavenumber*(VS(1:3, 2) + VS(1:3, 3))
+    END IF
 
     !=====================================================
     ! Part 2: Integrate (NEXP+1)×4 terms of the form 1/MM'
@@ -325,28 +453,46 @@ CONTAINS
 
       ! 2.a Shift observation point and compute integral
       XI(3) =  X0I(3) + depth*AMBDA(KE) - 2*depth
-      CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(1), VTS(:, 1))
+      IF (gradient) THEN
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(1), VTS(:, 1))
+      ELSE
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(1))
+      END IF
 
       ! 2.b Shift and reflect observation point and compute integral
       XI(3) = -X0I(3) - depth*AMBDA(KE)
-      CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(2), VTS(:, 2))
-      VTS(3, 2) = -VTS(3, 2) ! Reflection of the output vector
+      IF (gradient) THEN
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(2), VTS(:, 2))
+        VTS(3, 2) = -VTS(3, 2) ! Reflection of the output vector
+      ELSE
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(2))
+      END IF
 
       ! 2.c Shift and reflect observation point and compute integral
       XI(3) = -X0I(3) + depth*AMBDA(KE) - 4*depth
-      CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(3), VTS(:, 3))
-      VTS(3, 3) = -VTS(3, 3) ! Reflection of the output vector
+      IF (gradient) THEN
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(3), VTS(:, 3))
+        VTS(3, 3) = -VTS(3, 3) ! Reflection of the output vector
+      ELSE
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(3))
+      END IF
 
       ! 2.d Shift observation point and compute integral
       XI(3) =  X0I(3) - depth*AMBDA(KE) + 2*depth
-      CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(4), VTS(:, 4))
+      IF (gradient) THEN
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(4), VTS(:, 4))
+      ELSE
+        CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(XI(:), X0J(:), ONE, FTS(4))
+      END IF
 
       AQT = AR(KE)/2
 
       ! Add all the contributions
-      SP               = SP               + AQT*SUM(FTS(1:4))
-      VSP_ANTISYM(1:3) = VSP_ANTISYM(1:3) + AQT*(VTS(1:3, 1) + VTS(1:3, 4))
-      VSP_SYM(1:3)     = VSP_SYM(1:3)     + AQT*(VTS(1:3, 2) + VTS(1:3, 3))
+      SP = SP + AQT*SUM(FTS(1:4))
+      IF (gradient) THEN
+        VSP_ANTISYM(1:3) = VSP_ANTISYM(1:3) + AQT*(VTS(1:3, 1) + VTS(1:3, 4))
+        VSP_SYM(1:3)     = VSP_SYM(1:3)     + AQT*(VTS(1:3, 2) + VTS(1:3, 3))
+      END IF
 
     END DO
 
@@ -5,17 +5,36 @@ MODULE MATRICES
   USE GREEN_RANKINE
   USE GREEN_WAVE
 
+  !$ USE OMP_LIB
+
   IMPLICIT NONE
 
 CONTAINS
 
+  INTEGER FUNCTION NUMBER_OF_THREADS(nb_threads)
+    ! Number of threads of the parallel regions of this module:
+    ! nb_threads if it is positive, otherwise the OpenMP default (e.g. OMP_NUM_THREADS).
+
+    INTEGER, INTENT(IN) :: nb_threads
+
+    NUMBER_OF_THREADS = 1
+    !$ IF (nb_threads > 0) THEN
+    !$   NUMBER_OF_THREADS = nb_threads
+    !$ ELSE
+    !$   NUMBER_OF_THREADS = OMP_GET_MAX_THREADS()
+    !$ END IF
+
+  END FUNCTION
+
+  ! =====================================================================
+
   SUBROUTINE ADD_RANKINE_PART_TO_THE_MATRICES(                        &
       nb_faces_1,                                                     &
       centers_1, normals_1,                                           &
       nb_vertices_2, nb_faces_2,                                      &
       vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
       coeff,                                                          &
-      S, K)
+      S, K, asymptotic_ratio, nb_threads)
 
     INTEGER,                                     INTENT(IN) :: nb_faces_1, nb_faces_2, nb_vertices_2
     REAL(KIND=PRE), DIMENSION(nb_faces_1, 3),    INTENT(IN) :: centers_1, normals_1
@@ -29,32 +48,115 @@ CONTAINS
     COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: S
     COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: K
 
+    ! Distance (in radii of the source face) above which the asymptotic value of the Rankine integral is used
+    REAL(KIND=PRE), INTENT(IN) :: asymptotic_ratio
+    !f2py real(kind=8) optional, intent(in) :: asymptotic_ratio = 7.0
+
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
+
+    !$OMP PARALLEL NUM_THREADS(NUMBER_OF_THREADS(nb_threads))
+    CALL RANKINE_PART_LOOP(                                           &
+      nb_faces_1,                                                     &
+      centers_1, normals_1,                                           &
+      nb_vertices_2, nb_faces_2,                                      &
+      vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
+      coeff, asymptotic_ratio,                                        &
+      S, K)
+    !$OMP END PARALLEL
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE RANKINE_PART(                               &
+      M, vertices, face,                                 &
+      Face_center, Face_normal, Face_area, Face_radius,  &
+      asymptotic_ratio,                                  &
+      SP, VSP)
+    ! Integral of the Rankine source over a face, computed exactly if M is closer to the center of the face
+    ! than asymptotic_ratio times the radius of the face, and with a point source at the center otherwise.
+    ! The gradient is only computed if VSP is present.
+
+    REAL(KIND=PRE), DIMENSION(3),    INTENT(IN) :: M
+    REAL(KIND=PRE), DIMENSION(:, :), INTENT(IN) :: vertices
+    INTEGER,        DIMENSION(4),    INTENT(IN) :: face
+    REAL(KIND=PRE), DIMENSION(3),    INTENT(IN) :: Face_center, Face_normal
+    REAL(KIND=PRE),                  INTENT(IN) :: Face_area, Face_radius, asymptotic_ratio
+
+    REAL(KIND=PRE),                         INTENT(OUT) :: SP
+    REAL(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VSP
+
+    IF (NORM2(M - Face_center) > asymptotic_ratio*Face_radius) THEN
+      CALL COMPUTE_ASYMPTOTIC_RANKINE_SOURCE(M, Face_center, Face_area, SP, VSP)
+    ELSE
+      CALL COMPUTE_INTEGRAL_OF_RANKINE_SOURCE(M, vertices(face, :), Face_center, Face_normal, Face_area, Face_radius, SP, VSP)
+    END IF
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE RANKINE_PART_LOOP(                                       &
+      nb_faces_1,                                                     &
+      centers_1, normals_1,                                           &
+      nb_vertices_2, nb_faces_2,                                      &
+      vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
+      coeff, asymptotic_ratio,                                        &
+      S, K)
+    ! Work-shared loop of ADD_RANKINE_PART_TO_THE_MATRICES.
+    ! It should be called by all the threads of an enclosing parallel region (or outside of any parallel region).
+    ! The exact integral over the source face is only computed when the distance between the center of the
+    ! receiving face and the center of the source face is lower than asymptotic_ratio times the radius of the
+    ! source face. The source face is approximated by a point source otherwise.
+    ! If K is empty, only S is computed and all the work related to the gradient of the Green function is skipped.
+
+    INTEGER,                                     INTENT(IN) :: nb_faces_1, nb_faces_2, nb_vertices_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3),    INTENT(IN) :: centers_1, normals_1
+    REAL(KIND=PRE), DIMENSION(nb_vertices_2, 3), INTENT(IN) :: vertices_2
+    INTEGER,        DIMENSION(nb_faces_2, 4),    INTENT(IN) :: faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, 3),    INTENT(IN) :: centers_2, normals_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2),       INTENT(IN) :: areas_2, radiuses_2
+
+    REAL(KIND=PRE), INTENT(IN) :: coeff, asymptotic_ratio
+
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(:, :),                   INTENT(INOUT) :: K
+
     ! Local variables
     INTEGER :: I, J
+    LOGICAL                      :: gradient
     REAL(KIND=PRE)               :: SP1
     REAL(KIND=PRE), DIMENSION(3) :: VSP1
 
-    DO I = 1, nb_faces_1
-      !$OMP PARALLEL DO PRIVATE(J, SP1, VSP1)
-      DO J = 1, nb_faces_2
+    gradient = (SIZE(K) > 0)
 
-        CALL COMPUTE_INTEGRAL_OF_RANKINE_SOURCE( &
-          centers_1(I, :),                       &
-          vertices_2(faces_2(J, :), :),          &
-          centers_2(J, :),                       &
-          normals_2(J, :),                       &
-          areas_2(J),                            &
-          radiuses_2(J),                         &
-          SP1, VSP1                              &
-          )
+    ! The two loops are collapsed, such that all the threads share the whole matrix and not only a row.
+    ! J is the outer loop, such that each thread writes in contiguous memory.
+    !$OMP DO COLLAPSE(2) SCHEDULE(STATIC) PRIVATE(I, J, SP1, VSP1)
+    DO J = 1, nb_faces_2
+      DO I = 1, nb_faces_1
+
+        IF (gradient) THEN
+          CALL RANKINE_PART(centers_1(I, :), vertices_2, faces_2(J, :),                      &
+            centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), asymptotic_ratio, &
+            SP1, VSP1)
+        ELSE
+          CALL RANKINE_PART(centers_1(I, :), vertices_2, faces_2(J, :),                      &
+            centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), asymptotic_ratio, &
+            SP1)
+        END IF
 
         ! Store into influence matrix
         S(I, J) = S(I, J) - coeff * SP1/(4*PI)                                ! Green function
-        K(I, J) = K(I, J) - coeff * DOT_PRODUCT(normals_1(I, :), VSP1)/(4*PI) ! Gradient of the Green function
+        IF (gradient) THEN
+          K(I, J) = K(I, J) - coeff * DOT_PRODUCT(normals_1(I, :), VSP1)/(4*PI) ! Gradient of the Green function
+        END IF
 
       END DO
-      !$OMP END PARALLEL DO
     END DO
+    !$OMP END DO
 
   END SUBROUTINE
 
@@ -69,7 +171,7 @@ CONTAINS
       NEXP, AMBDA, AR,                   &
       coeff,                             &
       same_body,                         &
-      S, K)
+      S, K, nb_threads)
 
     ! Mesh data
     INTEGER,                                  INTENT(IN) :: nb_faces_1, nb_faces_2
@@ -82,9 +184,9 @@ CONTAINS
     REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
 
     ! Tabulated integrals
-    REAL(KIND=PRE), DIMENSION(328),           INTENT(IN) :: XR
-    REAL(KIND=PRE), DIMENSION(46),            INTENT(IN) :: XZ
-    REAL(KIND=PRE), DIMENSION(328, 46, 2, 2), INTENT(IN) :: APD
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
 
     ! Prony decomposition for finite depth
     INTEGER,                                  INTENT(IN) :: NEXP
@@ -99,93 +201,174 @@ CONTAINS
     COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: S
     COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: K
 
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
+
+    !$OMP PARALLEL NUM_THREADS(NUMBER_OF_THREADS(nb_threads))
+    CALL WAVE_PART_LOOP(                 &
+      nb_faces_1, centers_1, normals_1,  &
+      nb_faces_2, nb_quad_points,        &
+      quad_points, quad_weights,         &
+      wavenumber, depth,                 &
+      XR, XZ, APD,                       &
+      NEXP, AMBDA, AR,                   &
+      coeff,                             &
+      same_body,                         &
+      S, K)
+    !$OMP END PARALLEL
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE WAVE_PART(                &
+      wavenumber, X0I, X0J, depth,     &
+      XR, XZ, APD,                     &
+      NEXP, AMBDA, AR,                 &
+      SP, VSP_SYM, VSP_ANTISYM)
+    ! Wave part of the Green function between two points, in infinite or finite depth.
+    ! The gradient is only computed if VSP_SYM and VSP_ANTISYM are present.
+
+    REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
+    REAL(KIND=PRE), DIMENSION(3),             INTENT(IN) :: X0I, X0J
+
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    INTEGER,                                  INTENT(IN) :: NEXP
+    REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
+
+    COMPLEX(KIND=PRE),                         INTENT(OUT) :: SP
+    COMPLEX(KIND=PRE), DIMENSION(3), OPTIONAL, INTENT(OUT) :: VSP_SYM, VSP_ANTISYM
+
+    IF (depth == INFINITE_DEPTH) THEN
+      CALL WAVE_PART_INFINITE_DEPTH(wavenumber, X0I, X0J, XR, XZ, APD, SP, VSP_SYM)
+      IF (PRESENT(VSP_ANTISYM)) VSP_ANTISYM(:) = ZERO
+    ELSE
+      CALL WAVE_PART_FINITE_DEPTH(wavenumber, X0I, X0J, depth, XR, XZ, APD, NEXP, AMBDA, AR, SP, VSP_SYM, VSP_ANTISYM)
+    END IF
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE WAVE_PART_LOOP(             &
+      nb_faces_1, centers_1, normals_1,  &
+      nb_faces_2, nb_quad_points,        &
+      quad_points, quad_weights,         &
+      wavenumber, depth,                 &
+      XR, XZ, APD,                       &
+      NEXP, AMBDA, AR,                   &
+      coeff,                             &
+      same_body,                         &
+      S, K)
+    ! Work-shared loop of ADD_WAVE_PART_TO_THE_MATRICES.
+    ! It should be called by all the threads of an enclosing parallel region (or outside of any parallel region).
+    ! If K is empty, only S is computed and all the work related to the gradient of the Green function is skipped.
+
+    ! Mesh data
+    INTEGER,                                  INTENT(IN) :: nb_faces_1, nb_faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3), INTENT(IN) :: normals_1, centers_1
+
+    INTEGER,                                                  INTENT(IN) :: nb_quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points, 3), INTENT(IN) :: quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points),    INTENT(IN) :: quad_weights
+
+    REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
+
+    ! Tabulated integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    ! Prony decomposition for finite depth
+    INTEGER,                                  INTENT(IN) :: NEXP
+    REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
+
+    REAL(KIND=PRE), INTENT(IN) :: coeff
+
+    LOGICAL,                                  INTENT(IN) :: same_body
+
+    ! Output
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(INOUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(:, :),                   INTENT(INOUT) :: K
+
     ! Local variables
     INTEGER                         :: I, J, Q
+    LOGICAL                         :: gradient
     COMPLEX(KIND=PRE)               :: SP2
     COMPLEX(KIND=PRE), DIMENSION(3) :: VSP2_SYM, VSP2_ANTISYM
 
+    gradient = (SIZE(K) > 0)
+
     IF ((SAME_BODY) .AND. (nb_quad_points == 1)) THEN
       ! If we are computing the influence of some cells upon themselves, the resulting matrices have some symmetries.
       ! This is due to the symmetry of the Green function, and the way the integral on the face is approximated.
       ! (More precisely, the Green function is symmetric and its derivative is the sum of a symmetric part and an anti-symmetric
       ! part.)
 
-      DO I = 1, nb_faces_1
-        !$OMP PARALLEL DO PRIVATE(J, SP2, VSP2_SYM, VSP2_ANTISYM)
-        DO J = I, nb_faces_2
+      ! Only the upper triangle I <= J is computed, so the columns do not have the same cost:
+      ! they are distributed dynamically between the threads.
+      ! No two iterations write the same coefficient, since (I, J) and (J, I) are both written by the iteration of the column J.
+      !$OMP DO SCHEDULE(DYNAMIC) PRIVATE(I, J, SP2, VSP2_SYM, VSP2_ANTISYM)
+      DO J = 1, nb_faces_2
+        DO I = 1, J
 
-          IF (depth == INFINITE_DEPTH) THEN
-            CALL WAVE_PART_INFINITE_DEPTH &
-              (wavenumber,                &
-              centers_1(I, :),            &
-              quad_points(J, 1, :),       & ! centers_2(J, :),
-              XR, XZ, APD,                &
-              SP2, VSP2_SYM               &
-              )
-            VSP2_ANTISYM(:) = ZERO
+          ! quad_points(J, 1, :) is centers_2(J, :)
+          IF (gradient) THEN
+            CALL WAVE_PART(wavenumber, centers_1(I, :), quad_points(J, 1, :), depth, &
+              XR, XZ, APD, NEXP, AMBDA, AR, SP2, VSP2_SYM, VSP2_ANTISYM)
           ELSE
-            CALL WAVE_PART_FINITE_DEPTH   &
-              (wavenumber,                &
-              centers_1(I, :),            &
-              quad_points(J, 1, :),       & ! centers_2(J, :),
-              depth,                      &
-              XR, XZ, APD,                &
-              NEXP, AMBDA, AR,            &
-              SP2, VSP2_SYM, VSP2_ANTISYM &
-              )
+            CALL WAVE_PART(wavenumber, centers_1(I, :), quad_points(J, 1, :), depth, &
+              XR, XZ, APD, NEXP, AMBDA, AR, SP2)
           END IF
 
           S(I, J) = S(I, J) - coeff/(4*PI) * SP2 * quad_weights(J, 1)
-          K(I, J) = K(I, J) - coeff/(4*PI) * &
-            DOT_PRODUCT(normals_1(I, :), VSP2_SYM + VSP2_ANTISYM) * quad_weights(J, 1)
+          IF (gradient) THEN
+            K(I, J) = K(I, J) - coeff/(4*PI) * &
+              DOT_PRODUCT(normals_1(I, :), VSP2_SYM + VSP2_ANTISYM) * quad_weights(J, 1)
+          END IF
 
           IF (.NOT. I==J) THEN
-            VSP2_SYM(1:2) = -VSP2_SYM(1:2)
             S(J, I) = S(J, I) - coeff/(4*PI) * SP2 * quad_weights(I, 1)
-            K(J, I) = K(J, I) - coeff/(4*PI) * &
-              DOT_PRODUCT(normals_1(J, :), VSP2_SYM - VSP2_ANTISYM) * quad_weights(I, 1)
+            IF (gradient) THEN
+              VSP2_SYM(1:2) = -VSP2_SYM(1:2)
+              K(J, I) = K(J, I) - coeff/(4*PI) * &
+                DOT_PRODUCT(normals_1(J, :), VSP2_SYM - VSP2_ANTISYM) * quad_weights(I, 1)
+            END IF
           END IF
 
         END DO
-        !$OMP END PARALLEL DO
       END DO
+      !$OMP END DO
 
     ELSE
       ! General case: if we are computing the influence of a some cells on other cells, we have to compute all the coefficients.
 
-      DO I = 1, nb_faces_1
-        !$OMP PARALLEL DO PRIVATE(J, SP2, VSP2_SYM, VSP2_ANTISYM)
-        DO J = 1, nb_faces_2
+      !$OMP DO COLLAPSE(2) SCHEDULE(STATIC) PRIVATE(I, J, Q, SP2, VSP2_SYM, VSP2_ANTISYM)
+      DO J = 1, nb_faces_2
+        DO I = 1, nb_faces_1
           DO Q = 1, nb_quad_points
-            IF (depth == INFINITE_DEPTH) THEN
-              CALL WAVE_PART_INFINITE_DEPTH &
-                (wavenumber,                &
-                centers_1(I, :),            &
-                quad_points(J, Q, :),       &
-                XR, XZ, APD,                &
-                SP2, VSP2_SYM               &
-                )
-              VSP2_ANTISYM(:) = ZERO
+            IF (gradient) THEN
+              CALL WAVE_PART(wavenumber, centers_1(I, :), quad_points(J, Q, :), depth, &
+                XR, XZ, APD, NEXP, AMBDA, AR, SP2, VSP2_SYM, VSP2_ANTISYM)
             ELSE
-              CALL WAVE_PART_FINITE_DEPTH   &
-                (wavenumber,                &
-                centers_1(I, :),            &
-                quad_points(J, Q, :),       &
-                depth,                      &
-                XR, XZ, APD,                &
-                NEXP, AMBDA, AR,            &
-                SP2, VSP2_SYM, VSP2_ANTISYM &
-                )
+              CALL WAVE_PART(wavenumber, centers_1(I, :), quad_points(J, Q, :), depth, &
+                XR, XZ, APD, NEXP, AMBDA, AR, SP2)
             END IF
 
             S(I, J) = S(I, J) - coeff/(4*PI) * SP2 * quad_weights(J, Q)
-            K(I, J) = K(I, J) - coeff/(4*PI) * &
-              DOT_PRODUCT(normals_1(I, :), VSP2_SYM + VSP2_ANTISYM) * quad_weights(J, Q)
+            IF (gradient) THEN
+              K(I, J) = K(I, J) - coeff/(4*PI) * &
+                DOT_PRODUCT(normals_1(I, :), VSP2_SYM + VSP2_ANTISYM) * quad_weights(J, Q)
+            END IF
 
           END DO
         END DO
-        !$OMP END PARALLEL DO
       END DO
+      !$OMP END DO
     END IF
 
   END SUBROUTINE
@@ -202,7 +385,10 @@ CONTAINS
       XR, XZ, APD,                                    &
       NEXP, AMBDA, AR,                                &
       same_body,                                      &
-      S, K)
+      S, K, rankine_asymptotic_ratio, nb_threads,     &
+      gradient, nb_rows_K)
+    ! If gradient is false, the matrix K is not computed and is returned as an empty array,
+    ! such that the cost of the evaluation of S alone is roughly half of the cost of both matrices.
 
     ! Mesh data
     INTEGER,                                     INTENT(IN) :: nb_faces_1, nb_faces_2, nb_vertices_2
@@ -223,29 +409,64 @@ CONTAINS
     REAL(KIND=PRE), DIMENSION(3) :: coeffs
 
     ! Tabulated integrals
-    REAL(KIND=PRE), DIMENSION(328),           INTENT(IN) :: XR
-    REAL(KIND=PRE), DIMENSION(46),            INTENT(IN) :: XZ
-    REAL(KIND=PRE), DIMENSION(328, 46, 2, 2), INTENT(IN) :: APD
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
 
     ! Prony decomposition for finite depth
     INTEGER,                                  INTENT(IN) :: NEXP
     REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
 
+    ! Whether the matrix K is computed
+    LOGICAL, INTENT(IN) :: gradient
+    !f2py logical optional, intent(in) :: gradient = 1
+    INTEGER, INTENT(IN) :: nb_rows_K
+    !f2py integer intent(hide), depend(gradient, nb_faces_1) :: nb_rows_K = (gradient ? nb_faces_1 : 0)
+
     ! Output
     COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(OUT) :: S
-    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2), INTENT(OUT) :: K
+    COMPLEX(KIND=PRE), DIMENSION(nb_rows_K, nb_faces_2),  INTENT(OUT) :: K
+
+    ! Distance (in radii of the source face) above which the asymptotic value of the Rankine integral is used
+    REAL(KIND=PRE), INTENT(IN) :: rankine_asymptotic_ratio
+    !f2py real(kind=8) optional, intent(in) :: rankine_asymptotic_ratio = 7.0
+
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
 
     ! Local variables
-    INTEGER :: I
+    INTEGER :: I, J
     REAL(KIND=PRE), DIMENSION(nb_faces_1, 3) :: reflected_centers_1, reflected_normals_1
 
 
+    IF (depth == INFINITE_DEPTH) THEN
+      ! Reflection through free surface
+      reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
+      reflected_centers_1(:, 3)   = -centers_1(:, 3)
+    ELSE
+      ! Reflection through sea bottom
+      reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
+      reflected_centers_1(:, 3)   = -centers_1(:, 3) - 2*depth
+    END IF
+
+    reflected_normals_1(:, 1:2) = normals_1(:, 1:2)
+    reflected_normals_1(:, 3)   = -normals_1(:, 3)
+
+    ! A single team of threads is used for the whole assembly.
+    ! Each of the loops below is shared between the threads and ends with an implicit barrier.
+    !$OMP PARALLEL NUM_THREADS(NUMBER_OF_THREADS(nb_threads))
+
     !!!!!!!!!!!!!!!!!!!!
     !  Initialization  !
     !!!!!!!!!!!!!!!!!!!!
 
-    S(:, :) = CMPLX(0.0, 0.0, KIND=PRE)
-    K(:, :) = CMPLX(0.0, 0.0, KIND=PRE)
+    !$OMP DO SCHEDULE(STATIC) PRIVATE(J)
+    DO J = 1, nb_faces_2
+      S(:, J) = CMPLX(0.0, 0.0, KIND=PRE)
+      K(:, J) = CMPLX(0.0, 0.0, KIND=PRE)  ! No-op if K is empty
+    END DO
+    !$OMP END DO
 
 
     !!!!!!!!!!!!!!!!!!
@@ -253,12 +474,12 @@ CONTAINS
     !!!!!!!!!!!!!!!!!!
 
     IF (coeffs(1) .NE. ZERO) THEN
-      CALL ADD_RANKINE_PART_TO_THE_MATRICES(                            &
+      CALL RANKINE_PART_LOOP(                                           &
         nb_faces_1,                                                     &
         centers_1, normals_1,                                           &
         nb_vertices_2, nb_faces_2,                                      &
         vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
-        coeffs(1),                                                      &
+        coeffs(1), rankine_asymptotic_ratio,                            &
         S, K)
     END IF
 
@@ -268,28 +489,13 @@ CONTAINS
     !!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
     IF (coeffs(2) .NE. ZERO) THEN
-
-      IF (depth == INFINITE_DEPTH) THEN
-        ! Reflection through free surface
-        reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
-        reflected_centers_1(:, 3)   = -centers_1(:, 3)
-      ELSE
-        ! Reflection through sea bottom
-        reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
-        reflected_centers_1(:, 3)   = -centers_1(:, 3) - 2*depth
-      END IF
-
-      reflected_normals_1(:, 1:2) = normals_1(:, 1:2)
-      reflected_normals_1(:, 3)   = -normals_1(:, 3)
-
-      CALL ADD_RANKINE_PART_TO_THE_MATRICES(                            &
+      CALL RANKINE_PART_LOOP(                                           &
         nb_faces_1,                                                     &
         reflected_centers_1, reflected_normals_1,                       &
         nb_vertices_2, nb_faces_2,                                      &
         vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
-        coeffs(2),                                                      &
+        coeffs(2), rankine_asymptotic_ratio,                            &
         S, K)
-
     END IF
 
     !!!!!!!!!!!!!!!
@@ -297,8 +503,7 @@ CONTAINS
     !!!!!!!!!!!!!!!
 
     IF (coeffs(3) .NE. ZERO) THEN
-
-      CALL ADD_WAVE_PART_TO_THE_MATRICES(  &
+      CALL WAVE_PART_LOOP(                 &
         nb_faces_1, centers_1, normals_1,  &
         nb_faces_2, nb_quad_points,        &
         quad_points, quad_weights,         &
@@ -308,12 +513,13 @@ CONTAINS
         coeffs(3),                         &
         same_body,                         &
         S, K)
-
     END IF
 
+    !$OMP END PARALLEL
+
     !!!!!!!!!!!!!
 
-    IF (SAME_BODY) THEN
+    IF (SAME_BODY .AND. gradient) THEN
       DO I = 1, nb_faces_1
         K(I, I) = K(I, I) + 0.5
       END DO
@@ -325,4 +531,553 @@ CONTAINS
 
   ! =====================================================================
 
+  SUBROUTINE BUILD_FIELD_POINTS_MATRICES(            &
+      nb_points, points,                              &
+      nb_vertices_2, nb_faces_2, vertices_2, faces_2, &
+      centers_2, normals_2, areas_2, radiuses_2,      &
+      nb_quad_points, quad_points, quad_weights,      &
+      wavenumber, depth,                              &
+      coeffs,                                         &
+      XR, XZ, APD,                                    &
+      NEXP, AMBDA, AR,                                &
+      S, V, rankine_asymptotic_ratio, nb_threads,     &
+      gradient, nb_points_V)
+    ! Same as BUILD_MATRICES for arbitrary points that are not the centers of the faces of a mesh.
+    ! Instead of the normal derivative K, the full gradient V(I, J, :) of S(I, J) with respect to the point I
+    ! is returned if gradient is true (V is an empty array otherwise).
+    ! The three parts of the Green function are computed in a single pass over the pairs (point, face).
+    !f2py threadsafe
+
+    ! Points
+    INTEGER,                                     INTENT(IN) :: nb_points
+    REAL(KIND=PRE), DIMENSION(nb_points, 3),     INTENT(IN) :: points
+
+    ! Mesh data
+    INTEGER,                                     INTENT(IN) :: nb_faces_2, nb_vertices_2
+    REAL(KIND=PRE), DIMENSION(nb_vertices_2, 3), INTENT(IN) :: vertices_2
+    INTEGER,        DIMENSION(nb_faces_2, 4),    INTENT(IN) :: faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, 3),    INTENT(IN) :: centers_2, normals_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2),       INTENT(IN) :: areas_2, radiuses_2
+
+    INTEGER,                                                  INTENT(IN) :: nb_quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points, 3), INTENT(IN) :: quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points),    INTENT(IN) :: quad_weights
+
+    REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
+
+    REAL(KIND=PRE), DIMENSION(3) :: coeffs
+
+    ! Tabulated integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    ! Prony decomposition for finite depth
+    INTEGER,                                  INTENT(IN) :: NEXP
+    REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
+
+    ! Whether the gradient V is computed
+    LOGICAL, INTENT(IN) :: gradient
+    !f2py logical optional, intent(in) :: gradient = 0
+    INTEGER, INTENT(IN) :: nb_points_V
+    !f2py integer intent(hide), depend(gradient, nb_points) :: nb_points_V = (gradient ? nb_points : 0)
+
+    ! Output
+    COMPLEX(KIND=PRE), DIMENSION(nb_points, nb_faces_2),      INTENT(OUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(nb_points_V, nb_faces_2, 3), INTENT(OUT) :: V
+
+    ! Distance (in radii of the source face) above which the asymptotic value of the Rankine integral is used
+    REAL(KIND=PRE), INTENT(IN) :: rankine_asymptotic_ratio
+    !f2py real(kind=8) optional, intent(in) :: rankine_asymptotic_ratio = 7.0
+
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
+
+    ! Local variables
+    INTEGER                         :: I, J, Q
+    REAL(KIND=PRE), DIMENSION(3)    :: reflected_point
+    REAL(KIND=PRE)                  :: SP1
+    REAL(KIND=PRE), DIMENSION(3)    :: VSP1
+    COMPLEX(KIND=PRE)               :: SP2
+    COMPLEX(KIND=PRE), DIMENSION(3) :: VSP2_SYM, VSP2_ANTISYM
+
+    !$OMP PARALLEL DO NUM_THREADS(NUMBER_OF_THREADS(nb_threads)) COLLAPSE(2) SCHEDULE(STATIC) &
+    !$OMP&  PRIVATE(I, J, Q, reflected_point, SP1, VSP1, SP2, VSP2_SYM, VSP2_ANTISYM)
+    DO J = 1, nb_faces_2
+      DO I = 1, nb_points
+
+        S(I, J) = CMPLX(0.0, 0.0, KIND=PRE)
+        IF (gradient) V(I, J, :) = CMPLX(0.0, 0.0, KIND=PRE)
+
+        ! Rankine part
+        IF (coeffs(1) .NE. ZERO) THEN
+          IF (gradient) THEN
+            CALL RANKINE_PART(points(I, :), vertices_2, faces_2(J, :),                                &
+              centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), rankine_asymptotic_ratio, &
+              SP1, VSP1)
+            V(I, J, :) = V(I, J, :) - coeffs(1) * VSP1(:)/(4*PI)
+          ELSE
+            CALL RANKINE_PART(points(I, :), vertices_2, faces_2(J, :),                                &
+              centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), rankine_asymptotic_ratio, &
+              SP1)
+          END IF
+          S(I, J) = S(I, J) - coeffs(1) * SP1/(4*PI)
+        END IF
+
+        ! Reflected Rankine part, through the free surface (infinite depth) or the sea bottom (finite depth)
+        IF (coeffs(2) .NE. ZERO) THEN
+          reflected_point(1:2) = points(I, 1:2)
+          IF (depth == INFINITE_DEPTH) THEN
+            reflected_point(3) = -points(I, 3)
+          ELSE
+            reflected_point(3) = -points(I, 3) - 2*depth
+          END IF
+
+          IF (gradient) THEN
+            CALL RANKINE_PART(reflected_point, vertices_2, faces_2(J, :),                             &
+              centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), rankine_asymptotic_ratio, &
+              SP1, VSP1)
+            VSP1(3) = -VSP1(3)  ! Derivative with respect to the point, not to its image
+            V(I, J, :) = V(I, J, :) - coeffs(2) * VSP1(:)/(4*PI)
+          ELSE
+            CALL RANKINE_PART(reflected_point, vertices_2, faces_2(J, :),                             &
+              centers_2(J, :), normals_2(J, :), areas_2(J), radiuses_2(J), rankine_asymptotic_ratio, &
+              SP1)
+          END IF
+          S(I, J) = S(I, J) - coeffs(2) * SP1/(4*PI)
+        END IF
+
+        ! Wave part
+        IF (coeffs(3) .NE. ZERO) THEN
+          DO Q = 1, nb_quad_points
+            IF (gradient) THEN
+              CALL WAVE_PART(wavenumber, points(I, :), quad_points(J, Q, :), depth, &
+                XR, XZ, APD, NEXP, AMBDA, AR, SP2, VSP2_SYM, VSP2_ANTISYM)
+              V(I, J, :) = V(I, J, :) - coeffs(3)/(4*PI) * (VSP2_SYM + VSP2_ANTISYM) * quad_weights(J, Q)
+            ELSE
+              CALL WAVE_PART(wavenumber, points(I, :), quad_points(J, Q, :), depth, &
+                XR, XZ, APD, NEXP, AMBDA, AR, SP2)
+            END IF
+            S(I, J) = S(I, J) - coeffs(3)/(4*PI) * SP2 * quad_weights(J, Q)
+          END DO
+        END IF
+
+      END DO
+    END DO
+    !$OMP END PARALLEL DO
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE WAVE_PART_MULTIPLE_WAVENUMBERS(   &
+      nb_wavenumbers, wavenumbers,             &
+      X0I, X0J, depth,                         &
+      XR, XZ, APD,                             &
+      NEXP, NEXPS, AMBDA, AR,                  &
+      SP, VSP_SYM, VSP_ANTISYM)
+    ! Wave part of the Green function between two points for several wavenumbers.
+
+    INTEGER,                                   INTENT(IN) :: nb_wavenumbers
+    REAL(KIND=PRE), DIMENSION(nb_wavenumbers), INTENT(IN) :: wavenumbers
+    REAL(KIND=PRE), DIMENSION(3),              INTENT(IN) :: X0I, X0J
+    REAL(KIND=PRE),                            INTENT(IN) :: depth
+
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    INTEGER,                                         INTENT(IN) :: NEXP
+    INTEGER,        DIMENSION(nb_wavenumbers),       INTENT(IN) :: NEXPS
+    REAL(KIND=PRE), DIMENSION(NEXP, nb_wavenumbers), INTENT(IN) :: AMBDA, AR
+
+    COMPLEX(KIND=PRE), DIMENSION(nb_wavenumbers),    INTENT(OUT) :: SP
+    COMPLEX(KIND=PRE), DIMENSION(3, nb_wavenumbers), INTENT(OUT) :: VSP_SYM, VSP_ANTISYM
+
+    INTEGER :: W
+
+    IF (depth == INFINITE_DEPTH) THEN
+      CALL WAVE_PART_INFINITE_DEPTH_MULTI_WAVENUMBERS &
+        (nb_wavenumbers, wavenumbers, X0I, X0J,          &
+        XR, XZ, APD,                                     &
+        SP, VSP_SYM                                      &
+        )
+      VSP_ANTISYM(:, :) = ZERO
+    ELSE
+      ! The four images of the points depend on the depth, the geometry is not shared between the wavenumbers.
+      DO W = 1, nb_wavenumbers
+        CALL WAVE_PART_FINITE_DEPTH                &
+          (wavenumbers(W),                         &
+          X0I, X0J,                                &
+          depth,                                   &
+          XR, XZ, APD,                             &
+          NEXPS(W), AMBDA(:, W), AR(:, W),         &
+          SP(W), VSP_SYM(:, W), VSP_ANTISYM(:, W)  &
+          )
+      END DO
+    END IF
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE WAVE_PART_LOOP_MULTIPLE_WAVENUMBERS(  &
+      nb_faces_1, centers_1, normals_1,  &
+      nb_faces_2, nb_quad_points,        &
+      quad_points, quad_weights,         &
+      nb_wavenumbers, wavenumbers, depth, &
+      XR, XZ, APD,                       &
+      NEXP, NEXPS, AMBDA, AR,            &
+      coeff,                             &
+      same_body,                         &
+      S, K)
+    ! Same as WAVE_PART_LOOP for several wavenumbers at once: the wave part of the Green function is computed for
+    ! all the wavenumbers for a given pair of faces before moving to the next pair.
+    ! It should be called by all the threads of an enclosing parallel region (or outside of any parallel region).
+
+    ! Mesh data
+    INTEGER,                                  INTENT(IN) :: nb_faces_1, nb_faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3), INTENT(IN) :: normals_1, centers_1
+
+    INTEGER,                                                  INTENT(IN) :: nb_quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points, 3), INTENT(IN) :: quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points),    INTENT(IN) :: quad_weights
+
+    INTEGER,                                   INTENT(IN) :: nb_wavenumbers
+    REAL(KIND=PRE), DIMENSION(nb_wavenumbers), INTENT(IN) :: wavenumbers
+    REAL(KIND=PRE),                            INTENT(IN) :: depth
+
+    ! Tabulated integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    ! Prony decompositions for finite depth, one for each wavenumber
+    INTEGER,                                         INTENT(IN) :: NEXP
+    INTEGER,        DIMENSION(nb_wavenumbers),       INTENT(IN) :: NEXPS
+    REAL(KIND=PRE), DIMENSION(NEXP, nb_wavenumbers), INTENT(IN) :: AMBDA, AR
+
+    REAL(KIND=PRE), INTENT(IN) :: coeff
+
+    LOGICAL,                                  INTENT(IN) :: same_body
+
+    ! Output
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2, nb_wavenumbers), INTENT(INOUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2, nb_wavenumbers), INTENT(INOUT) :: K
+
+    ! Local variables
+    INTEGER                                         :: I, J, Q, W
+    COMPLEX(KIND=PRE), DIMENSION(nb_wavenumbers)    :: SP2
+    COMPLEX(KIND=PRE), DIMENSION(3, nb_wavenumbers) :: VSP2_SYM, VSP2_ANTISYM
+
+    IF ((SAME_BODY) .AND. (nb_quad_points == 1)) THEN
+      ! See WAVE_PART_LOOP for the symmetries used here.
+
+      !$OMP DO SCHEDULE(DYNAMIC) PRIVATE(I, J, W, SP2, VSP2_SYM, VSP2_ANTISYM)
+      DO J = 1, nb_faces_2
+        DO I = 1, J
+
+          CALL WAVE_PART_MULTIPLE_WAVENUMBERS(                &
+            nb_wavenumbers, wavenumbers,                     &
+            centers_1(I, :), quad_points(J, 1, :), depth,    &
+            XR, XZ, APD,                                     &
+            NEXP, NEXPS, AMBDA, AR,                          &
+            SP2, VSP2_SYM, VSP2_ANTISYM)
+
+          DO W = 1, nb_wavenumbers
+            S(I, J, W) = S(I, J, W) - coeff/(4*PI) * SP2(W) * quad_weights(J, 1)
+            K(I, J, W) = K(I, J, W) - coeff/(4*PI) * &
+              DOT_PRODUCT(normals_1(I, :), VSP2_SYM(:, W) + VSP2_ANTISYM(:, W)) * quad_weights(J, 1)
+
+            IF (.NOT. I==J) THEN
+              VSP2_SYM(1:2, W) = -VSP2_SYM(1:2, W)
+              S(J, I, W) = S(J, I, W) - coeff/(4*PI) * SP2(W) * quad_weights(I, 1)
+              K(J, I, W) = K(J, I, W) - coeff/(4*PI) * &
+                DOT_PRODUCT(normals_1(J, :), VSP2_SYM(:, W) - VSP2_ANTISYM(:, W)) * quad_weights(I, 1)
+            END IF
+          END DO
+
+        END DO
+      END DO
+      !$OMP END DO
+
+    ELSE
+
+      !$OMP DO COLLAPSE(2) SCHEDULE(STATIC) PRIVATE(I, J, Q, W, SP2, VSP2_SYM, VSP2_ANTISYM)
+      DO J = 1, nb_faces_2
+        DO I = 1, nb_faces_1
+          DO Q = 1, nb_quad_points
+
+            CALL WAVE_PART_MULTIPLE_WAVENUMBERS(              &
+              nb_wavenumbers, wavenumbers,                   &
+              centers_1(I, :), quad_points(J, Q, :), depth,  &
+              XR, XZ, APD,                                   &
+              NEXP, NEXPS, AMBDA, AR,                        &
+              SP2, VSP2_SYM, VSP2_ANTISYM)
+
+            DO W = 1, nb_wavenumbers
+              S(I, J, W) = S(I, J, W) - coeff/(4*PI) * SP2(W) * quad_weights(J, Q)
+              K(I, J, W) = K(I, J, W) - coeff/(4*PI) * &
+                DOT_PRODUCT(normals_1(I, :), VSP2_SYM(:, W) + VSP2_ANTISYM(:, W)) * quad_weights(J, Q)
+            END DO
+
+          END DO
+        END DO
+      END DO
+      !$OMP END DO
+    END IF
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE BUILD_MATRICES_MULTIPLE_WAVENUMBERS(     &
+      nb_faces_1, centers_1, normals_1,               &
+      nb_vertices_2, nb_faces_2, vertices_2, faces_2, &
+      centers_2, normals_2, areas_2, radiuses_2,      &
+      nb_quad_points, quad_points, quad_weights,      &
+      nb_wavenumbers, wavenumbers, depth,             &
+      coeffs,                                         &
+      XR, XZ, APD,                                    &
+      NEXP, NEXPS, AMBDA, AR,                         &
+      same_body,                                      &
+      S, K, rankine_asymptotic_ratio, nb_threads)
+    ! Same as BUILD_MATRICES for several wavenumbers at once, sharing the same coefficients.
+    ! The Rankine parts, that do not depend on the wavenumber, are computed only once,
+    ! and the wave parts for all the wavenumbers are computed in a single pass over the pairs of faces.
+
+    ! Mesh data
+    INTEGER,                                     INTENT(IN) :: nb_faces_1, nb_faces_2, nb_vertices_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3),    INTENT(IN) :: centers_1, normals_1
+    REAL(KIND=PRE), DIMENSION(nb_vertices_2, 3), INTENT(IN) :: vertices_2
+    INTEGER,        DIMENSION(nb_faces_2, 4),    INTENT(IN) :: faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, 3),    INTENT(IN) :: centers_2, normals_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2),       INTENT(IN) :: areas_2, radiuses_2
+
+    INTEGER,                                                  INTENT(IN) :: nb_quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points, 3), INTENT(IN) :: quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points),    INTENT(IN) :: quad_weights
+
+    LOGICAL,                                  INTENT(IN) :: same_body
+
+    INTEGER,                                   INTENT(IN) :: nb_wavenumbers
+    REAL(KIND=PRE), DIMENSION(nb_wavenumbers), INTENT(IN) :: wavenumbers
+    REAL(KIND=PRE),                            INTENT(IN) :: depth
+
+    REAL(KIND=PRE), DIMENSION(3) :: coeffs
+
+    ! Tabulated integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    ! Prony decompositions for finite depth, one for each wavenumber,
+    ! padded to the largest number of exponentials NEXP
+    INTEGER,                                         INTENT(IN) :: NEXP
+    INTEGER,        DIMENSION(nb_wavenumbers),       INTENT(IN) :: NEXPS
+    REAL(KIND=PRE), DIMENSION(NEXP, nb_wavenumbers), INTENT(IN) :: AMBDA, AR
+
+    ! Output
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2, nb_wavenumbers), INTENT(OUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(nb_faces_1, nb_faces_2, nb_wavenumbers), INTENT(OUT) :: K
+
+    ! Distance (in radii of the source face) above which the asymptotic value of the Rankine integral is used
+    REAL(KIND=PRE), INTENT(IN) :: rankine_asymptotic_ratio
+    !f2py real(kind=8) optional, intent(in) :: rankine_asymptotic_ratio = 7.0
+
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
+
+    ! Local variables
+    INTEGER :: I, J, W
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3) :: reflected_centers_1, reflected_normals_1
+
+    IF (depth == INFINITE_DEPTH) THEN
+      reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
+      reflected_centers_1(:, 3)   = -centers_1(:, 3)
+    ELSE
+      reflected_centers_1(:, 1:2) = centers_1(:, 1:2)
+      reflected_centers_1(:, 3)   = -centers_1(:, 3) - 2*depth
+    END IF
+
+    reflected_normals_1(:, 1:2) = normals_1(:, 1:2)
+    reflected_normals_1(:, 3)   = -normals_1(:, 3)
+
+    !$OMP PARALLEL NUM_THREADS(NUMBER_OF_THREADS(nb_threads))
+
+    ! Rankine parts, in the matrices of the first wavenumber...
+
+    !$OMP DO SCHEDULE(STATIC) PRIVATE(J)
+    DO J = 1, nb_faces_2
+      S(:, J, 1) = CMPLX(0.0, 0.0, KIND=PRE)
+      K(:, J, 1) = CMPLX(0.0, 0.0, KIND=PRE)
+    END DO
+    !$OMP END DO
+
+    IF (coeffs(1) .NE. ZERO) THEN
+      CALL RANKINE_PART_LOOP(                                           &
+        nb_faces_1,                                                     &
+        centers_1, normals_1,                                           &
+        nb_vertices_2, nb_faces_2,                                      &
+        vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
+        coeffs(1), rankine_asymptotic_ratio,                            &
+        S(:, :, 1), K(:, :, 1))
+    END IF
+
+    IF (coeffs(2) .NE. ZERO) THEN
+      CALL RANKINE_PART_LOOP(                                           &
+        nb_faces_1,                                                     &
+        reflected_centers_1, reflected_normals_1,                       &
+        nb_vertices_2, nb_faces_2,                                      &
+        vertices_2, faces_2, centers_2, normals_2, areas_2, radiuses_2, &
+        coeffs(2), rankine_asymptotic_ratio,                            &
+        S(:, :, 1), K(:, :, 1))
+    END IF
+
+    ! ... copied in the matrices of the other wavenumbers.
+
+    !$OMP DO SCHEDULE(STATIC) PRIVATE(J, W)
+    DO J = 1, nb_faces_2
+      DO W = 2, nb_wavenumbers
+        S(:, J, W) = S(:, J, 1)
+        K(:, J, W) = K(:, J, 1)
+      END DO
+    END DO
+    !$OMP END DO
+
+    ! Wave parts
+
+    IF (coeffs(3) .NE. ZERO) THEN
+      CALL WAVE_PART_LOOP_MULTIPLE_WAVENUMBERS( &
+        nb_faces_1, centers_1, normals_1,       &
+        nb_faces_2, nb_quad_points,             &
+        quad_points, quad_weights,              &
+        nb_wavenumbers, wavenumbers, depth,     &
+        XR, XZ, APD,                            &
+        NEXP, NEXPS, AMBDA, AR,                 &
+        coeffs(3),                              &
+        same_body,                              &
+        S, K)
+    END IF
+
+    !$OMP END PARALLEL
+
+    IF (SAME_BODY) THEN
+      DO W = 1, nb_wavenumbers
+        DO I = 1, nb_faces_1
+          K(I, I, W) = K(I, I, W) + 0.5
+        END DO
+      END DO
+    END IF
+
+    RETURN
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
+  SUBROUTINE ADD_NEAR_FIELD_WAVE_PART_CORRECTION(  &
+      nb_faces_1, centers_1, normals_1,  &
+      nb_faces_2, centers_2, areas_2,    &
+      nb_quad_points,                    &
+      quad_points, quad_weights,         &
+      nb_pairs, pairs_1, pairs_2,        &
+      wavenumber, depth,                 &
+      XR, XZ, APD,                       &
+      NEXP, AMBDA, AR,                   &
+      coeff,                             &
+      S, K, nb_threads)
+    ! For some pairs of faces (typically close to each other), replace the wave part computed with a single
+    ! quadrature point at the center of the face (as in ADD_WAVE_PART_TO_THE_MATRICES)
+    ! by the wave part computed with the given quadrature rule.
+    ! If K is empty, only S is corrected. If S is empty, only K is corrected.
+
+    ! Mesh data
+    INTEGER,                                  INTENT(IN) :: nb_faces_1, nb_faces_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_1, 3), INTENT(IN) :: normals_1, centers_1
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, 3), INTENT(IN) :: centers_2
+    REAL(KIND=PRE), DIMENSION(nb_faces_2),    INTENT(IN) :: areas_2
+
+    INTEGER,                                                  INTENT(IN) :: nb_quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points, 3), INTENT(IN) :: quad_points
+    REAL(KIND=PRE), DIMENSION(nb_faces_2, nb_quad_points),    INTENT(IN) :: quad_weights
+
+    ! Indices of the pairs of faces to be corrected
+    INTEGER,                                  INTENT(IN) :: nb_pairs
+    INTEGER, DIMENSION(nb_pairs),             INTENT(IN) :: pairs_1, pairs_2
+
+    REAL(KIND=PRE),                           INTENT(IN) :: wavenumber, depth
+
+    ! Tabulated integrals
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XR
+    REAL(KIND=PRE), DIMENSION(:),             INTENT(IN) :: XZ
+    REAL(KIND=PRE), DIMENSION(:, :, :, :),    INTENT(IN) :: APD
+
+    ! Prony decomposition for finite depth
+    INTEGER,                                  INTENT(IN) :: NEXP
+    REAL(KIND=PRE), DIMENSION(NEXP),          INTENT(IN) :: AMBDA, AR
+
+    REAL(KIND=PRE), INTENT(IN) :: coeff
+
+    ! Output
+    COMPLEX(KIND=PRE), DIMENSION(:, :), INTENT(INOUT) :: S
+    COMPLEX(KIND=PRE), DIMENSION(:, :), INTENT(INOUT) :: K
+
+    ! Number of threads (0 for the OpenMP default)
+    INTEGER, INTENT(IN) :: nb_threads
+    !f2py integer optional, intent(in) :: nb_threads = 0
+
+    ! Local variables
+    INTEGER                         :: P, I, J, Q
+    LOGICAL                         :: potential, gradient
+    REAL(KIND=PRE)                  :: weight
+    REAL(KIND=PRE), DIMENSION(3)    :: point
+    COMPLEX(KIND=PRE)               :: SP2
+    COMPLEX(KIND=PRE), DIMENSION(3) :: VSP2_SYM, VSP2_ANTISYM
+
+    potential = (SIZE(S) > 0)
+    gradient = (SIZE(K) > 0)
+
+    ! Each pair appears only once in the list, so that no two iterations write the same coefficient.
+    !$OMP PARALLEL DO NUM_THREADS(NUMBER_OF_THREADS(nb_threads)) SCHEDULE(STATIC) &
+    !$OMP&  PRIVATE(P, I, J, Q, weight, point, SP2, VSP2_SYM, VSP2_ANTISYM)
+    DO P = 1, nb_pairs
+      I = pairs_1(P)
+      J = pairs_2(P)
+
+      ! Q = 0 is the center of the face with a negative weight, to remove the wave part already in the matrices.
+      DO Q = 0, nb_quad_points
+        IF (Q == 0) THEN
+          point(:) = centers_2(J, :)
+          weight = -areas_2(J)
+        ELSE
+          point(:) = quad_points(J, Q, :)
+          weight = quad_weights(J, Q)
+        END IF
+
+        IF (gradient) THEN
+          CALL WAVE_PART(wavenumber, centers_1(I, :), point, depth, &
+            XR, XZ, APD, NEXP, AMBDA, AR, SP2, VSP2_SYM, VSP2_ANTISYM)
+        ELSE
+          CALL WAVE_PART(wavenumber, centers_1(I, :), point, depth, &
+            XR, XZ, APD, NEXP, AMBDA, AR, SP2)
+        END IF
+
+        IF (potential) THEN
+          S(I, J) = S(I, J) - coeff/(4*PI) * SP2 * weight
+        END IF
+        IF (gradient) THEN
+          K(I, J) = K(I, J) - coeff/(4*PI) * &
+            DOT_PRODUCT(normals_1(I, :), VSP2_SYM + VSP2_ANTISYM) * weight
+        END IF
+      END DO
+    END DO
+    !$OMP END PARALLEL DO
+
+  END SUBROUTINE
+
+  ! =====================================================================
+
 END MODULE MATRICES
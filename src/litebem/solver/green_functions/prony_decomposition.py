@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Decomposition of a part of the finite depth Green function as a sum of exponential functions.
+
+The decomposition only depends on the dimensionless wavenumber :math:`kh` (and on the dimensionless angular
+frequency :math:`kh \\tanh(kh)`). It is computed once by Prony's method and then stored in memory and in a
+small :code:`.npy` file per decomposition, such that it is reused by the following runs, for instance the other
+frequencies and depths of a sweep computed later. The files are stored in the same directory as the tabulation
+of the Green function (see :mod:`litebem.solver.green_functions.tabulation`), unless another one is given.
+The decompositions of a planned sweep can also be computed in advance with :func:`precompute_exponential_decompositions`.
+"""
+
+import os
+import logging
+from functools import lru_cache
+
+import numpy as np
+from scipy import linalg
+
+import litebem.solver.green_functions.delhommeau_f90 as delhommeau_f90
+from litebem.solver.green_functions.tabulation import default_tabulation_directory
+from litebem.tools.io import atomic_save
+
+LOG = logging.getLogger(__name__)
+
+# To be incremented when the way the decompositions are computed or stored changes.
+PRONY_FORMAT_VERSION = 1
+
+PRONY_DECOMPOSITION_METHODS = ('fortran', 'python')
+
+
+#######################
+#  Prony's method     #
+#######################
+
+def ff(x, dimensionless_omega, dimensionless_wavenumber):
+    """The function approximated by a sum of exponentials, vectorized version of FF in old_Prony_decomposition.f90.
+
+    Parameters
+    ----------
+    x: array
+    dimensionless_omega: float
+        dimensionless angular frequency: :math:`kh \\tanh (kh) = \\omega^2 h/g`
+    dimensionless_wavenumber: float
+        dimensionless wavenumber: :math:`kh`
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ak, am = dimensionless_omega, dimensionless_wavenumber
+    coef = (am + ak)**2/(am**2 - ak**2 + ak)
+    tol = max(0.1, 0.1*am)
+
+    def far_from_pole(x):
+        return (x + ak)*np.exp(x)/(x*np.sinh(x) - ak*np.cosh(x)) - coef/(x - am) - 2
+
+    # Close to the pole x = am, the function is replaced by its quadratic interpolation.
+    a, b, c = am - tol, am, am + tol
+    d, f = far_from_pole(a), far_from_pole(c)
+    e = coef/(am + ak)*(am + ak + 1) - (coef/(am + ak))**2*am - 2
+    interpolation = (d*(x - b)*(x - c)/((a - b)*(a - c))
+                     + e*(x - c)*(x - a)/((b - c)*(b - a))
+                     + f*(x - a)*(x - b)/((c - a)*(c - b)))
+
+    near_pole = np.abs(x - am) <= tol
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(near_pole, interpolation, far_from_pole(np.where(near_pole, a, x)))
+
+
+def exponential_decomposition(X, F, m):
+    """Approximate the function sampled as F = f(X) on the regular grid X by a sum of m exponential functions
+    :math:`x \\mapsto \\sum_i a_i \\exp(\\lambda_i x)`, with Prony's method.
+
+    Parameters
+    ----------
+    X: array of shape (n,)
+        regularly spaced points, with n >= 2m
+    F: array of shape (n,)
+        values of the function at these points
+    m: int
+        number of exponential functions
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        the amplitudes a and growth rates lamda of the exponentials
+    """
+    X, F = np.asarray(X), np.asarray(F)
+    assert len(X) == len(F) >= 2*m
+
+    # Linear prediction F[k] = sum_j p_j F[k-j] of each sample from the m previous ones, in the least squares sense.
+    A = linalg.toeplitz(c=F[m-1:-1], r=F[m-1::-1])
+    p, *_ = np.linalg.lstsq(A, F[m:], rcond=None)
+
+    # The roots of the characteristic polynomial are the exponentials exp(lamda h) of the grid step h.
+    roots = np.roots(np.concatenate([[1.0], -p]))
+    lamda = np.real(np.log(roots.astype(complex))/(X[1] - X[0]))
+
+    # Amplitudes, in the least squares sense.
+    a, *_ = np.linalg.lstsq(np.exp(np.outer(X, lamda)), F, rcond=None)
+    return a, lamda
+
+
+def error_exponential_decomposition(X, F, a, lamda):
+    """Mean square error of the decomposition on the points X."""
+    return np.mean(np.square(np.exp(np.outer(X, lamda)) @ a - F))
+
+
+def compute_exponential_decomposition(dimensionless_omega, dimensionless_wavenumber, method='fortran'):
+    """Compute the decomposition of a part of the finite depth Green function as a sum of exponential functions.
+
+    Two implementations are available: the legacy Fortran implementation from Nemoh and a newer one written in Python.
+    For some still unexplained reasons, the two implementations do not always give the exact same result.
+    Until the problem is better understood, the Fortran implementation is the default one, to ensure consistency with Nemoh.
+
+    Parameters
+    ----------
+    dimensionless_omega: float
+        dimensionless angular frequency: :math:`kh \\tanh (kh) = \\omega^2 h/g`
+    dimensionless_wavenumber: float
+        dimensionless wavenumber: :math:`kh`
+    method: string, optional
+        the implementation that should be used to compute the Prony decomposition: 'fortran' (default) or 'python'
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        the amplitude and growth rates of the exponentials
+    """
+    LOG.debug("\tCompute Prony decomposition in finite depth Green function "
+              "for dimless_omega=%.2e and dimless_wavenumber=%.2e",
+              dimensionless_omega, dimensionless_wavenumber)
+
+    if method.lower() == 'python':
+        # Try different increasing number of exponentials
+        for n_exp in range(4, 31, 2):
+
+            # The coefficients are computed on a resolution of 4*n_exp+1 ...
+            X = np.linspace(-0.1, 20.0, 4*n_exp+1)
+            a, lamda = exponential_decomposition(X, ff(X, dimensionless_omega, dimensionless_wavenumber), n_exp)
+
+            # ... and they are evaluated on a finer discretization.
+            X = np.linspace(-0.1, 20.0, 8*n_exp+1)
+            if error_exponential_decomposition(X, ff(X, dimensionless_omega, dimensionless_wavenumber), a, lamda) < 1e-4:
+                break
+
+        else:
+            LOG.warning("No suitable exponential decomposition has been found"
+                        "for dimless_omega=%.2e and dimless_wavenumber=%.2e",
+                        dimensionless_omega, dimensionless_wavenumber)
+
+    elif method.lower() == 'fortran':
+        lamda, a, nexp = delhommeau_f90.old_prony_decomposition.lisc(dimensionless_omega, dimensionless_wavenumber)
+        lamda = lamda[:nexp]
+        a = a[:nexp]
+
+    else:
+        raise ValueError("Unrecognized method name for the Prony decomposition.")
+
+    # Add one more exponential function (actually a constant).
+    # It is not clear where it comes from exactly in the theory...
+    a = np.concatenate([a, np.array([2])])
+    lamda = np.concatenate([lamda, np.array([0.0])])
+
+    return a, lamda
+
+
+#######################
+#  Persistent cache   #
+#######################
+
+def decomposition_file_path(dimensionless_omega, dimensionless_wavenumber, method, directory):
+    # The exact hexadecimal representation of the floats is used, such that a stored decomposition
+    # is only reused for the very same parameters.
+    return os.path.join(directory, f"prony_v{PRONY_FORMAT_VERSION}_{method.lower()}",
+                        f"{float(dimensionless_omega).hex()}_{float(dimensionless_wavenumber).hex()}.npy")
+
+
+@lru_cache(maxsize=1024)
+def load_exponential_decomposition(dimensionless_omega, dimensionless_wavenumber, method='fortran', directory=None):
+    """Load the decomposition from its file, after computing and storing it if the file does not exist yet.
+
+    Parameters
+    ----------
+    dimensionless_omega: float
+        dimensionless angular frequency: :math:`kh \\tanh (kh) = \\omega^2 h/g`
+    dimensionless_wavenumber: float
+        dimensionless wavenumber: :math:`kh`
+    method: string, optional
+        see :func:`compute_exponential_decomposition`
+    directory: str, optional
+        directory of the files (default: :func:`~litebem.solver.green_functions.tabulation.default_tabulation_directory`).
+        If the file can not be written in it, the decomposition is only kept in memory.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        same as :func:`compute_exponential_decomposition`
+    """
+    if directory is None:
+        directory = default_tabulation_directory()
+    path = decomposition_file_path(dimensionless_omega, dimensionless_wavenumber, method, directory)
+
+    if os.path.isfile(path):
+        try:
+            data = np.load(path)
+            if data.ndim == 2 and data.shape[0] == 2 and data.dtype == np.float64:
+                data.flags.writeable = False  # The same arrays are returned by the lru_cache to every caller.
+                return data[0], data[1]
+        except (OSError, ValueError):
+            pass
+        LOG.warning(f"Unreadable Prony decomposition in {path}. It is computed again.")
+
+    a, lamda = compute_exponential_decomposition(dimensionless_omega, dimensionless_wavenumber, method)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_save(path, np.stack([a, lamda]).astype(np.float64))
+    except OSError as error:
+        LOG.warning(f"The Prony decomposition could not be stored in {directory}: {error}")
+
+    a.flags.writeable = False
+    lamda.flags.writeable = False
+    return a, lamda
+
+
+def precompute_exponential_decompositions(dimensionless_wavenumbers, method='fortran', directory=None):
+    """Compute and store in advance the decompositions for a set of dimensionless wavenumbers :math:`kh`,
+    for instance the whole grid of depths and frequencies of a sweep, to be shared by several runs or processes.
+
+    Parameters
+    ----------
+    dimensionless_wavenumbers: array of floats
+        the values of :math:`kh`
+    method: string, optional
+        see :func:`compute_exponential_decomposition`
+    directory: str, optional
+        see :func:`load_exponential_decomposition`
+    """
+    for kh in np.asarray(dimensionless_wavenumbers, dtype=np.float64).ravel():
+        load_exponential_decomposition(kh*np.tanh(kh), kh, method, directory)
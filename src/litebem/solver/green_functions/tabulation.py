@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Storage of the tabulated integrals used by Delhommeau's Green function.
+
+The tabulation only depends on the size of its grid and on the number of integration points.
+It is computed once by the Fortran core and written in a versioned :code:`.npy` file.
+The file is then loaded as a read-only memory-mapped array, such that all the processes using the same
+tabulation (e.g. the workers of :func:`litebem.solver.parallel.solve_batches_in_pool`) share a single
+physical copy of it, and do not need to compute it again when they start.
+
+The files are stored in the directory given by the environment variable :code:`LITEBEM_CACHE_DIR`,
+or by default in :code:`~/.cache/litebem`. They can be generated in advance in a shared directory
+with :func:`load_tabulated_integrals`.
+"""
+
+import os
+import logging
+
+import numpy as np
+
+import litebem.solver.green_functions.delhommeau_f90 as delhommeau_f90
+from litebem.tools.io import atomic_save
+
+LOG = logging.getLogger(__name__)
+
+# To be incremented when the way the tabulation is computed or stored changes.
+TABULATION_FORMAT_VERSION = 1
+
+# The axes of the tabulation built by the Fortran core do not depend on the size of the grid: a smaller grid
+# is only a truncation of the default one. Beyond the last tabulated point, the Fortran core uses the asymptotic
+# approximations of the integrals, which are only accurate for r > 100 or Z < -16, that is
+# from 328 points along r. Along Z, the axis is constant from 46 points on and the extra points are unused.
+MIN_GRID_SHAPE = (328, 46)
+MAX_NB_POINTS_Z = 46
+
+
+def default_tabulation_directory():
+    """Directory in which the tabulations are stored when no other directory is given."""
+    return os.environ.get('LITEBEM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'litebem'))
+
+
+def tabulation_file_name(nb_points_r, nb_points_z, nb_integration_points):
+    return f"delhommeau_tabulation_v{TABULATION_FORMAT_VERSION}_{nb_points_r}x{nb_points_z}_{nb_integration_points}.npy"
+
+
+def _pack(r_range, z_range, integrals):
+    """All the arrays of the tabulation in a single flat array, to be stored in a single file."""
+    return np.concatenate([r_range, z_range, integrals.ravel(order='F')])
+
+
+def _unpack(data, nb_points_r, nb_points_z):
+    """Views of a flat array as the three arrays of the tabulation, in the layout expected by the Fortran core."""
+    data = np.asarray(data)
+    r_range = data[:nb_points_r]
+    z_range = data[nb_points_r:nb_points_r + nb_points_z]
+    integrals = data[nb_points_r + nb_points_z:].reshape((nb_points_r, nb_points_z, 2, 2), order='F')
+    return r_range, z_range, integrals
+
+
+def compute_tabulated_integrals(nb_points_r, nb_points_z, nb_integration_points):
+    """Compute the tabulation with the Fortran core, without storing it.
+
+    Returns
+    -------
+    tuple of three arrays
+        the tabulated values of the dimensionless horizontal distance r, of the dimensionless vertical coordinate Z,
+        and the array of shape (nb_points_r, nb_points_z, 2, 2) of the integrals.
+    """
+    LOG.debug(f"Compute the tabulation of the Green function on a grid of {nb_points_r}x{nb_points_z} points "
+              f"with {nb_integration_points} integration points.")
+    return delhommeau_f90.initialize_green_wave.initialize_tabulated_integrals(
+        nb_points_r, nb_points_z, nb_integration_points)
+
+
+def load_tabulated_integrals(nb_points_r=328, nb_points_z=46, nb_integration_points=251, directory=None):
+    """Load the tabulation from its file, after computing and storing it if the file does not exist yet.
+
+    Parameters
+    ----------
+    nb_points_r: int, optional
+        number of points of the grid along the dimensionless horizontal distance r (default: 328)
+    nb_points_z: int, optional
+        number of points of the grid along the dimensionless vertical coordinate Z (default: 46)
+    nb_integration_points: int, optional
+        number of points for the integration w.r.t. theta (default: 251)
+    directory: str, optional
+        directory of the file (default: :func:`default_tabulation_directory`).
+        If the file can not be written in it, the tabulation is only kept in memory.
+
+    Returns
+    -------
+    tuple of three arrays
+        same as :func:`compute_tabulated_integrals`, but read-only and memory-mapped when the file could be used.
+    """
+    if directory is None:
+        directory = default_tabulation_directory()
+    path = os.path.join(directory, tabulation_file_name(nb_points_r, nb_points_z, nb_integration_points))
+    expected_size = nb_points_r + nb_points_z + 4*nb_points_r*nb_points_z
+
+    if os.path.isfile(path):
+        try:
+            data = np.load(path, mmap_mode='r')
+            if data.shape == (expected_size,) and data.dtype == np.float64:
+                LOG.debug(f"Tabulation of the Green function loaded from {path}.")
+                return _unpack(data, nb_points_r, nb_points_z)
+        except (OSError, ValueError):
+            pass
+        LOG.warning(f"Unreadable tabulation of the Green function in {path}. It is computed again.")
+
+    tabulation = compute_tabulated_integrals(nb_points_r, nb_points_z, nb_integration_points)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        atomic_save(path, _pack(*tabulation))
+    except OSError as error:
+        LOG.warning(f"The tabulation of the Green function could not be stored in {directory}: {error}")
+        return tabulation
+
+    LOG.debug(f"Tabulation of the Green function stored in {path}.")
+    return _unpack(np.load(path, mmap_mode='r'), nb_points_r, nb_points_z)
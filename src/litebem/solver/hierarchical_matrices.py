@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Hierarchical matrices: the interactions between distant groups of panels are compressed as low-rank blocks.
+
+The panels are grouped in a tree of clusters by recursive bisection of the cloud of their centers.
+The blocks of the matrices coupling two clusters far enough from each other are approximated by
+adaptive cross approximation (ACA), which only requires the evaluation of a few of their rows and columns.
+The other blocks are stored as dense arrays.
+"""
+
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+
+class ClusterTree:
+    """Binary tree of clusters of panels, built by recursive bisection along the largest dimension.
+
+    Parameters
+    ----------
+    centers: array of shape (nPanels, 3)
+        centers of the panels
+    radii: array of shape (nPanels,)
+        radii of the panels
+    leaf_size: int, optional
+        maximum number of panels in a leaf of the tree (default: 32)
+    ids: array of int, optional
+        indices of the panels in this cluster (default: all of them)
+
+    Attributes
+    ----------
+    ids: array of int
+        indices of the panels in this cluster
+    center: array of shape (3,)
+        center of the bounding sphere of the panels of the cluster
+    radius: float
+        radius of the bounding sphere of the panels of the cluster
+    children: tuple of ClusterTree
+        the two halves of the cluster, or an empty tuple for a leaf
+    """
+
+    def __init__(self, centers, radii, leaf_size=32, ids=None):
+        if ids is None:
+            ids = np.arange(len(centers))
+        self.ids = ids
+
+        points = centers[ids]
+        lower, upper = points.min(axis=0), points.max(axis=0)
+        self.center = (lower + upper)/2
+        self.radius = np.max(np.linalg.norm(points - self.center, axis=1) + radii[ids])
+
+        if len(ids) > leaf_size:
+            axis = np.argmax(upper - lower)
+            order = np.argsort(points[:, axis], kind='stable')
+            half = len(ids)//2
+            self.children = (ClusterTree(centers, radii, leaf_size, ids[order[:half]]),
+                             ClusterTree(centers, radii, leaf_size, ids[order[half:]]))
+        else:
+            self.children = ()
+
+    @property
+    def is_leaf(self):
+        return len(self.children) == 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_admissible_with(self, other, admissibility):
+        """True if the interactions between the two clusters can be approximated by a low-rank matrix,
+        that is if the distance between their centers is larger than :code:`admissibility`
+        times the sum of their radii."""
+        distance = np.linalg.norm(self.center - other.center)
+        return distance > admissibility*(self.radius + other.radius)
+
+
+class LowRankMatrix:
+    """Matrix stored as the product of a tall matrix and a wide matrix.
+
+    Parameters
+    ----------
+    left: array of shape (nRows, rank)
+    right: array of shape (rank, nColumns)
+    """
+
+    ndim = 2
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    @property
+    def shape(self):
+        return self.left.shape[0], self.right.shape[1]
+
+    @property
+    def rank(self):
+        return self.left.shape[1]
+
+    @property
+    def dtype(self):
+        return self.left.dtype
+
+    @property
+    def nbytes(self):
+        return self.left.nbytes + self.right.nbytes
+
+    def __matmul__(self, other):
+        return self.left @ (self.right @ other)
+
+    def full_matrix(self):
+        return self.left @ self.right
+
+    def __str__(self):
+        return f"LowRankMatrix(shape={self.shape}, rank={self.rank})"
+
+
+def adaptive_cross_approximation(get_row, get_column, shape, tolerance, max_rank=None):
+    """Low-rank approximation of a matrix by partially pivoted adaptive cross approximation.
+
+    Parameters
+    ----------
+    get_row: function
+        takes the index of a row and returns the corresponding row of the matrix
+    get_column: function
+        takes the index of a column and returns the corresponding column of the matrix
+    shape: tuple of two ints
+        shape of the matrix
+    tolerance: float
+        relative tolerance (in Frobenius norm) of the approximation
+    max_rank: int, optional
+        maximum rank of the approximation (default: half of the smallest dimension of the matrix)
+
+    Returns
+    -------
+    LowRankMatrix or None
+        the approximation, or None if the tolerance could not be reached with a rank lower than max_rank,
+        in which case it is cheaper to store the full block.
+    """
+    nRows, nColumns = shape
+    if max_rank is None:
+        max_rank = min(nRows, nColumns)//2
+    if max_rank == 0:
+        return None
+
+    left, right = None, None
+    rank = 0
+    squared_norm = 0.0  # Squared Frobenius norm of the approximation
+    nb_small_updates = 0
+    available_rows = np.ones(nRows, dtype=bool)
+    i = 0
+
+    while rank < max_rank:
+        available_rows[i] = False
+        row = np.array(get_row(i))
+        if left is None:
+            left = np.zeros((nRows, max_rank), dtype=row.dtype)
+            right = np.zeros((max_rank, nColumns), dtype=row.dtype)
+        row -= left[i, :rank] @ right[:rank, :]
+        j = np.argmax(np.abs(row))
+
+        if row[j] != 0.0:
+            v = row/row[j]
+            u = np.array(get_column(j), dtype=left.dtype)
+            u -= left[:, :rank] @ right[:rank, j]
+
+            update_norm = np.linalg.norm(u)*np.linalg.norm(v)
+            squared_norm += update_norm**2 + 2*np.real(
+                (left[:, :rank].conj().T @ u) @ (right[:rank, :].conj() @ v))
+            left[:, rank], right[rank, :] = u, v
+            rank += 1
+
+            # The convergence is only assumed after two successive small updates,
+            # to reduce the risk of stopping on an unluckily chosen pivot.
+            if update_norm <= tolerance*np.sqrt(squared_norm):
+                nb_small_updates += 1
+                if nb_small_updates == 2:
+                    return LowRankMatrix(left[:, :rank].copy(), right[:rank, :].copy())
+            else:
+                nb_small_updates = 0
+
+            next_rows = np.where(available_rows, np.abs(u), -1.0)
+        else:
+            # This row is already exactly approximated, try another one.
+            next_rows = available_rows.astype(float) - 1.0
+
+        if not available_rows.any():
+            break
+        i = np.argmax(next_rows)
+
+    return None
+
+
+def truncated_svd(matrix, tolerance):
+    """Low-rank approximation of a dense matrix by truncated singular value decomposition.
+
+    Parameters
+    ----------
+    matrix: 2D array
+    tolerance: float
+        relative tolerance (in Frobenius norm) of the approximation
+
+    Returns
+    -------
+    LowRankMatrix or None
+        the approximation of lowest rank within the tolerance, or None if it would use more memory than the dense matrix.
+    """
+    u, s, vh = np.linalg.svd(matrix, full_matrices=False)
+    # Norm of the error when truncating after each of the singular values.
+    errors = np.sqrt(np.cumsum(s[::-1]**2))[::-1]
+    rank = int(np.count_nonzero(errors > tolerance*errors[0])) if len(s) > 0 else 0
+    if rank*sum(matrix.shape) >= matrix.size:
+        return None
+    return LowRankMatrix(u[:, :rank]*s[:rank], vh[:rank, :].copy())
+
+
+class HierarchicalMatrix:
+    """Matrix stored as a set of dense and low-rank blocks, each of them coupling a subset of the rows
+    with a subset of the columns.
+
+    It can be multiplied with vectors (or 2D arrays of vectors) and used as a linear operator,
+    for instance in the GMRES solver.
+
+    Parameters
+    ----------
+    shape: tuple of two ints
+        shape of the full matrix
+    blocks: list of tuples (row_ids, column_ids, block)
+        the blocks of the matrix, where block is either a numpy array or a LowRankMatrix.
+        Each entry of the full matrix should be covered by exactly one block.
+    dtype: numpy dtype, optional
+    """
+
+    ndim = 2
+
+    def __init__(self, shape, blocks, dtype=np.complex128):
+        self.shape = shape
+        self.blocks = blocks
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for _, _, block in self.blocks)
+
+    @property
+    def compression_rate(self):
+        """Memory used by the blocks divided by the memory that the full matrix would have used."""
+        return self.nbytes/(self.shape[0]*self.shape[1]*self.dtype.itemsize)
+
+    @property
+    def nb_low_rank_blocks(self):
+        return sum(isinstance(block, LowRankMatrix) for _, _, block in self.blocks)
+
+    def __matmul__(self, other):
+        other = np.asarray(other)
+        result = np.zeros((self.shape[0],) + other.shape[1:], dtype=np.result_type(self.dtype, other.dtype))
+        for row_ids, column_ids, block in self.blocks:
+            result[row_ids] += block @ other[column_ids]
+        return result
+
+    def matvec(self, x):
+        return self @ x
+
+    def full_matrix(self):
+        full = np.zeros(self.shape, dtype=self.dtype)
+        for row_ids, column_ids, block in self.blocks:
+            full[np.ix_(row_ids, column_ids)] = block if isinstance(block, np.ndarray) else block.full_matrix()
+        return full
+
+    def __str__(self):
+        return (f"HierarchicalMatrix(shape={self.shape}, nb_blocks={len(self.blocks)}, "
+                f"nb_low_rank_blocks={self.nb_low_rank_blocks}, compression_rate={self.compression_rate:.1%})")
@@ -3,73 +3,207 @@
 """The linear solvers used in Capytaine.
 
 They are based on numpy solvers with a thin layer for the handling of Hierarchical Toeplitz matrices.
+
+Matrices stored in single precision (complex64) are factored in single precision, and the solution is then
+improved by a few steps of iterative refinement, in which the residual is computed in double precision.
 """
 # Copyright (C) 2017-2019 Matthieu Ancellin
 # See LICENSE file at <https://github.com/mancellin/capytaine>
 
 import logging
-from functools import lru_cache
+import weakref
+from collections import OrderedDict, namedtuple
 
 import numpy as np
 from scipy import linalg as sl
 from scipy.sparse import linalg as ssl
 
+from litebem.solver.hierarchical_matrices import HierarchicalMatrix
+from litebem.solver.block_matrices import BlockSymmetricToeplitzMatrix, BlockCirculantMatrix
 # from capytaine.matrices.block import BlockMatrix
-# from capytaine.matrices.block_toeplitz import BlockSymmetricToeplitzMatrix, BlockCirculantMatrix
 
 LOG = logging.getLogger(__name__)
 
 
-# # DIRECT SOLVER
+# DIRECT SOLVER
+
+def solve_directly(A, b):
+    """Solve the linear system A x = b with a direct solver.
+    b can be a vector or a 2D array whose columns are several right-hand sides sharing the same matrix."""
+    assert isinstance(b, np.ndarray) and A.ndim == 2 and A.shape[-1] == b.shape[0]
+    if isinstance(A, BlockCirculantMatrix):
+        LOG.debug("\tSolve linear system %s", A)
+        blocks_of_diagonalization = A.block_diagonalize()
+        fft_of_rhs = np.fft.fft(np.reshape(b, (A.nb_blocks[0], A.block_shape[0], -1)), axis=0)
+        try:  # Try to run it as vectorized numpy arrays.
+            fft_of_result = np.linalg.solve(blocks_of_diagonalization, fft_of_rhs)
+        except np.linalg.LinAlgError:  # Or do the same thing with list comprehension.
+            fft_of_result = np.array([solve_directly(block, vec) for block, vec in zip(blocks_of_diagonalization, fft_of_rhs)])
+        result = np.fft.ifft(fft_of_result, axis=0).reshape(b.shape)
+        return result
+
+    elif isinstance(A, BlockSymmetricToeplitzMatrix):
+        if A.nb_blocks == (2, 2):
+            LOG.debug("\tSolve linear system %s", A)
+            A1, A2 = A._stored_blocks[0, :]
+            b1, b2 = b[:len(b)//2], b[len(b)//2:]
+            x_plus = solve_directly(A1 + A2, b1 + b2)
+            x_minus = solve_directly(A1 - A2, b1 - b2)
+            return np.concatenate([x_plus + x_minus, x_plus - x_minus])/2
+        else:
+            # Not implemented
+            LOG.debug("\tSolve linear system %s", A)
+            return solve_directly(A.full_matrix(), b)
+
+    # elif isinstance(A, BlockMatrix):
+    #     LOG.debug("\tSolve linear system %s", A)
+    #     return solve_directly(A.full_matrix(), b)
+
+    elif isinstance(A, np.ndarray) and A.dtype == np.complex64:
+        LOG.debug(f"\tSolve linear system (size: {A.shape}) in single precision with iterative refinement.")
+        return _lu_solve(_lu_factor(A), b)
+
+    elif isinstance(A, np.ndarray):
+        LOG.debug(f"\tSolve linear system (size: {A.shape}) with numpy direct solver.")
+        return np.linalg.solve(A, b)
+
+    elif isinstance(A, HierarchicalMatrix):
+        LOG.debug("\tSolve linear system %s", A)
+        return solve_directly(A.full_matrix(), b)
+
+    else:
+        raise ValueError(f"Unrecognized type of matrix to solve: {A}")
+
+
+# MIXED PRECISION
+
+# Number of entries of a single precision matrix converted at once to double precision.
+DOUBLE_PRECISION_CHUNK_SIZE = 2**22
+
+def double_precision_matvec(A, x):
+    """Compute A @ x in double precision, also when A is stored in single precision.
+    The rows of a single precision matrix are converted by chunks, such that no double precision copy
+    of the whole matrix is ever made."""
+    if isinstance(A, np.ndarray) and A.dtype == np.complex64:
+        x = np.asarray(x, dtype=np.complex128)
+        result = np.empty((A.shape[0],) + x.shape[1:], dtype=np.complex128)
+        chunk_size = max(1, DOUBLE_PRECISION_CHUNK_SIZE // A.shape[1])
+        for i in range(0, A.shape[0], chunk_size):
+            result[i:i+chunk_size] = A[i:i+chunk_size].astype(np.complex128) @ x
+        return result
+    else:
+        return A @ x
+
+
+def solve_with_iterative_refinement(A, b, solve_in_single_precision, tolerance=1e-10, max_nb_steps=10):
+    """Solve A x = b with a single precision solver, improving the solution with iterative refinement:
+    the residual b - A x is computed in double precision and the correction is solved in single precision.
 
-# def solve_directly(A, b):
-#     assert isinstance(b, np.ndarray) and A.ndim == b.ndim+1 and A.shape[-2] == b.shape[-1]
-#     if isinstance(A, BlockCirculantMatrix):
-#         LOG.debug("\tSolve linear system %s", A)
-#         blocks_of_diagonalization = A.block_diagonalize()
-#         fft_of_rhs = np.fft.fft(np.reshape(b, (A.nb_blocks[0], A.block_shape[0])), axis=0)
-#         try:  # Try to run it as vectorized numpy arrays.
-#             fft_of_result = np.linalg.solve(blocks_of_diagonalization, fft_of_rhs)
-#         except np.linalg.LinAlgError:  # Or do the same thing with list comprehension.
-#             fft_of_result = np.array([solve_directly(block, vec) for block, vec in zip(blocks_of_diagonalization, fft_of_rhs)])
-#         result = np.fft.ifft(fft_of_result, axis=0).reshape((A.shape[1],))
-#         return result
+    Parameters
+    ----------
+    A: numpy array of complex64
+    b: array
+        a vector or a 2D array whose columns are several right-hand sides
+    solve_in_single_precision: function
+        takes a right-hand side of complex64 and returns an approximate solution of A x = b
+    tolerance: float, optional
+        the refinement stops when the norm of the residual is lower than tolerance times the norm of b
+    max_nb_steps: int, optional
+        maximum number of refinement steps
+    """
+    b = np.asarray(b, dtype=np.complex128)
+    b_norm = np.linalg.norm(b, axis=0)
+    x = solve_in_single_precision(b.astype(np.complex64)).astype(np.complex128)
+    for nb_steps in range(max_nb_steps + 1):
+        residual = b - double_precision_matvec(A, x)
+        if np.all(np.linalg.norm(residual, axis=0) <= tolerance*b_norm):
+            LOG.debug(f"Iterative refinement converged after {nb_steps} steps.")
+            break
+        if nb_steps < max_nb_steps:
+            x += solve_in_single_precision(residual.astype(np.complex64))
+    else:
+        LOG.warning(f"No convergence of the iterative refinement after {max_nb_steps} steps.")
+    return x
+
+
+# DIRECT SOLVER STORING THE LU DECOMPOSITION
+
+class LUSolverWithCache:
+    """Direct solver storing the LU decompositions of the matrices it has been called with,
+    so that several right-hand sides with the same matrix require a single factorization.
+    Single precision matrices are factored in single precision and solved with iterative refinement.
+
+    The matrices are only referenced weakly: the decomposition of a matrix is dropped when
+    the matrix itself is deleted, for instance when it is removed from the cache of the engine.
+
+    Parameters
+    ----------
+    cache_size: int, optional
+        number of LU decompositions to keep in cache (default: 1)
+    """
+
+    def __init__(self, cache_size=1):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
 
-#     elif isinstance(A, BlockSymmetricToeplitzMatrix):
-#         if A.nb_blocks == (2, 2):
-#             LOG.debug("\tSolve linear system %s", A)
-#             A1, A2 = A._stored_blocks[0, :]
-#             b1, b2 = b[:len(b)//2], b[len(b)//2:]
-#             x_plus = solve_directly(A1 + A2, b1 + b2)
-#             x_minus = solve_directly(A1 - A2, b1 - b2)
-#             return np.concatenate([x_plus + x_minus, x_plus - x_minus])/2
-#         else:
-#             # Not implemented
-#             LOG.debug("\tSolve linear system %s", A)
-#             return solve_directly(A.full_matrix(), b)
+    def lu_decomp(self, A):
+        key = id(A)
+        if key in self._cache:
+            matrix_ref, decomposition = self._cache[key]
+            if matrix_ref() is A:
+                return decomposition
 
-#     elif isinstance(A, BlockMatrix):
-#         LOG.debug("\tSolve linear system %s", A)
-#         return solve_directly(A.full_matrix(), b)
+        if len(self._cache) + 1 > self.cache_size:
+            # Drop oldest item in cache.
+            self._cache.popitem(last=False)
 
-#     elif isinstance(A, np.ndarray):
-#         LOG.debug(f"\tSolve linear system (size: {A.shape}) with numpy direct solver.")
-#         return np.linalg.solve(A, b)
+        LOG.debug(f"Compute LU decomposition of matrix of size {A.shape}.")
+        decomposition = _lu_factor(A)
+        self._cache[key] = (weakref.ref(A, lambda _, key=key: self._cache.pop(key, None)), decomposition)
+        return decomposition
 
-#     else:
-#         raise ValueError(f"Unrecognized type of matrix to solve: {A}")
+    def solve(self, A, b):
+        LOG.debug(f"Solve with LU decomposition of matrix of size {A.shape}.")
+        return _lu_solve(self.lu_decomp(A), b)
 
 
-# # EXPERIMENT: STORING THE LU DECOMPOSITION
-# @lru_cache(maxsize=1)
-# def lu_decomp(A):
-#     LOG.debug(f"Compute LU decomposition of {A}.")
-#     return sl.lu_factor(A.full_matrix())
+# Decomposition of a 2×2 block symmetric Toeplitz matrix [[A1, A2], [A2, A1]],
+# as the decompositions of A1 + A2 and A1 - A2.
+_SymmetricDecomposition = namedtuple('_SymmetricDecomposition', ['plus', 'minus'])
 
+# Decomposition of a block circulant matrix, as the decompositions of the blocks of its block diagonalization.
+_CirculantDecomposition = namedtuple('_CirculantDecomposition', ['blocks'])
 
-# def solve_storing_lu(A, b):
-#     LOG.debug(f"Solve with LU decomposition of {A}.")
-#     return sl.lu_solve(lu_decomp(A), b)
+# Single precision LU decomposition of a single precision matrix, that is kept for the iterative refinement.
+_SinglePrecisionDecomposition = namedtuple('_SinglePrecisionDecomposition', ['lu_and_piv', 'matrix'])
+
+def _lu_factor(A):
+    if isinstance(A, BlockCirculantMatrix):
+        return _CirculantDecomposition([_lu_factor(block) for block in A.block_diagonalize()])
+    if isinstance(A, BlockSymmetricToeplitzMatrix) and A.nb_blocks == (2, 2):
+        A1, A2 = A._stored_blocks[0, :]
+        return _SymmetricDecomposition(_lu_factor(A1 + A2), _lu_factor(A1 - A2))
+    A = A if isinstance(A, np.ndarray) else A.full_matrix()
+    if A.dtype == np.complex64:
+        return _SinglePrecisionDecomposition(sl.lu_factor(A, check_finite=False), A)
+    return sl.lu_factor(A, check_finite=False)
+
+def _lu_solve(decomposition, b):
+    if isinstance(decomposition, _CirculantDecomposition):
+        n = len(decomposition.blocks)
+        fft_of_rhs = np.fft.fft(np.reshape(b, (n, -1) + b.shape[1:]), axis=0)
+        fft_of_result = np.array([_lu_solve(block, rhs) for block, rhs in zip(decomposition.blocks, fft_of_rhs)])
+        return np.fft.ifft(fft_of_result, axis=0).reshape(b.shape)
+    if isinstance(decomposition, _SymmetricDecomposition):
+        b1, b2 = b[:len(b)//2], b[len(b)//2:]
+        x_plus = _lu_solve(decomposition.plus, b1 + b2)
+        x_minus = _lu_solve(decomposition.minus, b1 - b2)
+        return np.concatenate([x_plus + x_minus, x_plus - x_minus])/2
+    if isinstance(decomposition, _SinglePrecisionDecomposition):
+        return solve_with_iterative_refinement(
+            decomposition.matrix, b,
+            lambda rhs: sl.lu_solve(decomposition.lu_and_piv, rhs, check_finite=False))
+    return sl.lu_solve(decomposition, b, check_finite=False)
 
 
 # ITERATIVE SOLVER
@@ -82,22 +216,220 @@ class Counter:
         self.nb_iter += 1
 
 
-def solve_gmres(A, b):
+def solve_gmres(A, b, preconditioner=None, nb_iterations=None):
+    """Solve the linear system A x = b with GMRES.
+
+    Parameters
+    ----------
+    A: matrix-like
+    b: array
+        a vector or a 2D array whose columns are several right-hand sides, solved together with a block GMRES
+    preconditioner: matrix-like, optional
+        approximation of the inverse of A, such as a :class:`BlockDiagonalPreconditioner`
+    nb_iterations: list, optional
+        if given, the number of iterations for each right-hand side is appended to this list
+    """
+    if isinstance(A, BlockCirculantMatrix):
+        # Independent systems for each block of the block diagonalization.
+        n = A.nb_blocks[0]
+        fft_of_rhs = np.fft.fft(np.reshape(b, (n, -1) + b.shape[1:]), axis=0)
+        fft_of_result = np.array([solve_gmres(block, rhs, nb_iterations=nb_iterations)
+                                  for block, rhs in zip(A.block_diagonalize(), fft_of_rhs)])
+        return np.fft.ifft(fft_of_result, axis=0).reshape(b.shape)
+
+    if isinstance(A, BlockSymmetricToeplitzMatrix) and A.nb_blocks == (2, 2):
+        # Two independent systems of half size.
+        A1, A2 = A._stored_blocks[0, :]
+        b1, b2 = b[:len(b)//2], b[len(b)//2:]
+        x_plus = solve_gmres(A1 + A2, b1 + b2, nb_iterations=nb_iterations)
+        x_minus = solve_gmres(A1 - A2, b1 - b2, nb_iterations=nb_iterations)
+        return np.concatenate([x_plus + x_minus, x_plus - x_minus])/2
+
+    if b.ndim == 2 and b.shape[1] == 1:
+        return solve_gmres(A, b[:, 0], preconditioner, nb_iterations)[:, None]
+
+    if b.ndim == 2:
+        LOG.debug(f"Solve with block GMRES for {A} and {b.shape[1]} right-hand sides.")
+        x, nb_iter, converged = _block_gmres(A, b, preconditioner)
+        LOG.info(f"End of block GMRES after {nb_iter} iterations for {b.shape[1]} right-hand sides"
+                 f"{'' if preconditioner is None else ' with preconditioner'}.")
+        if nb_iterations is not None:
+            nb_iterations.extend([nb_iter]*b.shape[1])
+        if not converged:
+            LOG.warning(f"No convergence of the block GMRES after {nb_iter} iterations.")
+        return x
+
     LOG.debug(f"Solve with GMRES for {A}.")
 
-    if LOG.isEnabledFor(logging.DEBUG):
-        counter = Counter()
-        x, info = ssl.gmres(A, b, atol=1e-6, callback=counter)
-        LOG.debug(f"End of GMRES after {counter.nb_iter} iterations.")
+    if isinstance(A, np.ndarray) and A.dtype == np.complex64:
+        # The products with the matrix are computed in single precision,
+        # which is accurate enough for the tolerance of the GMRES.
+        single_precision_matrix = A
+        A = ssl.LinearOperator(A.shape, dtype=np.complex128,
+                               matvec=lambda x: single_precision_matrix @ x.astype(np.complex64))
 
-    else:
-        x, info = ssl.gmres(A, b, atol=1e-6)
+    M = None if preconditioner is None else ssl.aslinearoperator(preconditioner)
+    counter = Counter()
+    x, info = ssl.gmres(A, b, atol=1e-6, M=M, callback=counter, callback_type='pr_norm')
+    LOG.info(f"End of GMRES after {counter.nb_iter} iterations"
+             f"{'' if preconditioner is None else ' with preconditioner'}.")
+    if nb_iterations is not None:
+        nb_iterations.append(counter.nb_iter)
 
     if info != 0:
         LOG.warning(f"No convergence of the GMRES. Error code: {info}")
 
     return x
 
+
+def _block_gmres(A, B, preconditioner=None, atol=1e-6, rtol=1e-5, restart=20, max_nb_iterations=None):
+    """Restarted block GMRES, with the same tolerances and restart length as the single vector GMRES of scipy.
+
+    All the right-hand sides (columns of B) share a single Krylov space, which is built with products of the matrix
+    with blocks of vectors instead of single vectors. The preconditioner, if any, is applied on the right.
+
+    Returns
+    -------
+    array, int, bool
+        the solutions (columns), the number of block iterations and whether all the solutions have converged
+    """
+    n, p = B.shape
+    if max_nb_iterations is None:
+        max_nb_iterations = 10*n
+
+    def matmat(X):
+        if isinstance(A, np.ndarray) and A.dtype == np.complex64:
+            # Same as the single vector GMRES: the products with the matrix are computed in single precision.
+            return (A @ X.astype(np.complex64)).astype(np.complex128)
+        return np.asarray(A @ X, dtype=np.complex128)
+
+    def precondition(X):
+        return X if preconditioner is None else np.asarray(preconditioner @ X, dtype=np.complex128)
+
+    B = np.asarray(B, dtype=np.complex128)
+    tolerances = np.maximum(atol, rtol*np.linalg.norm(B, axis=0))
+    X = np.zeros((n, p), dtype=np.complex128)
+    R = B
+    nb_iter = 0
+
+    while not np.all(np.linalg.norm(R, axis=0) <= tolerances):
+        if nb_iter >= max_nb_iterations:
+            return X, nb_iter, False
+
+        # Block Arnoldi process: A M V[:j+1] = V[:j+2] H[:j+2, :j+1], where the V are orthonormal blocks of p vectors.
+        V0, R0 = np.linalg.qr(R)
+        V = [V0]
+        H = np.zeros(((restart+1)*p, restart*p), dtype=np.complex128)
+        E = np.zeros(((restart+1)*p, p), dtype=np.complex128)
+        E[:p] = R0
+        for j in range(restart):
+            W = matmat(precondition(V[j]))
+            for _ in range(2):  # Second pass of orthogonalization for the stability.
+                for i in range(j+1):
+                    h = V[i].conj().T @ W
+                    H[i*p:(i+1)*p, j*p:(j+1)*p] += h
+                    W = W - V[i] @ h
+            Q, H[(j+1)*p:(j+2)*p, j*p:(j+1)*p] = np.linalg.qr(W)
+            V.append(Q)
+            nb_iter += 1
+
+            # Least square problem in the Krylov space, whose residual is the residual of the linear system.
+            Hj, Ej = H[:(j+2)*p, :(j+1)*p], E[:(j+2)*p]
+            Y = np.linalg.lstsq(Hj, Ej, rcond=None)[0]
+            if np.all(np.linalg.norm(Ej - Hj @ Y, axis=0) <= tolerances) or nb_iter >= max_nb_iterations:
+                break
+
+        X = X + precondition(np.hstack(V[:j+1]) @ Y)
+        R = B - matmat(X)
+
+    return X, nb_iter, True
+
+
+# ITERATIVE SOLVER WITH BLOCK DIAGONAL PRECONDITIONER
+
+class BlockDiagonalPreconditioner:
+    """Approximation of the inverse of a matrix, using only the LU decompositions of its diagonal blocks.
+
+    For the interactions between several bodies, the diagonal blocks are the self-interactions of each body,
+    which dominate the matrix when the bodies are not too close to each other.
+
+    Parameters
+    ----------
+    A: numpy array
+        the matrix
+    block_sizes: list of int
+        the sizes of the diagonal blocks, whose sum is the size of A
+    """
+
+    def __init__(self, A, block_sizes):
+        assert sum(block_sizes) == A.shape[0] == A.shape[1]
+        self.shape = A.shape
+        self.dtype = A.dtype
+        self.block_limits = np.cumsum([0, *block_sizes])
+        LOG.debug(f"Compute LU decompositions of {len(block_sizes)} diagonal blocks of matrix of size {A.shape}.")
+        self.decompositions = [sl.lu_factor(A[i:j, i:j], check_finite=False)
+                               for i, j in zip(self.block_limits[:-1], self.block_limits[1:])]
+
+    def matvec(self, x):
+        return np.concatenate([sl.lu_solve(decomposition, x[i:j].astype(self.dtype), check_finite=False)
+                               for decomposition, i, j in zip(self.decompositions, self.block_limits[:-1], self.block_limits[1:])])
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+
+class GMRESSolverWithBlockPreconditioner:
+    """GMRES solver preconditioned by the inverse of the diagonal blocks of the matrix.
+
+    The sizes of the blocks of a matrix are declared with :meth:`set_block_sizes`, which is done by the engine
+    for the matrices of a CollectionOfMeshes (one block per submesh). The matrices without declared blocks
+    are solved without preconditioner.
+    The preconditioner of a matrix is computed at the first resolution and reused for all the following
+    right-hand sides, as long as the matrix exists.
+
+    Parameters
+    ----------
+    cache_size: int, optional
+        number of preconditioners to keep in cache (default: 1)
+
+    Attributes
+    ----------
+    nb_iterations: list of int
+        number of GMRES iterations for each right-hand side of the last resolution
+    """
+
+    def __init__(self, cache_size=1):
+        self.cache_size = cache_size
+        self._block_sizes = {}
+        self._cache = OrderedDict()
+        self.nb_iterations = []
+
+    def set_block_sizes(self, A, block_sizes):
+        key = id(A)
+        self._block_sizes[key] = (weakref.ref(A, lambda _, key=key: self._block_sizes.pop(key, None)), list(block_sizes))
+
+    def preconditioner(self, A):
+        key = id(A)
+        if key not in self._block_sizes or self._block_sizes[key][0]() is not A:
+            return None
+
+        if key in self._cache:
+            matrix_ref, preconditioner = self._cache[key]
+            if matrix_ref() is A:
+                return preconditioner
+
+        if len(self._cache) + 1 > self.cache_size:
+            # Drop oldest item in cache.
+            self._cache.popitem(last=False)
+
+        preconditioner = BlockDiagonalPreconditioner(A, self._block_sizes[key][1])
+        self._cache[key] = (weakref.ref(A, lambda _, key=key: self._cache.pop(key, None)), preconditioner)
+        return preconditioner
+
+    def solve(self, A, b):
+        self.nb_iterations = []
+        return solve_gmres(A, b, preconditioner=self.preconditioner(A), nb_iterations=self.nb_iterations)
+
 # def gmres_no_fft(A, b):
 #     LOG.debug(f"Solve with GMRES for {A} without using FFT.")
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Persistent cache of the influence matrices on disk.
+
+The matrices are stored as :code:`.npy` files, named after a hash of everything they depend on:
+the content of the meshes, the position of the free surface and of the sea bottom, the wavenumber and
+the settings of the Green function. They can be reloaded as memory-mapped arrays in another run.
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+import numpy as np
+
+from litebem.tools.io import atomic_save
+
+LOG = logging.getLogger(__name__)
+
+# To be incremented when the way the matrices are computed changes.
+CACHE_FORMAT_VERSION = 1
+
+
+def mesh_content_hash(mesh):
+    """Hash of the arrays of a mesh that are used to compute the influence matrices.
+
+    Parameters
+    ----------
+    mesh: Mesh or CollectionOfMeshes
+
+    Returns
+    -------
+    str
+    """
+    h = hashlib.sha256()
+    quad_points, quad_weights = mesh.quadraturePoints
+    for array, dtype in ((mesh.vertices, np.float64), (mesh.panels, np.int64),
+                         (mesh.panelCenters, np.float64), (mesh.panelUnitNormals, np.float64),
+                         (mesh.panelAreas, np.float64), (mesh.panelRadii, np.float64),
+                         (quad_points, np.float64), (quad_weights, np.float64)):
+        array = np.ascontiguousarray(array, dtype=dtype)
+        h.update(str(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+class DiskMatrixCache:
+    """Cache of the influence matrices S and K in a directory.
+
+    When the total size of the files exceeds :code:`max_size`, the least recently used matrices are deleted.
+
+    Parameters
+    ----------
+    directory: str
+        path of the directory in which the matrices are stored (created if it does not exist)
+    max_size: int, optional
+        maximum total size of the stored matrices, in bytes (default: 10 GB)
+    mmap: bool, optional
+        if True (default), the matrices are loaded as read-only memory-mapped arrays,
+        otherwise they are read into memory.
+    """
+
+    def __init__(self, directory, max_size=10*2**30, mmap=True):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.mmap = mmap
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __str__(self):
+        return f"DiskMatrixCache({self.directory!r})"
+
+    def key(self, mesh1, mesh2, free_surface, sea_bottom, wavenumber, green_function):
+        """Name under which the matrices built with these parameters are stored."""
+        description = {
+            'version': CACHE_FORMAT_VERSION,
+            'mesh1': mesh_content_hash(mesh1),
+            'mesh2': mesh_content_hash(mesh2),
+            'same_mesh': mesh1 is mesh2,
+            'free_surface': repr(float(free_surface)),
+            'sea_bottom': repr(float(sea_bottom)),
+            'wavenumber': repr(float(wavenumber)),
+            'green_function': getattr(green_function, 'exportable_settings', green_function.__class__.__name__),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, f"{key}_S.npy"),
+                os.path.join(self.directory, f"{key}_K.npy"))
+
+    def load(self, key):
+        """Return the matrices S and K stored under this key, or None if they are not in the cache."""
+        paths = self._paths(key)
+        if not all(os.path.isfile(path) for path in paths):
+            return None
+
+        try:
+            S, K = (np.load(path, mmap_mode='r' if self.mmap else None) for path in paths)
+        except (OSError, ValueError):
+            LOG.warning(f"Unreadable matrices {key} in {self}.")
+            return None
+
+        for path in paths:
+            os.utime(path)  # Mark as recently used.
+
+        LOG.debug(f"Matrices {key} loaded from {self}.")
+        return S, K
+
+    def store(self, key, S, K):
+        """Store the matrices S and K under this key and delete the least recently used matrices if needed."""
+        for path, matrix in zip(self._paths(key), (S, K)):
+            atomic_save(path, matrix)
+
+        LOG.debug(f"Matrices {key} stored in {self}.")
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Delete the least recently used matrices until the total size is below max_size.
+        The matrices stored under the key :code:`keep` are never deleted."""
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(('_S.npy', '_K.npy')):
+                stat = entry.stat()
+                size, last_use = entries.get(entry.name[:-6], (0, 0.0))
+                entries[entry.name[:-6]] = (size + stat.st_size, max(last_use, stat.st_mtime))
+
+        total_size = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            LOG.debug(f"Delete matrices {key} from {self}.")
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Influence matrices that are never stored: their products with vectors are computed tile by tile.
+
+The panels of each mesh are grouped in blocks of neighbouring panels (the leaves of a
+:class:`~litebem.solver.hierarchical_matrices.ClusterTree`). The matrices are split in tiles coupling
+a block of receiving panels with a block of source panels, and each tile is computed with the Green function
+when it is needed, multiplied with the vector and dropped. Only the tiles of the near field, that are
+the most expensive ones to compute and are few, can be kept in memory.
+"""
+
+import logging
+
+import numpy as np
+from scipy.sparse import linalg as ssl
+
+from litebem.solver.hierarchical_matrices import ClusterTree
+
+LOG = logging.getLogger(__name__)
+
+
+def _leaves(tree):
+    if tree.is_leaf:
+        return [tree]
+    return [leaf for child in tree.children for leaf in _leaves(child)]
+
+
+class TiledInfluenceMatrices:
+    """The matrices S and K between two meshes, computed tile by tile.
+
+    Parameters
+    ----------
+    mesh1: Mesh or CollectionOfMeshes
+        mesh of the receiving body (where the potential is measured)
+    mesh2: Mesh or CollectionOfMeshes
+        mesh of the source body (over which the source distribution is integrated)
+    evaluate: function
+        takes a submesh of mesh1 and a submesh of mesh2 and returns the tiles of S and K between them
+    block_size: int, optional
+        maximum number of panels in a block (default: 256)
+    admissibility: float, optional
+        two blocks of panels are in the near field of each other if the distance between their centers
+        is lower than :code:`admissibility` times the sum of their radii (default: 1.0)
+    cache_near_field: bool, optional
+        if True (default), the tiles of the near field are kept in memory after their first computation
+
+    Attributes
+    ----------
+    nb_evaluated_tiles: int
+        number of calls to the Green function so far
+    """
+
+    def __init__(self, mesh1, mesh2, evaluate, block_size=256, admissibility=1.0, cache_near_field=True):
+        self.shape = (mesh1.nPanels, mesh2.nPanels)
+        self.evaluate = evaluate
+
+        tree1 = ClusterTree(mesh1.panelCenters, mesh1.panelRadii, block_size)
+        tree2 = tree1 if mesh2 is mesh1 else ClusterTree(mesh2.panelCenters, mesh2.panelRadii, block_size)
+        self.row_blocks = _leaves(tree1)
+        self.column_blocks = _leaves(tree2)
+
+        # The submeshes of the blocks are built once. For the interactions of a mesh with itself, the same Mesh
+        # object is used for the rows and the columns, such that the diagonal tiles are recognized by the Green
+        # function as interactions of a mesh with itself.
+        self._submeshes1 = [mesh1.extract_faces(block.ids) for block in self.row_blocks]
+        self._submeshes2 = self._submeshes1 if mesh2 is mesh1 else [mesh2.extract_faces(block.ids) for block in self.column_blocks]
+
+        self.near_field = set()
+        if cache_near_field:
+            self.near_field = {(i, j)
+                               for i, row_block in enumerate(self.row_blocks)
+                               for j, column_block in enumerate(self.column_blocks)
+                               if not row_block.is_admissible_with(column_block, admissibility)}
+        self._cache = {}
+        self.nb_evaluated_tiles = 0
+
+    @property
+    def nb_tiles(self):
+        return len(self.row_blocks)*len(self.column_blocks)
+
+    @property
+    def nbytes(self):
+        """Memory used by the tiles kept in memory."""
+        return sum(S.nbytes + K.nbytes for S, K in self._cache.values())
+
+    def _tiles(self, i, j):
+        if (i, j) in self._cache:
+            return self._cache[i, j]
+        tiles = self.evaluate(self._submeshes1[i], self._submeshes2[j])
+        self.nb_evaluated_tiles += 1
+        if (i, j) in self.near_field:
+            self._cache[i, j] = tiles
+        return tiles
+
+    def product(self, index, x):
+        """Product of S (index 0) or K (index 1) with a vector or with a 2D array of vectors."""
+        x = np.asarray(x)
+        result = np.zeros((self.shape[0],) + x.shape[1:], dtype=np.result_type(np.complex128, x.dtype))
+        for i, row_block in enumerate(self.row_blocks):
+            for j, column_block in enumerate(self.column_blocks):
+                result[row_block.ids] += self._tiles(i, j)[index] @ x[column_block.ids]
+        return result
+
+
+class MatrixFreeOperator(ssl.LinearOperator):
+    """One of the two influence matrices of a :class:`TiledInfluenceMatrices`, as a linear operator
+    that can be used by the GMRES solver of scipy.
+
+    Parameters
+    ----------
+    tiled_matrices: TiledInfluenceMatrices
+    index: int
+        0 for the matrix S, 1 for the matrix K
+    """
+
+    def __init__(self, tiled_matrices, index):
+        super().__init__(dtype=np.complex128, shape=tiled_matrices.shape)
+        self.tiled_matrices = tiled_matrices
+        self.index = index
+
+    def _matvec(self, x):
+        return self.tiled_matrices.product(self.index, x.ravel())
+
+    def _matmat(self, X):
+        return self.tiled_matrices.product(self.index, X)
+
+    def full_matrix(self):
+        return self.tiled_matrices.product(self.index, np.eye(self.shape[1]))
+
+    def __str__(self):
+        return (f"MatrixFreeOperator(shape={self.shape}, nb_tiles={self.tiled_matrices.nb_tiles}, "
+                f"nb_near_field_tiles={len(self.tiled_matrices.near_field)})")
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Resolution of a set of problems in a pool of worker processes.
+
+The bodies (meshes and degrees of freedom) are sent once to each worker through a single block of
+shared memory. The problems and the results exchanged for each task only refer to the bodies by their
+index, so that the large mesh arrays are never pickled again.
+"""
+
+import io
+import os
+import logging
+import pickle
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from litebem.preprocessing.body import Body
+
+LOG = logging.getLogger(__name__)
+
+_ALIGNMENT = 64  # bytes, alignment of each array in the shared memory block
+
+# Variables set in each worker process by _initialize_worker.
+_worker = {}
+
+
+####################################
+#  Arrays stored in shared memory  #
+####################################
+
+class _ArraysPickler(pickle.Pickler):
+    """Pickler that keeps the numpy arrays apart instead of serializing them."""
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if type(obj) is np.ndarray and obj.dtype != object:
+            self.arrays.append(obj)
+            return ('array', len(self.arrays) - 1)
+        return None
+
+
+class _ArraysUnpickler(pickle.Unpickler):
+    """Unpickler rebuilding the arrays kept apart by _ArraysPickler as read-only views of a shared memory block."""
+
+    def __init__(self, file, buffer, layout):
+        super().__init__(file)
+        self.buffer = buffer
+        self.layout = layout
+
+    def persistent_load(self, pid):
+        _, i = pid
+        offset, shape, dtype, order = self.layout[i]
+        array = np.ndarray(shape, dtype=dtype, buffer=self.buffer, offset=offset, order=order)
+        array.flags.writeable = False
+        return array
+
+
+def share_objects(obj):
+    """Serialize an object, moving all its numpy arrays into a new block of shared memory.
+
+    Parameters
+    ----------
+    obj: any picklable object
+        the object to be shared, such as a list of bodies
+
+    Returns
+    -------
+    SharedMemory
+        the block of shared memory, that should be closed and unlinked by the caller when it is no longer needed
+    tuple
+        small picklable payload from which :func:`load_shared_objects` rebuilds the object in another process
+    """
+    data = io.BytesIO()
+    pickler = _ArraysPickler(data)
+    pickler.dump(obj)
+
+    layout = []
+    offset = 0
+    for array in pickler.arrays:
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+        layout.append((offset, array.shape, array.dtype.str, order))
+        offset += array.nbytes
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for array, (offset, shape, dtype, order) in zip(pickler.arrays, layout):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset, order=order)[...] = array
+
+    LOG.debug(f"Shared {len(layout)} arrays ({block.size} bytes) in {block.name}.")
+    return block, (block.name, layout, data.getvalue())
+
+
+def load_shared_objects(payload):
+    """Rebuild an object shared with :func:`share_objects`. The arrays are read-only views of the shared memory.
+
+    Returns
+    -------
+    SharedMemory
+        the attached block of shared memory, that should be kept alive as long as the object is used
+    object
+        the rebuilt object
+    """
+    name, layout, data = payload
+    # The workers started by solve_batches_in_pool share the resource tracker of the parent process,
+    # so that the block is still unlinked only once, by the parent.
+    block = shared_memory.SharedMemory(name=name)
+    obj = _ArraysUnpickler(io.BytesIO(data), block.buf, layout).load()
+    return block, obj
+
+
+##########################
+#  Bodies sent by index  #
+##########################
+
+class _BodiesPickler(pickle.Pickler):
+    """Pickler replacing some known bodies by their index in a list."""
+
+    def __init__(self, file, bodies):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.indices = {id(body): i for i, body in enumerate(bodies)}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Body) and id(obj) in self.indices:
+            return ('body', self.indices[id(obj)])
+        return None
+
+
+class _BodiesUnpickler(pickle.Unpickler):
+    """Unpickler replacing the indices saved by _BodiesPickler by the bodies of a list."""
+
+    def __init__(self, file, bodies):
+        super().__init__(file)
+        self.bodies = bodies
+
+    def persistent_load(self, pid):
+        _, i = pid
+        return self.bodies[i]
+
+
+def _dumps_with_bodies(obj, bodies):
+    data = io.BytesIO()
+    _BodiesPickler(data, bodies).dump(obj)
+    return data.getvalue()
+
+
+def _loads_with_bodies(data, bodies):
+    return _BodiesUnpickler(io.BytesIO(data), bodies).load()
+
+
+#############
+#  Workers  #
+#############
+
+@contextmanager
+def _environment(**variables):
+    """Temporarily set some environment variables, that will be inherited by the processes started meanwhile."""
+    previous = {key: os.environ.get(key) for key in variables}
+    os.environ.update({key: str(value) for key, value in variables.items()})
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+
+
+def _initialize_worker(solver, shared_bodies):
+    _worker['solver'] = solver
+    _worker['shared_memory'], _worker['bodies'] = load_shared_objects(shared_bodies)
+
+
+def _solve_batch_in_worker(problems_data, batch_rhs, kwargs):
+    solver, bodies = _worker['solver'], _worker['bodies']
+    problems = _loads_with_bodies(problems_data, bodies)
+    if batch_rhs:
+        results = solver.solve_batch(problems, **kwargs)
+    else:
+        results = [solver.solve(problem, **kwargs) for problem in problems]
+    return _dumps_with_bodies(results, bodies)
+
+
+def solve_batches_in_pool(solver, batches, n_workers, n_threads_per_worker=None, batch_rhs=True, **kwargs):
+    """Solve batches of problems in parallel in a pool of processes.
+
+    Parameters
+    ----------
+    solver: BEMSolver
+        the solver, that is copied in each worker
+    batches: list of lists of LinearPotentialFlowProblem
+        the problems, grouped by influence matrices (typically by body and frequency).
+        Each batch is solved by a single worker.
+    n_workers: int
+        number of worker processes
+    n_threads_per_worker: int, optional
+        number of OpenMP and BLAS threads in each worker (default: number of cpu divided by n_workers)
+    batch_rhs: bool, optional
+        if True, each batch is solved at once with :code:`solver.solve_batch`,
+        otherwise the problems are solved one by one with :code:`solver.solve`
+    Other keyword arguments are passed to the solving method.
+
+    Returns
+    -------
+    list of LinearPotentialFlowResult
+        the results, in the same order as the problems in the batches
+    """
+    if n_threads_per_worker is None:
+        n_threads_per_worker = max(1, (os.cpu_count() or 1) // n_workers)
+
+    bodies = list({id(problem.body): problem.body for batch in batches for problem in batch}.values())
+    block, shared_bodies = share_objects(bodies)
+
+    LOG.info(f"Solve {sum(len(batch) for batch in batches)} problems in {len(batches)} batches "
+             f"with {n_workers} processes of {n_threads_per_worker} threads.")
+
+    try:
+        threads = {variable: n_threads_per_worker for variable in
+                   ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')}
+        with _environment(**threads), ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=multiprocessing.get_context('spawn'),  # Forking a process that already ran OpenMP code is unsafe.
+                initializer=_initialize_worker,
+                initargs=(solver, shared_bodies),
+        ) as executor:
+            futures = [executor.submit(_solve_batch_in_worker, _dumps_with_bodies(batch, bodies), batch_rhs, kwargs)
+                       for batch in batches]
+            results = [result for future in futures for result in _loads_with_bodies(future.result(), bodies)]
+    finally:
+        block.close()
+        block.unlink()
+
+    return results
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Writing of the files shared between runs: influence matrices, tabulations, Prony decompositions and meshes."""
+
+import os
+import tempfile
+
+import numpy as np
+
+
+def atomic_save(path, array=None, **arrays):
+    """Save an array (with :func:`numpy.save`) or several named arrays (with :func:`numpy.savez`) in a file.
+
+    The arrays are written in a temporary file first, such that another process never reads a partially
+    written file, and the file is readable by the other users of a shared directory.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if array is None:
+                np.savez(f, **arrays)
+            else:
+                np.save(f, array)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
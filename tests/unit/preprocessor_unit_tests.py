@@ -32,6 +32,102 @@ def test_read_nemoh_mesh_nquads():
     mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
     assert len(mesh.quadranglesIDs) == 324
 
+def test_read_nemoh_mesh_arrays():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    assert meshVerts.dtype == np.float64 and meshVerts.shape == (361, 3) and meshVerts.flags.c_contiguous
+    assert meshFaces.dtype == np.int32 and meshFaces.shape == (360, 4)
+
+def test_read_dat_mesh(tmp_path):
+    datMesh = tmp_path / 'square.dat'
+    datMesh.write_text('2 0\n1 0.0 0.0 -1.0\n2 1.0 0.0 -1.0\n3 1.0 1.0 -1.0\n4 0.0 1.0 -1.0\n'
+                       '0 0.00 0.00 0.00\n1 2 3 4\n0 0 0 0\n')
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(str(datMesh))
+    assert np.array_equal(meshHeader, [2, 0]) and meshVerts.shape == (4, 3)
+    assert np.array_equal(meshFaces, [[1, 2, 3, 4]])
+
+def test_read_nemoh_mesh_cache(tmp_path):
+    meshPath = tmp_path / 'hemisphere360.nemoh'
+    meshPath.write_bytes(open(hemi360Mesh, 'rb').read())
+    reference = lpm.read_nemoh_mesh(str(meshPath))
+    assert not (tmp_path / 'hemisphere360.nemoh.npz').exists()
+    for i in range(2):
+        cached = lpm.read_nemoh_mesh(str(meshPath), cache=True)
+        assert (tmp_path / 'hemisphere360.nemoh.npz').exists()
+        assert all(np.array_equal(a, b) and a.dtype == b.dtype for a, b in zip(cached, reference))
+
+    # a modified mesh file is parsed again
+    meshPath.write_text(meshPath.read_text().replace('-0.987688', '-0.5', 1))
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(str(meshPath), cache=True)
+    assert meshVerts[1, 0] == -0.5
+
+def write_gdf_mesh(gdfPath, corners, isx=0, isy=0):
+    with open(gdfPath, 'w') as f:
+        f.write(f'test mesh\n1.0 9.81\n{isx} {isy}\n{len(corners)}\n')
+        np.savetxt(f, corners.reshape(-1, 3), fmt='%.9e')
+
+def test_load_gdf_mesh(tmp_path):
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    corners = meshVerts[meshFaces - 1]
+
+    write_gdf_mesh(tmp_path / 'hemi360.gdf', corners)
+    gdfMesh = lpm.load_mesh(str(tmp_path / 'hemi360.gdf'))
+    assert gdfMesh.name == 'hemi360.gdf' and gdfMesh.nVertices == mesh.nVertices
+    assert len(gdfMesh.trianglesIDs) == len(mesh.trianglesIDs)
+    assert np.allclose(gdfMesh.panelAreas, mesh.panelAreas, rtol=1e-7)
+    assert np.allclose(gdfMesh.panelCenters, mesh.panelCenters, atol=1e-8)
+
+    # half of the mesh, with the plane y = 0 as plane of symmetry
+    write_gdf_mesh(tmp_path / 'hemi180.gdf', corners[(corners[:, :, 1] >= -1e-9).all(axis=1)], isy=1)
+    halfMesh = lpm.load_mesh(str(tmp_path / 'hemi180.gdf'), cache=True)
+    assert isinstance(halfMesh, lpm.ReflectionSymmetricMesh) and halfMesh.plane == 'xOz'
+    assert halfMesh.nPanels == mesh.nPanels and np.isclose(halfMesh.panelAreas.sum(), mesh.panelAreas.sum())
+
+    # more panels announced than described
+    write_gdf_mesh(tmp_path / 'truncated.gdf', corners[:10])
+    (tmp_path / 'truncated.gdf').write_text((tmp_path / 'truncated.gdf').read_text().replace('\n10\n', '\n11\n'))
+    with pytest.raises(ValueError):
+        lpm.read_gdf_mesh(str(tmp_path / 'truncated.gdf'))
+
+def test_load_stl_mesh(tmp_path):
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    corners = meshVerts[meshFaces - 1]
+    facets = np.concatenate([corners[:, [0, 1, 2]], corners[:, [0, 2, 3]]])
+    facets = facets[np.linalg.norm(np.cross(facets[:, 1] - facets[:, 0], facets[:, 2] - facets[:, 0]), axis=1) > 0.0]
+
+    records = np.zeros(len(facets), dtype=lpm._STL_RECORD)
+    records['corners'] = facets
+    with open(tmp_path / 'binary.stl', 'wb') as f:
+        f.write(b'solid name in a binary header'.ljust(80) + np.uint32(len(facets)).tobytes() + records.tobytes())
+    with open(tmp_path / 'ascii.stl', 'w') as f:
+        f.write('solid hemi360\n')
+        for facet in facets:
+            f.write(' facet normal 0 0 0\n  outer loop\n')
+            f.writelines(f'   vertex {x:.8e} {y:.8e} {z:.8e}\n' for x, y, z in facet)
+            f.write('  endloop\n endfacet\n')
+        f.write('endsolid hemi360\n')
+
+    for stlPath in [tmp_path / 'binary.stl', tmp_path / 'ascii.stl']:
+        stlMesh = lpm.load_mesh(str(stlPath))
+        # the coincident corners of the facets are welded into the vertices of the original mesh
+        assert stlMesh.nPanels == len(facets) and stlMesh.nVertices == mesh.nVertices
+        assert len(stlMesh.trianglesIDs) == len(facets)
+        assert np.isclose(stlMesh.panelAreas.sum(), mesh.panelAreas.sum(), rtol=1e-6)
+
+    shiftedFacets = facets + np.random.default_rng(0).uniform(-1e-9, 1e-9, facets.shape)
+    vertices, panels = lpm._weld_corners(shiftedFacets, tolerance=1e-6)
+    assert len(vertices) == mesh.nVertices and panels.shape == (len(facets), 4)
+
+    body = lpb.Body.from_file(str(tmp_path / 'binary.stl'), name='hemi360')
+    assert body.mesh.nPanels == len(facets)
+    with pytest.raises(ValueError):
+        lpm.load_mesh(str(tmp_path / 'binary.stl'), file_format='obj')
+
+def test_canonical_panels():
+    panels = np.array([[1, 1, 2, 3], [1, 2, 3, 3], [1, 2, 3, 1], [1, 2, 2, 3], [1, 2, 1, 3], [1, 2, 3, 4]])
+    assert np.array_equal(lpm._canonical_panels(panels), [[2, 3, 1, 2], [1, 2, 3, 1], [1, 2, 3, 1], [3, 1, 2, 3], [1, 2, 3, 4]])
+
 
 # tests for computing mesh panel properties
 
@@ -135,6 +231,32 @@ def test_panel_radii():
     for i in range(len(valuesCapList)):
         assert round(valuesCapList[i],13) == round(mesh.panelRadii[i],13)
 
+def test_panel_properties_of_mixed_panels():
+    vertices = np.array([[0.0, 0.0, -1.0], [2.0, 0.0, -1.0], [2.0, 1.0, -1.0], [0.0, 1.0, -1.0], [3.0, 0.0, -1.0]])
+    panels = np.array([[1, 2, 3, 4], [2, 5, 3, 2]])
+    mesh = lpm.Mesh(vertices, panels)
+    assert mesh.trianglesIDs == [2] and mesh.quadranglesIDs == [1]
+    assert np.allclose(mesh.panelAreas, [2.0, 0.5])
+    assert np.allclose(mesh.panelCenters, [[1.0, 0.5, -1.0], [7/3, 1/3, -1.0]])
+    assert np.allclose(mesh.panelUnitNormals, [[0.0, 0.0, 1.0], [0.0, 0.0, 1.0]])
+    assert np.allclose(mesh.panelRadii, [np.sqrt(1.25), np.sqrt(5)/3])
+    with pytest.raises(ValueError):
+        lpm.Mesh(vertices, np.array([[1, 2, 3, 4], [1, 2, 1, 2]]))
+
+def test_quadrature_points():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    points, weights = mesh.quadrature_points('center')
+    assert np.array_equal(points, mesh.quadraturePoints[0])
+    for method, nbPoints in [('gauss_legendre_2', 4), ('gauss_legendre_3', 9)]:
+        points, weights = mesh.quadrature_points(method)
+        assert points.shape == (mesh.nPanels, nbPoints, 3)
+        # Exact integration of constant and linear functions, on the quadrangles and on the triangles
+        assert np.allclose(weights.sum(axis=1), mesh.panelAreas, rtol=1e-12)
+        assert np.allclose(np.einsum('ij,ijk->ik', weights, points)/mesh.panelAreas[:, None], mesh.panelCenters, atol=1e-12)
+    with pytest.raises(ValueError):
+        mesh.quadrature_points('gauss_legendre_7')
+
 # tests for hydrostatic calculations
 
 def test_polygon_length():
@@ -174,6 +296,52 @@ def test_compute_hydrostatic_stiffness():
     assert round(stiffnessMatrix[3,3],3) == 24.655
     assert round(stiffnessMatrix[4,4],3) == 24.655
 
+def test_extract_faces():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    panelIDs = [0, 5, 100, 359]
+    submesh = mesh.extract_faces(panelIDs, name=f'hemi360_part')
+    assert submesh.nPanels == 4
+    assert submesh.nVertices == len(np.unique(np.asarray(meshFaces)[panelIDs]))
+    assert np.allclose(submesh.panelCenters, mesh.panelCenters[panelIDs])
+    assert np.allclose(submesh.panelAreas, mesh.panelAreas[panelIDs])
+
+def test_reflection_symmetric_mesh():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    half = mesh.extract_faces(np.nonzero(mesh.panelCenters[:, 1] > 0)[0])
+    symmetricMesh = lpm.ReflectionSymmetricMesh(half, plane='xOz')
+    mirror = symmetricMesh[1]
+    assert symmetricMesh.nPanels == 360
+    assert np.allclose(mirror.panelCenters, half.panelCenters*np.array([1, -1, 1]))
+    assert np.allclose(mirror.panelUnitNormals, half.panelUnitNormals*np.array([1, -1, 1]))
+    assert np.allclose(mirror.panelAreas, half.panelAreas)
+
+def test_detect_reflection_symmetries():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    symmetricMesh = lpm.detect_reflection_symmetries(mesh)
+    assert isinstance(symmetricMesh, lpm.ReflectionSymmetricMesh) and symmetricMesh.plane == 'xOz'
+    assert isinstance(symmetricMesh.half, lpm.ReflectionSymmetricMesh) and symmetricMesh.half.plane == 'yOz'
+    assert symmetricMesh.nPanels == mesh.nPanels
+    assert np.isclose(symmetricMesh.panelAreas.sum(), mesh.panelAreas.sum())
+
+    asymmetricMesh = mesh.extract_faces(np.nonzero(mesh.panelCenters[:, 0] + 0.5*mesh.panelCenters[:, 1] > 0)[0])
+    assert lpm.detect_reflection_symmetries(asymmetricMesh) is asymmetricMesh
+
+def test_detect_axial_symmetry():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(hemi360Mesh)
+    mesh = lpm.Mesh(meshVerts, meshFaces, name=f'hemi360')
+    symmetricMesh = lpm.detect_axial_symmetry(mesh)
+    assert isinstance(symmetricMesh, lpm.AxialSymmetricMesh)
+    assert symmetricMesh.nSectors == 36
+    assert symmetricMesh.nPanels == mesh.nPanels
+    assert np.allclose(symmetricMesh[1].panelCenters[:, 2], symmetricMesh.sector.panelCenters[:, 2])
+    assert np.isclose(symmetricMesh.panelAreas.sum(), mesh.panelAreas.sum())
+
+    asymmetricMesh = mesh.extract_faces(np.nonzero(mesh.panelCenters[:, 0] + 0.5*mesh.panelCenters[:, 1] > 0)[0])
+    assert lpm.detect_axial_symmetry(asymmetricMesh) is asymmetricMesh
+
 
 # tests for problem set up
 
@@ -196,3 +364,25 @@ def test_CollectionOfMeshes():
     meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(sparMesh)
     mesh2 = lpm.Mesh(meshVerts, meshFaces, name=f'spar')
     collection = lpm.CollectionOfMeshes([mesh1,mesh2],name='rm3')
+
+def test_CollectionOfMeshes_cached_arrays():
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(floatMesh)
+    mesh1 = lpm.Mesh(meshVerts, meshFaces, name=f'float')
+    meshHeader, meshVerts, meshFaces = lpm.read_nemoh_mesh(sparMesh)
+    mesh2 = lpm.Mesh(meshVerts, meshFaces, name=f'spar')
+    collection = lpm.CollectionOfMeshes([mesh1, lpm.CollectionOfMeshes([mesh2, mesh1])], name='rm3')
+    meshes = [mesh1, mesh2, mesh1]
+    for attribute in ('vertices', 'panelCenters', 'panelUnitNormals', 'panelAreas', 'panelRadii'):
+        array = getattr(collection, attribute)
+        assert array is getattr(collection, attribute)
+        assert array.flags.f_contiguous and not array.flags.writeable
+        np.testing.assert_array_equal(array, np.concatenate([getattr(mesh, attribute) for mesh in meshes]))
+    offsets = np.cumsum([0] + [mesh.nVertices for mesh in meshes[:-1]])
+    assert collection.panels is collection.panels
+    assert collection.panels.dtype == np.int32 and collection.panels.flags.f_contiguous
+    np.testing.assert_array_equal(collection.panels,
+                                  np.concatenate([mesh.panels + offset for mesh, offset in zip(meshes, offsets)]))
+    points, weights = collection.quadrature_points('gauss_legendre_2')
+    assert points is collection.quadrature_points('gauss_legendre_2')[0]
+    np.testing.assert_array_equal(weights, np.concatenate([mesh.quadrature_points('gauss_legendre_2')[1]
+                                                           for mesh in meshes]))
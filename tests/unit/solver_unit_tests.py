@@ -1,13 +1,25 @@
+import pickle
+import pytest
+from types import SimpleNamespace
+import numpy as np
 import litebem.preprocessing.mesh as lpm
 import litebem.preprocessing.body as lpb
 from litebem.preprocessing.bem_problem_definitions import RadiationProblem,DiffractionProblem
 import litebem.solver.bem_solver as lps
 import litebem.postprocessing.results as lpr
+import litebem.solver.linear_solvers as lpl
+import litebem.solver.matrix_cache as lpms
+import litebem.solver.hierarchical_matrices as lphm
+from litebem.solver.block_matrices import BlockSymmetricToeplitzMatrix, BlockCirculantMatrix
+from litebem.solver.green_functions.delhommeau import Delhommeau
+import litebem.solver.green_functions.tabulation as lpt
+import litebem.solver.green_functions.prony_decomposition as lppd
 
 # reference data and variables for tests
 
 floatMeshPath = f'tests/unit/preprocessorRefData/float-fixed.nemoh'
 sparMeshPath = f'tests/unit/preprocessorRefData/spar-fixed.nemoh'
+hemi360MeshPath = f'tests/unit/preprocessorRefData/hemisphere360.nemoh'
 
 meshHeader,meshVerts,meshFaces = lpm.read_nemoh_mesh(floatMeshPath)
 floatMesh = lpm.Mesh(meshVerts,meshFaces,name=f'float')
@@ -15,6 +27,9 @@ floatMesh = lpm.Mesh(meshVerts,meshFaces,name=f'float')
 meshHeader,meshVerts,meshFaces = lpm.read_nemoh_mesh(sparMeshPath)
 sparMesh = lpm.Mesh(meshVerts,meshFaces,name=f'spar')
 
+meshHeader,meshVerts,meshFaces = lpm.read_nemoh_mesh(hemi360MeshPath)
+hemi360Mesh = lpm.Mesh(meshVerts,meshFaces,name=f'hemi360')
+
 floatBody = lpb.Body(floatMesh)
 sparBody = lpb.Body(sparMesh)
 
@@ -32,4 +47,431 @@ def test_solve_multi_body():
     multiBody = floatBody+sparBody
     problem = RadiationProblem(body=multiBody,radiating_dof='float__Heave',omega=1)
     solver = lps.BEMSolver()
-    result = solver.solve(problem)
\ No newline at end of file
+    result = solver.solve(problem)
+# tests for the matrix engines
+
+def test_rankine_cache_engine():
+    greenFunction = Delhommeau()
+    referenceEngine = lps.BasicMatrixEngine()
+    rankineCacheEngine = lps.BasicMatrixEngine(rankine_cache_size=1)
+    for seaBottom in [-np.infty, -5.0]:
+        for wavenumber in [0.5, 2.0]:
+            S, K = referenceEngine.build_matrices(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, wavenumber, greenFunction)
+            SCached, KCached = rankineCacheEngine.build_matrices(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, wavenumber, greenFunction)
+            assert np.allclose(S, SCached, rtol=1e-12, atol=1e-14)
+            assert np.allclose(K, KCached, rtol=1e-12, atol=1e-14)
+
+def test_green_function_number_of_threads():
+    for seaBottom in [-np.infty, -5.0]:
+        S1, K1 = Delhommeau(n_threads=1).evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+        S4, K4 = Delhommeau(n_threads=4).evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+        assert np.array_equal(S1, S4) and np.array_equal(K1, K4)
+    with pytest.raises(ValueError):
+        Delhommeau(n_threads=0)
+
+def test_green_function_multiple_wavenumbers():
+    greenFunction = Delhommeau()
+    for seaBottom, wavenumbers in [(-np.infty, [0.5, 2.0, 0.0, np.infty]), (-5.0, [0.5, 2.0])]:
+        S, K = greenFunction.evaluate_multiple_wavenumbers(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, wavenumbers)
+        assert S.shape == (len(wavenumbers), hemi360Mesh.nPanels, hemi360Mesh.nPanels)
+        for i, wavenumber in enumerate(wavenumbers):
+            SRef, KRef = greenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, wavenumber)
+            assert np.allclose(S[i], SRef, rtol=1e-12, atol=1e-14)
+            assert np.allclose(K[i], KRef, rtol=1e-12, atol=1e-14)
+        # Same matrices when they are computed by blocks of a single wavenumber.
+        SBlocks, KBlocks = greenFunction.evaluate_multiple_wavenumbers(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, wavenumbers,
+                                                                       memory_budget=1)
+        assert np.array_equal(SBlocks, S) and np.array_equal(KBlocks, K)
+
+def test_green_function_tabulation(tmp_path):
+    greenFunction = Delhommeau(tabulation_cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob('*.npy'))) == 1
+    for loaded, computed in zip(greenFunction.tabulated_integrals, lpt.compute_tabulated_integrals(328, 46, 251)):
+        assert np.array_equal(loaded, computed)
+
+    copiedGreenFunction = pickle.loads(pickle.dumps(greenFunction))
+    assert np.array_equal(copiedGreenFunction.tabulated_integrals[2], greenFunction.tabulated_integrals[2])
+
+    S, K = greenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0)
+    largeGreenFunction = Delhommeau(tabulation_grid_shape=(400, 46), tabulation_cache_dir=str(tmp_path))
+    SLarge, KLarge = largeGreenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0)
+    assert np.allclose(SLarge, S, rtol=1e-4) and np.allclose(KLarge, K, rtol=1e-4)
+
+    # A smaller grid is only a truncation of the default one, which does not reach the asymptotic approximations.
+    rRange, zRange, integrals = lpt.compute_tabulated_integrals(50, 30, 251)
+    assert np.array_equal(rRange, greenFunction.tabulated_integrals[0][:50]) and rRange[-1] < 10.0
+    assert np.array_equal(zRange, greenFunction.tabulated_integrals[1][:30]) and zRange[-1] > -1.0
+    assert np.array_equal(integrals, greenFunction.tabulated_integrals[2][:50, :30])
+    with pytest.raises(ValueError):
+        Delhommeau(tabulation_grid_shape=(50, 30), tabulation_cache_dir=str(tmp_path))
+
+def test_default_engines_are_not_shared():
+    greenFunction = Delhommeau()
+    solver1, solver2 = lps.BEMSolver(green_function=greenFunction), lps.BEMSolver(green_function=greenFunction)
+    assert isinstance(solver1.engine, lps.BasicMatrixEngine) and solver1.engine is not solver2.engine
+
+def test_prony_decomposition(tmp_path):
+    kh = 2.0
+    a, lamda = lppd.load_exponential_decomposition(kh*np.tanh(kh), kh, 'fortran', str(tmp_path))
+    assert len(list(tmp_path.glob('*/*.npy'))) == 1
+    aRef, lamdaRef = lppd.compute_exponential_decomposition(kh*np.tanh(kh), kh, 'fortran')
+    assert np.array_equal(a, aRef) and np.array_equal(lamda, lamdaRef)
+    lppd.load_exponential_decomposition.cache_clear()
+    aLoaded, lamdaLoaded = lppd.load_exponential_decomposition(kh*np.tanh(kh), kh, 'fortran', str(tmp_path))
+    assert np.array_equal(aLoaded, aRef) and np.array_equal(lamdaLoaded, lamdaRef)
+    assert not any(array.flags.writeable for array in (a, lamda, aLoaded, lamdaLoaded))
+
+    # The Python implementation fits the same function (the last exponential is the constant added to both)
+    a, lamda = lppd.compute_exponential_decomposition(kh*np.tanh(kh), kh, 'python')
+    X = np.linspace(0.0, 20.0, 201)
+    F = lppd.ff(X, kh*np.tanh(kh), kh)
+    assert np.abs(np.exp(np.outer(X, lamda[:-1])) @ a[:-1] - F).max() < 0.05
+    S, K = Delhommeau().evaluate(hemi360Mesh, hemi360Mesh, 0.0, -5.0, 1.0)
+    SPython, KPython = Delhommeau(finite_depth_prony_decomposition_method='python').evaluate(hemi360Mesh, hemi360Mesh, 0.0, -5.0, 1.0)
+    assert np.allclose(SPython, S, rtol=1e-2, atol=1e-3) and np.allclose(KPython, K, rtol=1e-2, atol=1e-3)
+    with pytest.raises(ValueError):
+        Delhommeau(finite_depth_prony_decomposition_method='matlab')
+
+def test_rankine_asymptotic_ratio():
+    S, K = Delhommeau().evaluate_rankine_part(hemi360Mesh, hemi360Mesh)
+    SExact, KExact = Delhommeau(rankine_asymptotic_ratio=np.inf).evaluate_rankine_part(hemi360Mesh, hemi360Mesh)
+    assert not np.array_equal(S, SExact) and np.allclose(S, SExact, rtol=1e-3, atol=1e-4)
+    report = Delhommeau().rankine_asymptotic_accuracy(hemi360Mesh, hemi360Mesh, ratios=[3.0, 7.0, 10.0])
+    assert [row['ratio'] for row in report] == [3.0, 7.0, 10.0]
+    assert report[0]['far_field_fraction'] > report[1]['far_field_fraction'] > report[2]['far_field_fraction'] > 0.0
+    assert report[0]['S_error'] > report[1]['S_error'] > report[2]['S_error']
+    assert report[1]['S_error'] < 1e-3 and report[1]['K_error'] < 1e-3
+    with pytest.raises(ValueError):
+        Delhommeau(rankine_asymptotic_ratio=0.0)
+
+def test_green_function_near_field_quadrature():
+    greenFunction = Delhommeau()
+    nearFieldGreenFunction = Delhommeau(near_field_quadrature='gauss_legendre_2')
+    assert len(nearFieldGreenFunction._near_field_pairs(hemi360Mesh.panelCenters, hemi360Mesh)[0]) > 0
+    for seaBottom in [-np.infty, -5.0]:
+        S, K = greenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+        SNear, KNear = nearFieldGreenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+        assert not np.allclose(SNear, S, rtol=1e-8) and np.allclose(SNear, S, rtol=5e-2, atol=1e-3)
+        SMultiple, KMultiple = nearFieldGreenFunction.evaluate_multiple_wavenumbers(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, [1.0])
+        assert np.allclose(SMultiple[0], SNear, rtol=1e-12, atol=1e-14)
+        assert np.allclose(KMultiple[0], KNear, rtol=1e-12, atol=1e-14)
+    with pytest.raises(ValueError):
+        Delhommeau(near_field_quadrature='gauss_legendre_7')
+
+def test_green_function_without_gradient():
+    for greenFunction in [Delhommeau(), Delhommeau(near_field_quadrature='gauss_legendre_2')]:
+        for seaBottom in [-np.infty, -5.0]:
+            for mesh in [hemi360Mesh, floatMesh]:
+                S, K = greenFunction.evaluate(mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+                SOnly, KOnly = greenFunction.evaluate(mesh, hemi360Mesh, 0.0, seaBottom, 1.0, gradient=False)
+                assert KOnly is None and np.array_equal(SOnly, S)
+
+    problem = RadiationProblem(body=floatBody, radiating_dof='Heave', omega=1)
+    for engine in [lps.BasicMatrixEngine(), lps.MatrixFreeEngine()]:
+        solver = lps.BEMSolver(engine=engine)
+        result = solver.solve(problem, keep_details=True)
+        for chunkSize in [50, floatMesh.nPanels]:
+            potential = solver.get_potential_on_mesh(result, floatMesh, chunk_size=chunkSize)
+            assert np.allclose(potential, result.potential, rtol=1e-10)
+
+class FortranCallSpy:
+    """Record the arguments of the calls to the functions of a Fortran module."""
+    def __init__(self, module):
+        self.module = module
+        self.calls = []
+
+    def __getattr__(self, name):
+        function = getattr(self.module, name)
+        def spy(*args, **kwargs):
+            self.calls.append((name, args))
+            return function(*args, **kwargs)
+        return spy
+
+def test_mesh_arrays_passed_to_fortran_without_copy():
+    greenFunction = Delhommeau(near_field_quadrature='gauss_legendre_2')
+    spy = FortranCallSpy(greenFunction.fortran_core.matrices)
+    greenFunction.fortran_core = SimpleNamespace(matrices=spy)
+    for seaBottom in [-np.infty, -5.0]:
+        greenFunction.evaluate(hemi360Mesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+    assert {name for name, args in spy.calls} == {'build_matrices', 'add_near_field_wave_part_correction'}
+
+    meshArrays = [hemi360Mesh.vertices, hemi360Mesh.panels, hemi360Mesh.panelCenters, hemi360Mesh.panelUnitNormals,
+                  hemi360Mesh.panelAreas, hemi360Mesh.panelRadii, *hemi360Mesh.quadraturePoints]
+    for name, args in spy.calls:
+        arrays = [arg for arg in args if isinstance(arg, np.ndarray)]
+        # f2py only copies the arrays that are not Fortran-contiguous or not of the expected type
+        assert all(array.flags.f_contiguous and array.dtype in (np.float64, np.int32, np.complex128) for array in arrays)
+        if name == 'build_matrices':
+            assert all(any(arg is array for arg in arrays) for array in meshArrays)
+    assert not hemi360Mesh.vertices.flags.writeable and not hemi360Mesh.panelCenters.flags.writeable
+
+def test_field_at_points():
+    for greenFunction in [Delhommeau(), Delhommeau(near_field_quadrature='gauss_legendre_2')]:
+        for seaBottom in [-np.infty, -5.0]:
+            S, K = greenFunction.evaluate(floatMesh, hemi360Mesh, 0.0, seaBottom, 1.0)
+            SPoints, VPoints = greenFunction.evaluate_at_points(floatMesh.panelCenters, hemi360Mesh, 0.0, seaBottom, 1.0, gradient=True)
+            assert np.allclose(SPoints, S, rtol=1e-12, atol=1e-14)
+            assert np.allclose(np.einsum('ijk,ik->ij', VPoints, floatMesh.panelUnitNormals), K, rtol=1e-12, atol=1e-14)
+
+    problem = RadiationProblem(body=floatBody, radiating_dof='Heave', omega=1)
+    solver = lps.BEMSolver()
+    result = solver.solve(problem, keep_details=True)
+    potential, velocity = solver.get_field_at_points(result, floatMesh.panelCenters, chunk_size=100)
+    assert velocity is None and np.allclose(potential, result.potential, rtol=1e-10)
+
+    points = np.random.default_rng(0).uniform([-30.0, -30.0, -20.0], [30.0, 30.0, -1.0], size=(300, 3))
+    potential, velocity = solver.get_field_at_points(result, points, velocity=True, memory_budget=2**20)
+    assert velocity.shape == (300, 3)
+    for kwargs in [dict(n_workers=2), dict(n_workers=2, use_processes=True)]:
+        parallelPotential, parallelVelocity = solver.get_field_at_points(result, points, velocity=True, chunk_size=64, **kwargs)
+        assert np.allclose(parallelPotential, potential, rtol=1e-12) and np.allclose(parallelVelocity, velocity, rtol=1e-12)
+    assert np.allclose(solver.get_pressure_at_points(result, points), 1j*problem.omega*problem.rho*potential)
+
+    with pytest.raises(Exception):
+        solver.get_field_at_points(solver.solve(problem, keep_details=False), points)
+
+def test_adaptive_cross_approximation():
+    rng = np.random.default_rng(0)
+    points1 = rng.uniform(size=(60, 3))
+    points2 = rng.uniform(size=(40, 3)) + np.array([5.0, 0.0, 0.0])
+    A = 1/np.linalg.norm(points1[:, None, :] - points2[None, :, :], axis=2)
+    lowRank = lphm.adaptive_cross_approximation(lambda i: A[i, :], lambda j: A[:, j], A.shape, tolerance=1e-6)
+    assert lowRank.rank < 20
+    assert np.linalg.norm(lowRank.full_matrix() - A) < 1e-5*np.linalg.norm(A)
+
+def test_hierarchical_matrix_engine():
+    greenFunction = Delhommeau()
+    S, K = lps.BasicMatrixEngine().build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    engine = lps.HierarchicalMatrixEngine(tolerance=1e-4, admissibility=1.0, leaf_size=16)
+    HS, HK = engine.build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert HS.nb_low_rank_blocks > 0 and HS.compression_rate < 1.0
+    assert np.linalg.norm(HS.full_matrix() - S) < 1e-3*np.linalg.norm(S)
+    assert np.linalg.norm(HK.full_matrix() - K) < 1e-3*np.linalg.norm(K)
+
+    x = np.linspace(0.0, 1.0, hemi360Mesh.nPanels)
+    assert np.allclose(HK @ x, K @ x, rtol=1e-3)
+    assert np.allclose(lpl.solve_gmres(HK, x), lpl.solve_gmres(K, x), rtol=1e-3, atol=1e-4)
+
+    HS32, HK32 = engine.build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0,
+                                       Delhommeau(floating_point_precision='float32'))
+    assert HS32.dtype == HK32.dtype == np.complex64
+    assert HS32.compression_rate == pytest.approx(HS.compression_rate, rel=0.1)
+
+def test_matrix_free_engine():
+    greenFunction = Delhommeau()
+    S, K = lps.BasicMatrixEngine().build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    MS, MK = lps.MatrixFreeEngine(block_size=32).build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    x = np.linspace(0.0, 1.0, hemi360Mesh.nPanels)
+    X = np.stack([x, x**2], axis=1)
+    assert np.allclose(MK @ x, K @ x, rtol=1e-12, atol=1e-14)
+    assert np.allclose(MS @ X, S @ X, rtol=1e-12, atol=1e-14)
+    assert 0 < MK.tiled_matrices.nbytes < S.nbytes + K.nbytes
+    nbTiles = MK.tiled_matrices.nb_evaluated_tiles
+    MK @ x  # Only the tiles of the far field are computed again
+    assert MK.tiled_matrices.nb_evaluated_tiles - nbTiles == MK.tiled_matrices.nb_tiles - len(MK.tiled_matrices.near_field)
+
+    problem = RadiationProblem(body=floatBody, radiating_dof='Heave', omega=1)
+    result = lps.BEMSolver(engine=lps.MatrixFreeEngine()).solve(problem)
+    referenceResult = lps.BEMSolver().solve(problem)
+    assert np.allclose(result.added_masses['Heave'], referenceResult.added_masses['Heave'], rtol=1e-4)
+    with pytest.raises(ValueError):
+        lps.MatrixFreeEngine(linear_solver='lu')
+
+def test_out_of_core_engine(tmp_path):
+    greenFunction = Delhommeau()
+    S, K = lps.BasicMatrixEngine().build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    engine = lps.BasicMatrixEngine(out_of_core_dir=str(tmp_path), out_of_core_chunk_size=100)
+    MS, MK = engine.build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert isinstance(MS, np.memmap) and isinstance(MK, np.memmap)
+    assert np.allclose(MS, S, rtol=1e-12, atol=1e-14) and np.allclose(MK, K, rtol=1e-12, atol=1e-14)
+
+    problem = RadiationProblem(body=floatBody, radiating_dof='Heave', omega=1)
+    result = lps.BEMSolver(engine=lps.BasicMatrixEngine(out_of_core_dir=str(tmp_path))).solve(problem)
+    referenceResult = lps.BEMSolver().solve(problem)
+    assert np.isclose(result.added_masses['Heave'], referenceResult.added_masses['Heave'], rtol=1e-10)
+    with pytest.raises(ValueError):
+        lps.BasicMatrixEngine(out_of_core_dir=str(tmp_path), rankine_cache_size=1)
+
+def test_reflection_symmetric_engine():
+    greenFunction = Delhommeau()
+    symmetricMesh = lpm.detect_reflection_symmetries(hemi360Mesh)
+    fullMesh = lpm.Mesh(symmetricMesh.vertices, symmetricMesh.panels, name=f'hemi360_full')
+    S, K = lps.BasicMatrixEngine().build_matrices(fullMesh, fullMesh, 0.0, -np.infty, 1.0, greenFunction)
+    SSym, KSym = lps.BasicMatrixEngine().build_matrices(symmetricMesh, symmetricMesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert isinstance(KSym, BlockSymmetricToeplitzMatrix)
+    assert np.allclose(SSym.full_matrix(), S)
+    assert np.allclose(KSym.full_matrix(), K)
+
+    b = np.linspace(0.0, 1.0, fullMesh.nPanels) + 0j
+    x = np.linalg.solve(K, b)
+    assert np.allclose(KSym @ x, b)
+    assert np.allclose(lpl.solve_directly(KSym, b), x)
+    assert np.allclose(lpl.LUSolverWithCache().solve(KSym, np.stack([b, 2*b], axis=1)), np.stack([x, 2*x], axis=1))
+    assert np.allclose(lpl.solve_gmres(KSym, b), x, atol=1e-5)
+
+def test_axial_symmetric_engine():
+    greenFunction = Delhommeau()
+    symmetricMesh = lpm.detect_axial_symmetry(hemi360Mesh)
+    fullMesh = lpm.Mesh(symmetricMesh.vertices, symmetricMesh.panels, name=f'hemi360_full')
+    S, K = lps.BasicMatrixEngine().build_matrices(fullMesh, fullMesh, 0.0, -np.infty, 1.0, greenFunction)
+    SSym, KSym = lps.BasicMatrixEngine().build_matrices(symmetricMesh, symmetricMesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert isinstance(KSym, BlockCirculantMatrix) and KSym.nb_blocks == (36, 36)
+    assert np.allclose(SSym.full_matrix(), S)
+    assert np.allclose(KSym.full_matrix(), K)
+
+    b = np.linspace(0.0, 1.0, fullMesh.nPanels) + 0j
+    x = np.linalg.solve(K, b)
+    assert np.allclose(KSym @ x, b)
+    assert np.allclose(lpl.solve_directly(KSym, b), x)
+    assert np.allclose(lpl.LUSolverWithCache().solve(KSym, np.stack([b, 2*b], axis=1)), np.stack([x, 2*x], axis=1))
+    assert np.allclose(lpl.solve_gmres(KSym, b), x, atol=1e-5)
+
+def test_block_diagonal_preconditioner():
+    hemiBodies = []
+    for i in range(3):
+        hemiBody = lpb.Body(lpm.Mesh(np.asarray(hemi360Mesh.vertices) + np.array([3.0*i, 0.0, 0.0]), hemi360Mesh.panels, name=f'hemi{i}'))
+        hemiBody.add_translation_dof(name='Heave')
+        hemiBodies.append(hemiBody)
+    farm = lpb.Body.join_bodies(*hemiBodies)
+    problem = RadiationProblem(body=farm,radiating_dof='hemi0__Heave',omega=2.0)
+
+    engine = lps.BasicMatrixEngine(preconditioner='block_diagonal')
+    preconditionedResult = lps.BEMSolver(engine=engine).solve(problem)
+    S, K = engine.build_matrices(farm.mesh, farm.mesh, 0.0, -np.infty, problem.wavenumber, Delhommeau())
+    nbIterations = []
+    sources = lpl.solve_gmres(K, problem.boundary_condition, nb_iterations=nbIterations)
+    assert len(engine._preconditioned_solver.nb_iterations) == 1
+    assert engine._preconditioned_solver.nb_iterations[0] <= nbIterations[0]
+    assert np.allclose(preconditionedResult.sources, sources, rtol=1e-4, atol=1e-6)
+
+    preconditioner = lpl.BlockDiagonalPreconditioner(K, [360, 360, 360])
+    assert np.allclose(K[:360, :360] @ (preconditioner @ problem.boundary_condition)[:360], problem.boundary_condition[:360])
+
+def test_block_gmres():
+    S, K = lps.BasicMatrixEngine().build_matrices(hemi360Mesh, hemi360Mesh, 0.0, -np.infty, 1.0, Delhommeau())
+    B = np.stack([np.ones(hemi360Mesh.nPanels), hemi360Mesh.panelCenters[:, 0], hemi360Mesh.panelCenters[:, 2],
+                  2*hemi360Mesh.panelCenters[:, 2]], axis=1)  # The last right-hand side is not independent.
+    X = np.linalg.solve(K, B)
+    nbIterations = []
+    assert np.allclose(lpl.solve_gmres(K, B, nb_iterations=nbIterations), X, rtol=1e-4, atol=1e-5)
+    assert len(nbIterations) == 4 and nbIterations[0] < 20
+    assert np.allclose(lpl.solve_gmres(K.astype(np.complex64), B), X, rtol=1e-4, atol=1e-5)
+    preconditioner = lpl.BlockDiagonalPreconditioner(K, [180, 180])
+    assert np.allclose(lpl.solve_gmres(K, B, preconditioner=preconditioner), X, rtol=1e-4, atol=1e-5)
+
+def test_disk_matrix_cache(tmp_path):
+    greenFunction = Delhommeau()
+    S, K = lps.BasicMatrixEngine().build_matrices(floatMesh, floatMesh, 0.0, -np.infty, 1.0, greenFunction)
+
+    lps.BasicMatrixEngine(disk_cache=str(tmp_path)).build_matrices(floatMesh, floatMesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    # A new engine and a new (but identical) mesh reload the stored matrices
+    reloadedMesh = lpm.Mesh(floatMesh.vertices, floatMesh.panels, name=f'float_copy')
+    SCached, KCached = lps.BasicMatrixEngine(disk_cache=str(tmp_path)).build_matrices(reloadedMesh, reloadedMesh, 0.0, -np.infty, 1.0, greenFunction)
+    assert isinstance(SCached, np.memmap)
+    assert np.array_equal(S, SCached)
+    assert np.array_equal(K, KCached)
+
+    # The least recently used matrices are deleted when the cache is full
+    smallCache = lpms.DiskMatrixCache(tmp_path, max_size=S.nbytes + K.nbytes)
+    lps.BasicMatrixEngine(disk_cache=smallCache).build_matrices(floatMesh, floatMesh, 0.0, -np.infty, 2.0, greenFunction)
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+    assert smallCache.load(smallCache.key(floatMesh, floatMesh, 0.0, -np.infty, 1.0, greenFunction)) is None
+    assert smallCache.load(smallCache.key(floatMesh, floatMesh, 0.0, -np.infty, 2.0, greenFunction)) is not None
+
+def test_solve_all_batched_right_hand_sides():
+    hemiBody = lpb.Body(hemi360Mesh)
+    hemiBody.add_all_rigid_body_dofs()
+    problems = [RadiationProblem(body=hemiBody,radiating_dof=dof,omega=omega) for dof in hemiBody.dofs for omega in [1.0, 2.0]]
+    problems += [DiffractionProblem(body=hemiBody,wave_direction=direction,omega=omega) for direction in [0.0, 0.5] for omega in [1.0, 2.0]]
+    solver = lps.BEMSolver(engine=lps.BasicMatrixEngine(linear_solver='direct'))
+    batchedResults = solver.solve_all(problems)
+    singleResults = solver.solve_all(problems, batch_rhs=False)
+    assert len(batchedResults) == len(problems)
+    for batched, single in zip(batchedResults, singleResults):
+        assert batched.problem == single.problem
+        assert np.allclose(batched.sources, single.sources)
+        assert np.allclose(batched.potential, single.potential)
+
+def test_solve_all_multiple_wavenumbers(monkeypatch):
+    hemiBody = lpb.Body(hemi360Mesh)
+    hemiBody.add_all_rigid_body_dofs()
+    problems = [RadiationProblem(body=hemiBody,radiating_dof=dof,omega=omega,sea_bottom=seaBottom)
+                for dof in ['Heave', 'Surge'] for omega in [0.5, 1.0, 2.0] for seaBottom in [-np.infty, -5.0]]
+    referenceResults = lps.BEMSolver(engine=lps.BasicMatrixEngine(linear_solver='direct')).solve_all(problems)
+
+    # The matrices of 2 wavenumbers fit in the memory budget: 2 blocks of wavenumbers for each depth.
+    greenFunction = Delhommeau()
+    engine = lps.BasicMatrixEngine(linear_solver='direct', multiple_wavenumbers_memory_budget=2**23)
+    nbBlocks = []
+    evaluate_wavenumber_blocks = greenFunction.evaluate_wavenumber_blocks
+    def counted_blocks(*args):
+        for block in evaluate_wavenumber_blocks(*args):
+            nbBlocks.append(len(block[0]))
+            yield block
+    monkeypatch.setattr(greenFunction, 'evaluate_wavenumber_blocks', counted_blocks)
+    monkeypatch.setattr(greenFunction, 'evaluate', None)  # Never called
+    results = lps.BEMSolver(green_function=greenFunction, engine=engine).solve_all(problems)
+    assert nbBlocks == [2, 1, 2, 1]
+    for result, referenceResult in zip(results, referenceResults):
+        assert result.problem == referenceResult.problem
+        assert np.allclose(result.sources, referenceResult.sources, rtol=1e-10, atol=1e-12)
+    with pytest.raises(ValueError):
+        lps.BasicMatrixEngine(rankine_cache_size=1, multiple_wavenumbers_memory_budget=2**23)
+
+def test_lu_solver_with_cache():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(50, 50)) + 1j*rng.normal(size=(50, 50)) + 50*np.eye(50)
+    b = rng.normal(size=(50, 3)) + 0j
+    luSolver = lpl.LUSolverWithCache()
+    x1 = luSolver.solve(A, b[:, 0])
+    decomposition = luSolver.lu_decomp(A)
+    x = luSolver.solve(A, b)
+    assert luSolver.lu_decomp(A) is decomposition
+    assert np.allclose(x1, x[:, 0])
+    assert np.allclose(A @ x, b)
+    del A
+    assert len(luSolver._cache) == 0
+
+def test_single_precision_solvers():
+    rng = np.random.default_rng(0)
+    A = (rng.normal(size=(60, 60)) + 1j*rng.normal(size=(60, 60)) + 30*np.eye(60)).astype(np.complex64)
+    b = rng.normal(size=(60, 2)) + 0j
+    x = np.linalg.solve(A.astype(np.complex128), b)
+    assert np.allclose(lpl.solve_directly(A, b), x, rtol=1e-10, atol=1e-12)
+    assert np.allclose(lpl.LUSolverWithCache().solve(A, b[:, 0]), x[:, 0], rtol=1e-10, atol=1e-12)
+    assert np.allclose(lpl.double_precision_matvec(A, x), b)
+
+def test_solve_in_single_precision():
+    problem = RadiationProblem(body=floatBody,radiating_dof='Heave',omega=1)
+    doubleSolver = lps.BEMSolver(engine=lps.BasicMatrixEngine(linear_solver='lu'))
+    singleSolver = lps.BEMSolver(green_function=Delhommeau(floating_point_precision='float32'),
+                                 engine=lps.BasicMatrixEngine(linear_solver='lu'))
+    S, K = singleSolver.engine.build_matrices(floatMesh, floatMesh, 0.0, -np.infty, problem.wavenumber, singleSolver.green_function)
+    assert S.dtype == np.complex64 and K.dtype == np.complex64
+    doubleResult = doubleSolver.solve(problem)
+    singleResult = singleSolver.solve(problem)
+    assert np.isclose(singleResult.added_masses['Heave'], doubleResult.added_masses['Heave'], rtol=1e-5)
+    assert np.isclose(singleResult.radiation_dampings['Heave'], doubleResult.radiation_dampings['Heave'], rtol=1e-5)
+
+def test_solve_with_lu_solver():
+    problem = RadiationProblem(body=floatBody,radiating_dof='Heave',omega=1)
+    gmresResult = lps.BEMSolver().solve(problem)
+    luResult = lps.BEMSolver(engine=lps.BasicMatrixEngine(linear_solver='lu')).solve(problem)
+    assert np.isclose(luResult.added_masses['Heave'], gmresResult.added_masses['Heave'], rtol=1e-4)
+    assert np.isclose(luResult.radiation_dampings['Heave'], gmresResult.radiation_dampings['Heave'], rtol=1e-4)
+
+def test_solve_all_in_parallel():
+    hemiBody = lpb.Body(hemi360Mesh)
+    hemiBody.add_translation_dof(name='Heave')
+    problems = [RadiationProblem(body=hemiBody,radiating_dof='Heave',omega=omega) for omega in [0.5, 1.0, 1.5, 2.0]]
+    problems += [DiffractionProblem(body=hemiBody,omega=omega) for omega in [0.5, 1.0, 1.5, 2.0]]
+    solver = lps.BEMSolver(engine=lps.BasicMatrixEngine(linear_solver='lu'))
+    serialResults = solver.solve_all(problems)
+    parallelResults = solver.solve_all(problems, n_workers=2, n_threads_per_worker=1)
+    assert len(parallelResults) == len(problems)
+    for serial, parallel in zip(serialResults, parallelResults):
+        assert parallel.problem == serial.problem
+        assert parallel.body is hemiBody
+        assert np.allclose(parallel.sources, serial.sources)